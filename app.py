@@ -1,10 +1,38 @@
-import os, sys, zipfile, shutil, uuid, re, threading, subprocess, json, gc
-import fitz
-import pandas as pd
-from flask import Flask, request, render_template_string, send_file, jsonify
-from rapidfuzz import fuzz
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment
+import os, sys, zipfile, shutil, uuid, re, threading, subprocess, json, gc, io, csv, socket
+import logging
+from abc import ABC, abstractmethod
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from contextlib import contextmanager, nullcontext
+import time, select, atexit, struct, hashlib, sqlite3, importlib, importlib.util, zlib, fcntl
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, render_template_string, send_file, jsonify, Response
+
+logger = logging.getLogger("audit")
+
+
+class LazyModule:
+    """
+    Stand-in for a heavy module that is imported on first attribute access,
+    so starting the web server does not pay for PDF, dataframe, fuzzy
+    matching and Excel libraries until an audit needs them. Attributes are
+    cached on the proxy, so hot loops see plain attribute lookups.
+    """
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        self.__dict__[attr] = value
+        return value
+
+
+fitz    = LazyModule("fitz")
+pd      = LazyModule("pandas")
+np      = LazyModule("numpy")
+fuzz    = LazyModule("rapidfuzz.fuzz")
+process = LazyModule("rapidfuzz.process")
 
 app = Flask(__name__)
 UPLOAD_FOLDER = "/tmp/uploads"
@@ -15,44 +43,674 @@ os.makedirs(REPORT_FOLDER, exist_ok=True)
 ALLOWED_BILL_EXT = {".jpg", ".jpeg", ".png", ".pdf"}
 IGNORE_FOLDERS = {"payment screenshots","payments","misc","receipts",
                   "__macosx",".ds_store","payment"}
-jobs = {}
+MAX_ZIP_ENTRY_MB = int(os.environ.get("MAX_ZIP_ENTRY_MB", 100))
+PDF_TEXT_MIN_CHARS = int(os.environ.get("PDF_TEXT_MIN_CHARS", 40))
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+# Process-local counters and histograms, rendered in the Prometheus text
+# format. Every process flushes a snapshot to the job store every
+# METRICS_FLUSH_SECS and /metrics serves the sum over all processes, so a
+# scrape sees the whole gunicorn deployment whichever worker answers it.
+METRICS_FLUSH_SECS = int(os.environ.get("METRICS_FLUSH_SECS", 5))
+
+
+class Metrics:
+    """Labelled counters and histograms, safe to update from any thread."""
+
+    def __init__(self):
+        self._lock   = threading.Lock()
+        self._meta   = {}        # name -> (kind, help, buckets)
+        self._values = {}        # (name, labels) -> float | [bucket counts, sum, count]
+
+    def counter(self, name, help_):
+        self._meta[name] = ("counter", help_, None)
+
+    def histogram(self, name, help_, buckets):
+        self._meta[name] = ("histogram", help_, tuple(buckets))
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = self._meta[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._values.get(key)
+            if h is None:
+                h = self._values[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    h[0][i] += 1
+            h[1] += value
+            h[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [[name, dict(labels), json.loads(json.dumps(v))]
+                    for (name, labels), v in self._values.items()]
+
+    def render(self, snapshots):
+        """Prometheus text for the sum of several snapshot() results."""
+        merged = {}
+        for snap in snapshots:
+            for name, labels, v in snap:
+                key = (name, tuple(sorted(labels.items())))
+                if key not in merged:
+                    merged[key] = v
+                elif isinstance(v, list):
+                    m = merged[key]
+                    m[0] = [a + b for a, b in zip(m[0], v[0])]
+                    m[1] += v[1]
+                    m[2] += v[2]
+                else:
+                    merged[key] += v
+
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        out = []
+        for name, (kind, help_, buckets) in self._meta.items():
+            out += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+            for (n, labels), v in sorted(merged.items()):
+                if n != name:
+                    continue
+                if kind == "counter":
+                    out.append(f"{name}{fmt(labels)} {v}")
+                    continue
+                for bound, count in zip(buckets, v[0]):
+                    out.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {count}")
+                out.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {v[2]}")
+                out.append(f"{name}_sum{fmt(labels)} {v[1]}")
+                out.append(f"{name}_count{fmt(labels)} {v[2]}")
+        return "\n".join(out) + "\n"
+
+
+metrics = Metrics()
+metrics.histogram("audit_stage_seconds", "Time spent per audit stage",
+                  (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800))
+metrics.counter("audit_jobs_total", "Finished audit jobs by outcome")
+metrics.counter("audit_input_bytes_total", "Bytes of uploaded bill archives processed")
+metrics.histogram("ocr_image_seconds", "OCR wall time per image or PDF page",
+                  (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+metrics.histogram("ocr_worker_rss_mb", "OCR worker RSS after each image",
+                  (50, 100, 150, 200, 300, 400, 600))
+metrics.counter("ocr_bytes_total", "Image bytes sent to OCR")
+metrics.counter("ocr_errors_total", "OCR calls that failed or timed out")
+metrics.counter("ocr_cache_total", "OCR lookups by result (hit, miss, text_layer)")
+metrics.counter("ocr_duplicates_total", "Images whose OCR was skipped as near-duplicates")
+metrics.counter("upload_chunks_total", "Chunked-upload chunks by result (written, duplicate)")
+metrics.counter("upload_bytes_total", "Bytes written by chunked uploads")
+metrics.counter("result_exports_total", "Result downloads by format")
+
+
+class JobTimings:
+    """
+    Per-job stage durations in seconds. Pipelined stages are timed with
+    iterate(), which charges only the time spent producing items to the
+    stage, so overlapping stages are not double counted.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, secs):
+        self.stages[name] = self.stages.get(name, 0.0) + secs
+
+    @contextmanager
+    def stage(self, name):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t)
+
+    def iterate(self, name, items):
+        items = iter(items)
+        while True:
+            t = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                self.add(name, time.perf_counter() - t)
+                return
+            self.add(name, time.perf_counter() - t)
+            yield item
+
+    def finish(self):
+        """Record into audit_stage_seconds; returns {stage: seconds}."""
+        for name, secs in self.stages.items():
+            metrics.observe("audit_stage_seconds", secs, stage=name)
+        return {name: round(secs, 3) for name, secs in self.stages.items()}
+
+# ── OCR worker pool ───────────────────────────────────────────────────────────
+# Workers are long-lived child processes: cv2/numpy/pytesseract are imported
+# once per worker, images arrive one JSON line at a time over stdin. A worker
+# is recycled after OCR_WORKER_MAX_TASKS images or once its RSS passes
+# OCR_WORKER_MAX_RSS_MB, so leaked image memory is still returned to the OS.
+OCR_TIMEOUT           = int(os.environ.get("OCR_TIMEOUT", 90))
+OCR_WORKER_MAX_TASKS  = int(os.environ.get("OCR_WORKER_MAX_TASKS", 50))
+OCR_WORKER_MAX_RSS_MB = int(os.environ.get("OCR_WORKER_MAX_RSS_MB", 300))
+
+# Parallel OCR: concurrency is capped by CPU count and by a memory budget.
+# Each task is charged a fixed per-worker overhead plus a per-pixel cost
+# (colour image, grey/sharpened/threshold copies and Tesseract's own copy).
+# Both limits are for the whole host: every gunicorn worker runs its own
+# pool, so each gets a 1/WEB_CONCURRENCY share (see gunicorn.conf.py).
+WEB_CONCURRENCY       = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+OCR_MAX_WORKERS       = max(1, int(os.environ.get("OCR_MAX_WORKERS", os.cpu_count() or 1))
+                            // WEB_CONCURRENCY)
+OCR_MEMORY_BUDGET_MB  = int(os.environ.get("OCR_MEMORY_BUDGET_MB", 380)) // WEB_CONCURRENCY
+OCR_TASK_BASE_MB      = 80
+OCR_BYTES_PER_PIXEL   = 12
+OCR_DEFAULT_PIXELS    = 12_000_000   # assume a 12 MP phone photo if unknown
+
+# Persistent OCR result cache, keyed by image content + OCR pipeline version.
+OCR_CACHE_DIR         = os.environ.get("OCR_CACHE_DIR", "/tmp/ocr_cache")
+OCR_CACHE_MAX_MB      = int(os.environ.get("OCR_CACHE_MAX_MB", 200))   # 0 disables
+TESSERACT_CONFIG      = os.environ.get("TESSERACT_CONFIG", "--psm 6 --oem 1")
+
+# Adaptive OCR: the threshold pass only runs when the colour pass looks weak,
+# and very large photos are shrunk to roughly OCR_TARGET_DPI on an A4 width.
+OCR_MIN_CONFIDENCE    = float(os.environ.get("OCR_MIN_CONFIDENCE", 75))
+OCR_MIN_CHARS         = int(os.environ.get("OCR_MIN_CHARS", 80))
+OCR_MAX_PIXELS        = int(os.environ.get("OCR_MAX_PIXELS", 8_000_000))
+OCR_TARGET_DPI        = int(os.environ.get("OCR_TARGET_DPI", 300))
+
+# OCR engine used inside the workers:
+#   pytesseract - runs the tesseract CLI per pass (default, always available)
+#   tesserocr   - keeps one initialised Tesseract API per worker, no temp files
+#   auto        - tesserocr when installed, else pytesseract
+OCR_BACKEND           = os.environ.get("OCR_BACKEND", "pytesseract").lower()
+# Asked for explicitly but not installed: get_ocr_pool() warns once per process
+TESSEROCR_MISSING     = (OCR_BACKEND == "tesserocr"
+                         and importlib.util.find_spec("tesserocr") is None)
+if OCR_BACKEND in ("auto", "tesserocr"):
+    OCR_BACKEND = "tesserocr" if importlib.util.find_spec("tesserocr") else "pytesseract"
+
+# Near-duplicate bill photos. A worker computes a 64-bit dHash and a
+# DEDUP_THUMB_WIDTH greyscale thumbnail per image before OCR. Images within
+# DEDUP_MAX_DISTANCE bits of an earlier one are only candidates: bills from
+# one vendor template hash alike, so a candidate counts as a duplicate only
+# if the aligned thumbnails differ by at most DEDUP_MAX_DIFF grey levels in
+# every 16px block (bill numbers and amounts must match). Duplicates reuse
+# the original's text instead of being OCR'd. DEDUP_MAX_DISTANCE=0 disables.
+DEDUP_MAX_DISTANCE    = int(os.environ.get("DEDUP_MAX_DISTANCE", 8))
+DEDUP_MAX_DIFF        = float(os.environ.get("DEDUP_MAX_DIFF", 8))
+DEDUP_MAX_CANDIDATES  = int(os.environ.get("DEDUP_MAX_CANDIDATES", 8))
+DEDUP_THUMB_WIDTH     = 600
+
+# Everything that changes OCR output; passed to workers and part of the
+# OCR cache fingerprint.
+OCR_WORKER_ENV = {
+    "OCR_BACKEND":        OCR_BACKEND,
+    "TESSERACT_CONFIG":   TESSERACT_CONFIG,
+    "OCR_MIN_CONFIDENCE": str(OCR_MIN_CONFIDENCE),
+    "OCR_MIN_CHARS":      str(OCR_MIN_CHARS),
+    "OCR_MAX_PIXELS":     str(OCR_MAX_PIXELS),
+    "OCR_TARGET_DPI":     str(OCR_TARGET_DPI),
+}
 
-# ── OCR worker script written to disk once at startup ─────────────────────────
 WORKER_PATH = "/tmp/ocr_worker.py"
 WORKER_CODE = r'''
-import sys, cv2, pytesseract, re, json, gc
+import os, sys, cv2, re, json, gc, time
 import numpy as np
 
+# Keep the protocol channel private: anything a library prints goes to stderr.
+out = os.fdopen(os.dup(1), "w")
+os.dup2(2, 1)
+
 def normalize(text):
     text = re.sub(r"[^a-z0-9\s]", " ", str(text).lower())
     return re.sub(r"\s+", " ", text).strip()
 
-img_path = sys.argv[1]
-img = cv2.imread(img_path)
-if img is None:
-    print(json.dumps({"text": ""}))
-    sys.exit(0)
-
 kern = np.array([[0,-1,0],[-1,5,-1],[0,-1,0]])
+config     = os.environ["TESSERACT_CONFIG"]
+min_conf   = float(os.environ["OCR_MIN_CONFIDENCE"])
+min_chars  = int(os.environ["OCR_MIN_CHARS"])
+max_pixels = int(os.environ["OCR_MAX_PIXELS"])
+max_width  = int(int(os.environ["OCR_TARGET_DPI"]) * 8.27)   # A4 width in inches
+
+
+class PytesseractBackend:
+    """tesseract CLI via pytesseract: a temp PNG and a process per call."""
+    name = "pytesseract"
+
+    def __init__(self):
+        import pytesseract
+        self.pt = pytesseract
+
+    def words(self, img):
+        data = self.pt.image_to_data(img, config=config,
+                                     output_type=self.pt.Output.DICT)
+        confs = [float(c) for c, w in zip(data["conf"], data["text"])
+                 if float(c) >= 0 and w.strip()]
+        return " ".join(data["text"]), confs
+
+    def text(self, img):
+        return self.pt.image_to_string(img, config=config)
+
+
+class TesserocrBackend:
+    """
+    In-process Tesseract API kept open for the worker's lifetime: the
+    traineddata is loaded once and pixels are passed straight from NumPy.
+    """
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr
+        psm = re.search(r"--psm\s+(\d+)", config)
+        oem = re.search(r"--oem\s+(\d+)", config)
+        self.api = tesserocr.PyTessBaseAPI(
+            lang="eng",
+            psm=int(psm.group(1)) if psm else tesserocr.PSM.AUTO,
+            oem=int(oem.group(1)) if oem else tesserocr.OEM.DEFAULT)
+
+    def _set(self, img):
+        h, w = img.shape[:2]
+        if img.ndim == 2:
+            self.api.SetImageBytes(img.tobytes(), w, h, 1, w)
+        else:
+            rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            self.api.SetImageBytes(rgb.tobytes(), w, h, 3, 3 * w)
+
+    def words(self, img):
+        self._set(img)
+        text = self.api.GetUTF8Text()
+        return text, [float(c) for c in self.api.AllWordConfidences()]
+
+    def text(self, img):
+        self._set(img)
+        return self.api.GetUTF8Text()
 
-# Pass 1 - raw colour (fast, good for clean digital bills)
-t1 = pytesseract.image_to_string(img, config="--psm 6 --oem 1")
 
-# Pass 2 - adaptive threshold on original size (good for photographed bills)
-gray  = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-sharp = cv2.filter2D(gray, -1, kern)
-ada   = cv2.adaptiveThreshold(sharp, 255,
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10)
-t2 = pytesseract.image_to_string(ada, config="--psm 6 --oem 1")
+backend = {"pytesseract": PytesseractBackend,
+           "tesserocr":   TesserocrBackend}[os.environ["OCR_BACKEND"]]()
 
-del img, gray, sharp, ada
-gc.collect()
+def ocr(img):
+    passes = []
+    h, w = img.shape[:2]
+    if h * w > max_pixels and w > max_width:
+        t = time.perf_counter()
+        scale = max_width / w
+        img = cv2.resize(img, (max_width, int(h * scale)), interpolation=cv2.INTER_AREA)
+        passes.append({"pass": "downscale", "secs": time.perf_counter() - t,
+                       "scale": round(scale, 3)})
+
+    # Pass 1 - raw colour (fast, good for clean digital bills)
+    t = time.perf_counter()
+    raw, confs = backend.words(img)
+    t1    = normalize(raw)
+    conf  = sum(confs) / len(confs) if confs else 0.0
+    passes.append({"pass": "colour", "secs": time.perf_counter() - t,
+                   "conf": round(conf, 1), "chars": len(t1)})
+    if conf >= min_conf and len(t1) >= min_chars:
+        return t1, passes
+
+    # Pass 2 - adaptive threshold (good for photographed bills); only when
+    # pass 1 was low-confidence or too short
+    t = time.perf_counter()
+    gray  = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    sharp = cv2.filter2D(gray, -1, kern)
+    ada   = cv2.adaptiveThreshold(sharp, 255,
+                cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 10)
+    t2 = normalize(backend.text(ada))
+    passes.append({"pass": "threshold", "secs": time.perf_counter() - t,
+                   "chars": len(t2)})
+
+    del gray, sharp, ada
+    return t1 + " " + t2, passes
+
+def dhash(img, thumb_path, thumb_width):
+    """
+    64-bit difference hash of a grey 9x8 thumbnail, as a hex string; also
+    saves a `thumb_width` wide greyscale thumbnail for compare().
+    """
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    h = max(1, round(img.shape[0] * thumb_width / img.shape[1]))
+    cv2.imwrite(thumb_path, cv2.resize(img, (thumb_width, h), interpolation=cv2.INTER_AREA))
+    return format(int("".join("1" if b else "0" for b in bits), 2), "016x")
+
+def compare(path_a, path_b, block=16):
+    """
+    Largest mean grey-level difference over block x block tiles after
+    aligning the two thumbnails by phase correlation; 255 when their
+    aspect ratios differ.
+    """
+    a = cv2.imread(path_a, cv2.IMREAD_GRAYSCALE)
+    b = cv2.imread(path_b, cv2.IMREAD_GRAYSCALE)
+    if a is None or b is None or abs(a.shape[0] - b.shape[0]) > a.shape[0] * 0.02:
+        return 255.0
+    h = min(a.shape[0], b.shape[0])
+    a, b = a[:h].astype(np.float32), b[:h].astype(np.float32)
+    (dx, dy), _ = cv2.phaseCorrelate(a, b)
+    a = cv2.warpAffine(a, np.float32([[1, 0, dx], [0, 1, dy]]), (a.shape[1], h),
+                       borderValue=255)
+    diff = np.abs(cv2.GaussianBlur(a, (5, 5), 0) - cv2.GaussianBlur(b, (5, 5), 0))
+    H, W = h // block * block, a.shape[1] // block * block
+    if not H or not W:
+        return 255.0
+    tiles = diff[:H, :W].reshape(H // block, block, W // block, block).mean(axis=(1, 3))
+    return float(tiles.max())
 
-combined = normalize(t1) + " " + normalize(t2)
-print(json.dumps({"text": combined}))
+# Task: one JSON line, {"path": ...} for an image file or
+# {"raw": [width, height, channels]} followed by that many raw RGB bytes.
+# With "op": "dhash" (plus "thumb" and "width") the reply is {"dhash": ...}
+# instead of OCR text; {"op": "compare", "a": ..., "b": ...} compares two
+# saved thumbnails and replies {"diff": ...}.
+stdin = sys.stdin.buffer
+for line in iter(stdin.readline, b""):
+    if not line.strip():
+        continue
+    task = json.loads(line)
+    if task.get("op") == "compare":
+        try:
+            reply = {"diff": compare(task["a"], task["b"])}
+        except Exception as e:
+            reply = {"diff": 255.0, "error": str(e)}
+        out.write(json.dumps(reply) + "\n")
+        out.flush()
+        continue
+    raw = stdin.read(task["raw"][0] * task["raw"][1] * task["raw"][2]) \
+          if "raw" in task else None
+    try:
+        if raw is not None:
+            w, h, n = task["raw"]
+            img = np.frombuffer(raw, np.uint8).reshape(h, w, n)
+            img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR if n == 3 else cv2.COLOR_GRAY2BGR)
+        elif task.get("op") == "dhash":
+            img = cv2.imread(task["path"], cv2.IMREAD_GRAYSCALE)
+        else:
+            img = cv2.imread(task["path"])
+        if task.get("op") == "dhash":
+            reply = {"dhash": dhash(img, task["thumb"], task["width"])
+                              if img is not None else None}
+        else:
+            text, passes = ocr(img) if img is not None else ("", [])
+            reply = {"text": text, "passes": passes, "backend": backend.name}
+    except Exception as e:
+        reply = {"text": "", "error": str(e)}
+    img = raw = None
+    gc.collect()
+    out.write(json.dumps(reply) + "\n")
+    out.flush()
 '''
-with open(WORKER_PATH, "w") as f:
-    f.write(WORKER_CODE)
+_worker_script_pid = None
+
+def ensure_worker_script():
+    """Write WORKER_CODE to WORKER_PATH once per process, before the first worker starts."""
+    global _worker_script_pid
+    if _worker_script_pid == os.getpid():
+        return
+    try:
+        with open(WORKER_PATH) as f:
+            current = f.read() == WORKER_CODE
+    except OSError:
+        current = False
+    if not current:
+        # Other processes may be starting workers from the same file
+        tmp = f"{WORKER_PATH}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(WORKER_CODE)
+        os.replace(tmp, WORKER_PATH)
+    _worker_script_pid = os.getpid()
+
+
+def _proc_rss_mb(pid):
+    """Resident set size of a process in MB (Linux /proc), None if unknown."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def image_pixels(path):
+    """
+    Pixel count read from a JPEG/PNG header without decoding the image.
+    Returns None for formats or files it cannot parse.
+    """
+    if isinstance(path, RasterImage):
+        return path.width * path.height
+    try:
+        with open(path, "rb") as f:
+            head = f.read(26)
+            if head[:8] == b"\x89PNG\r\n\x1a\n":
+                w, h = struct.unpack(">II", head[16:24])
+                return w * h
+            if head[:2] != b"\xff\xd8":
+                return None
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                    continue
+                seglen = struct.unpack(">H", f.read(2))[0]
+                # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    h, w = struct.unpack(">xHH", f.read(5))
+                    return w * h
+                f.seek(seglen - 2, 1)
+    except (OSError, struct.error):
+        return None
+
+def estimate_ocr_mb(pixels):
+    """Estimated peak memory (MB) of one OCR task on an image of `pixels`."""
+    return OCR_TASK_BASE_MB + (pixels or OCR_DEFAULT_PIXELS) * OCR_BYTES_PER_PIXEL / 2**20
+
+
+class MemoryBudget:
+    """
+    Counting semaphore in MB. A task that is larger than the whole budget is
+    still admitted, but only when nothing else is running.
+    """
+
+    def __init__(self, total_mb):
+        self.total_mb = total_mb
+        self.used_mb  = 0.0
+        self._cond    = threading.Condition()
+
+    def acquire(self, mb):
+        with self._cond:
+            while self.used_mb > 0 and self.used_mb + mb > self.total_mb:
+                self._cond.wait()
+            self.used_mb += mb
+
+    def release(self, mb):
+        with self._cond:
+            self.used_mb = max(self.used_mb - mb, 0.0)
+            self._cond.notify_all()
+
+
+class OCRWorker:
+    """
+    One long-lived OCR child process speaking JSON lines over a pipe.
+    `env` overrides OCR settings for this worker (e.g. another OCR_BACKEND).
+    """
+
+    def __init__(self, env=None):
+        ensure_worker_script()
+        self.proc = subprocess.Popen(
+            [sys.executable, WORKER_PATH],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, bufsize=0,
+            env={**os.environ, **OCR_WORKER_ENV, **(env or {})}
+        )
+        self.tasks_done = 0
+        self._buf = b""
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def rss_mb(self):
+        return _proc_rss_mb(self.proc.pid)
+
+    def _readline(self, timeout):
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        while b"\n" not in self._buf:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"OCR worker gave no answer within {timeout}s")
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise EOFError("OCR worker exited")
+            self._buf += chunk
+        line, self._buf = self._buf.split(b"\n", 1)
+        return line
+
+    def _write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[self.proc.stdin.write(view):]
+
+    def run(self, task, timeout, payload=None):
+        self._write((json.dumps(task) + "\n").encode())
+        if payload:
+            self._write(payload)
+        reply = json.loads(self._readline(timeout))
+        self.tasks_done += 1
+        return reply
+
+    def close(self):
+        if self.alive():
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=2)
+            except Exception:
+                self.proc.kill()
+                self.proc.wait()
+
+
+class OCRWorkerPool:
+    """
+    Pool of OCRWorker processes.
+    A worker that times out or dies mid-task is killed and replaced on the
+    next request; healthy workers go back to the pool unless they are due
+    for recycling (task count or RSS limit). Tasks are admitted against a
+    shared MemoryBudget so parallel OCR stays inside the container limit.
+    """
+
+    def __init__(self, size=1, max_tasks=OCR_WORKER_MAX_TASKS,
+                 max_rss_mb=OCR_WORKER_MAX_RSS_MB, timeout=OCR_TIMEOUT,
+                 budget=None):
+        self.size       = size
+        self.budget     = budget
+        self.max_tasks  = max_tasks
+        self.max_rss_mb = max_rss_mb
+        self.timeout    = timeout
+        self._idle      = []
+        self._spawned   = 0
+        self._cond      = threading.Condition()
+        self._closed    = False
+
+    def _acquire(self):
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("OCR worker pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._spawned < self.size:
+                    self._spawned += 1
+                    break
+                self._cond.wait()
+        try:
+            return OCRWorker()
+        except Exception:
+            self._discard(None)
+            raise
+
+    def _release(self, worker):
+        with self._cond:
+            if self._closed:
+                worker.close()
+                return
+            self._idle.append(worker)
+            self._cond.notify()
+
+    def _discard(self, worker):
+        if worker is not None:
+            if worker.alive():
+                worker.proc.kill()
+            worker.proc.wait()
+        with self._cond:
+            self._spawned -= 1
+            self._cond.notify()
+
+    def _due_for_recycle(self, worker, rss):
+        if worker.tasks_done >= self.max_tasks:
+            return True
+        return rss is not None and rss > self.max_rss_mb
+
+    def run(self, task, cost_mb=0, payload=None):
+        if self.budget:
+            self.budget.acquire(cost_mb)
+        try:
+            worker = self._acquire()
+            try:
+                reply = worker.run(task, self.timeout, payload)
+            except Exception:
+                self._discard(worker)
+                raise
+            rss = worker.rss_mb()
+            if rss is not None:
+                metrics.observe("ocr_worker_rss_mb", rss)
+            if self._due_for_recycle(worker, rss):
+                worker.close()
+                self._discard(worker)
+            else:
+                self._release(worker)
+            return reply
+        finally:
+            if self.budget:
+                self.budget.release(cost_mb)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for w in idle:
+            w.close()
+
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+def get_ocr_pool(size=None, budget_mb=None):
+    """
+    This process's OCR worker pool, created on the first call with `size`
+    workers (default OCR_MAX_WORKERS) under a `budget_mb` memory budget
+    (default OCR_MEMORY_BUDGET_MB); the budget also caps the size. Later
+    calls return the same pool whatever they pass.
+    """
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            if TESSEROCR_MISSING:
+                logger.warning("tesserocr is not installed; using pytesseract")
+            budget_mb = budget_mb or OCR_MEMORY_BUDGET_MB
+            size = max(1, min(size or OCR_MAX_WORKERS, budget_mb // OCR_TASK_BASE_MB))
+            _ocr_pool = OCRWorkerPool(size=size, budget=MemoryBudget(budget_mb))
+            atexit.register(_ocr_pool.close)
+        return _ocr_pool
 
 HTML = """<!DOCTYPE html>
 <html lang="en">
@@ -244,7 +902,8 @@ footer{text-align:center;padding:40px 0 60px;position:relative;z-index:1;}
 </div>
 <footer><div class="footer-rule"></div><div class="footer-brand">AuditLens &mdash; Built by <strong>Shubham Hulsure</strong></div></footer>
 <script>
-let zipFile=null,currentJobId=null,pollTimer=null;
+let zipFile=null,currentJobId=null,pollTimer=null,eventSrc=null,lastSeq=0;
+const CHUNK_PARALLEL=4,CHUNK_RETRIES=5;
 function handleZip(i){zipFile=i.files[0];const l=document.getElementById('zipLabel'),z=document.getElementById('zipZone');if(zipFile){l.textContent=zipFile.name;l.classList.add('visible');z.classList.add('has-file');}checkReady();}
 function handleCsv(i){const l=document.getElementById('csvLabel'),z=document.getElementById('csvZone');if(i.files[0]){l.textContent=i.files[0].name;l.classList.add('visible');z.classList.add('has-file');}checkReady();}
 function checkReady(){document.getElementById('runBtn').disabled=!zipFile;}
@@ -255,8 +914,16 @@ zz.addEventListener('drop',e=>{e.preventDefault();zz.classList.remove('dragover'
 function addLog(msg,type){const log=document.getElementById('logArea');const cur=log.querySelector('.cursor-blink');if(cur)cur.remove();const d=document.createElement('div');d.className='log-line '+(type||'info');d.textContent=msg;log.appendChild(d);const c=document.createElement('span');c.className='cursor-blink';log.appendChild(c);log.scrollTop=log.scrollHeight;}
 function showErr(m){const b=document.getElementById('errBox');b.textContent=m;b.style.display='block';}
 function animateNum(el,target){const dur=1400,t0=performance.now();function step(now){const p=Math.min((now-t0)/dur,1),e=1-Math.pow(1-p,3);el.textContent=Math.floor(e*target);if(p<1)requestAnimationFrame(step);else el.textContent=target;}requestAnimationFrame(step);}
-async function startAudit(){if(!zipFile)return;document.getElementById('errBox').style.display='none';document.getElementById('logArea').innerHTML='<span class="cursor-blink"></span>';document.getElementById('resultPanel').style.display='none';const btn=document.getElementById('runBtn');btn.disabled=true;btn.textContent='Uploading...';document.getElementById('progressPanel').style.display='block';document.getElementById('progFill').style.width='3%';document.getElementById('pctNum').textContent='3';document.getElementById('progLabel').textContent='Uploading...';const fd=new FormData();fd.append('zip_file',zipFile);const cf=document.getElementById('csvInput').files[0];if(cf)fd.append('csv_file',cf);try{const res=await fetch('/start',{method:'POST',body:fd});const data=await res.json();if(!data.job_id){showErr(data.error||'Upload failed');btn.disabled=false;btn.textContent='Begin Audit';return;}currentJobId=data.job_id;btn.textContent='Processing...';addLog('Files uploaded. OCR starting...','ok');pollTimer=setInterval(pollStatus,2500);}catch(e){showErr(e.message);btn.disabled=false;btn.textContent='Begin Audit';}}
-async function pollStatus(){if(!currentJobId)return;try{const res=await fetch('/status/'+currentJobId);const job=await res.json();const pct=job.progress||0;document.getElementById('progFill').style.width=pct+'%';document.getElementById('pctNum').textContent=pct;document.getElementById('progStep').textContent=job.step||'';document.getElementById('progLabel').textContent=pct<20?'Extracting...':pct<68?'OCR scanning...':pct<90?'Matching records...':'Writing report...';if(job.new_logs&&job.new_logs.length)job.new_logs.forEach(l=>addLog(l.msg,l.type));if(job.status==='done'){clearInterval(pollTimer);const r=document.getElementById('resultPanel');r.style.display='block';r.scrollIntoView({behavior:'smooth',block:'start'});animateNum(document.getElementById('statTotal'),job.summary.total);animateNum(document.getElementById('statMatched'),job.summary.matched);animateNum(document.getElementById('statMismatch'),job.summary.mismatch);document.getElementById('dlBtn').onclick=()=>{window.location.href='/download/'+currentJobId;};document.getElementById('runBtn').disabled=false;document.getElementById('runBtn').textContent='Begin Audit';}if(job.status==='error'){clearInterval(pollTimer);showErr(job.error||'Something went wrong.');document.getElementById('runBtn').disabled=false;document.getElementById('runBtn').textContent='Begin Audit';}}catch(e){}}
+function uploadKey(f){return 'upload:'+f.name+':'+f.size+':'+f.lastModified;}
+async function sha256Hex(buf){if(!(window.crypto&&crypto.subtle))return null;const h=await crypto.subtle.digest('SHA-256',buf);return Array.from(new Uint8Array(h)).map(b=>b.toString(16).padStart(2,'0')).join('');}
+async function putChunk(id,offset,buf,digest){for(let attempt=1;;attempt++){let r=null;try{r=await fetch('/uploads/'+id+'/chunk?offset='+offset,{method:'PUT',headers:digest?{'X-Chunk-SHA256':digest}:{},body:buf});}catch(e){}if(r&&r.ok)return;if(attempt>=CHUNK_RETRIES||(r&&(r.status===404||r.status===409))){const d=r?await r.json().catch(()=>({})):{};throw new Error(d.error||'Upload interrupted');}await new Promise(s=>setTimeout(s,1000*attempt));}}
+async function uploadZip(file,onProgress){const key=uploadKey(file);let up=null;const saved=localStorage.getItem(key);if(saved){try{const r=await fetch('/uploads/'+saved);if(r.ok)up=await r.json();}catch(e){}}if(!up){const r=await fetch('/uploads',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({filename:file.name,size:file.size})});up=await r.json();if(!r.ok)throw new Error(up.error||'Upload failed');localStorage.setItem(key,up.upload_id);}else if(up.received.length)addLog('Resuming upload: '+up.received.length+'/'+up.chunks+' chunks already on the server','info');if(up.finalized)return up.upload_id;const have=new Set(up.received),digests=new Array(up.chunks),cs=up.chunk_size;let next=0,sent=0;have.forEach(i=>{sent+=Math.min(cs,file.size-i*cs);});onProgress(sent,file.size);async function worker(){while(next<up.chunks){const i=next++;const buf=await file.slice(i*cs,Math.min((i+1)*cs,file.size)).arrayBuffer();digests[i]=await sha256Hex(buf);if(have.has(i))continue;await putChunk(up.upload_id,i*cs,buf,digests[i]);sent+=buf.byteLength;onProgress(sent,file.size);}}await Promise.all(Array.from({length:Math.min(CHUNK_PARALLEL,up.chunks)},worker));const checksum=digests.every(d=>d)?await sha256Hex(new TextEncoder().encode(digests.join(''))):null;const r=await fetch('/uploads/'+up.upload_id+'/finalize',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({checksum:checksum})});const fin=await r.json();if(!r.ok){localStorage.removeItem(key);throw new Error(fin.error||'Upload failed');}addLog('Upload verified: '+fin.bill_files+' bill files in archive','ok');return up.upload_id;}
+function showUpload(done,total){const pct=total?Math.round(done/total*100):100;document.getElementById('progFill').style.width=Math.max(3,Math.round(pct/10))+'%';document.getElementById('pctNum').textContent=Math.max(3,Math.round(pct/10));document.getElementById('progStep').textContent='Uploaded '+(done/1048576).toFixed(1)+' / '+(total/1048576).toFixed(1)+' MB';}
+async function startAudit(){if(!zipFile)return;document.getElementById('errBox').style.display='none';document.getElementById('logArea').innerHTML='<span class="cursor-blink"></span>';document.getElementById('resultPanel').style.display='none';const btn=document.getElementById('runBtn');btn.disabled=true;btn.textContent='Uploading...';document.getElementById('progressPanel').style.display='block';document.getElementById('progFill').style.width='3%';document.getElementById('pctNum').textContent='3';document.getElementById('progLabel').textContent='Uploading...';try{const uploadId=await uploadZip(zipFile,showUpload);const fd=new FormData();fd.append('upload_id',uploadId);const cf=document.getElementById('csvInput').files[0];if(cf)fd.append('csv_file',cf);const res=await fetch('/start',{method:'POST',body:fd});const data=await res.json();if(!data.job_id){showErr(data.error||'Upload failed');btn.disabled=false;btn.textContent='Begin Audit';return;}localStorage.removeItem(uploadKey(zipFile));currentJobId=data.job_id;btn.textContent='Processing...';addLog('Files uploaded. OCR starting...','ok');watchJob();}catch(e){showErr(e.message);btn.disabled=false;btn.textContent='Begin Audit';}}
+function watchJob(){lastSeq=0;if(!window.EventSource){pollTimer=setInterval(pollStatus,2500);return;}eventSrc=new EventSource('/events/'+currentJobId);eventSrc.addEventListener('log',e=>{lastSeq=parseInt(e.lastEventId)||lastSeq;const l=JSON.parse(e.data);addLog(l.msg,l.type);});eventSrc.addEventListener('progress',e=>showProgress(JSON.parse(e.data)));eventSrc.addEventListener('end',e=>{eventSrc.close();eventSrc=null;finishJob(JSON.parse(e.data));});eventSrc.onerror=()=>{if(eventSrc&&eventSrc.readyState===EventSource.CLOSED){eventSrc=null;pollTimer=setInterval(pollStatus,2500);}};}
+function showProgress(job){const pct=job.progress||0;document.getElementById('progFill').style.width=pct+'%';document.getElementById('pctNum').textContent=pct;document.getElementById('progStep').textContent=job.step||'';document.getElementById('progLabel').textContent=job.queue_position?'Queued (#'+job.queue_position+')':pct<20?'Extracting...':pct<68?'OCR scanning...':pct<90?'Matching records...':'Writing report...';}
+function finishJob(job){if(job.status==='done'){const r=document.getElementById('resultPanel');r.style.display='block';r.scrollIntoView({behavior:'smooth',block:'start'});animateNum(document.getElementById('statTotal'),job.summary.total);animateNum(document.getElementById('statMatched'),job.summary.matched);animateNum(document.getElementById('statMismatch'),job.summary.mismatch);document.getElementById('dlBtn').onclick=()=>{window.location.href='/download/'+currentJobId;};document.getElementById('runBtn').disabled=false;document.getElementById('runBtn').textContent='Begin Audit';}if(job.status==='error'||job.status==='not_found'){showErr(job.status==='not_found'?'Job not found. It may have expired; please start the audit again.':(job.error||'Something went wrong.'));document.getElementById('runBtn').disabled=false;document.getElementById('runBtn').textContent='Begin Audit';}}
+async function pollStatus(){if(!currentJobId)return;try{const res=await fetch('/status/'+currentJobId+'?after='+lastSeq);const job=await res.json();showProgress(job);if(job.new_logs&&job.new_logs.length)job.new_logs.forEach(l=>{lastSeq=l.seq;addLog(l.msg,l.type);});if(job.status==='done'||job.status==='error'||job.status==='not_found'){clearInterval(pollTimer);finishJob(job);}}catch(e){}}
 </script></body></html>"""
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
@@ -309,345 +976,3102 @@ def extract_date_from_filename(filename):
 
     return None
 
-def pdf_to_images(pdf_path, output_dir):
-    images = []
+class RasterImage:
+    """A rendered page kept in memory: packed 8-bit RGB (or grey) samples."""
+    __slots__ = ("width", "height", "channels", "data")
+
+    def __init__(self, width, height, channels, data):
+        self.width, self.height, self.channels, self.data = width, height, channels, data
+
+    def __str__(self):
+        return f"<raster {self.width}x{self.height}>"
+
+
+class TextLayer:
+    """Text taken from a PDF's own text layer; needs no OCR."""
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
+def text_layer_ok(raw):
+    """
+    True when a PDF page's embedded text is good enough to skip OCR:
+    enough characters, and mostly real letters/digits rather than the
+    glyph soup broken font encodings produce.
+    """
+    chars = [c for c in raw if not c.isspace()]
+    if len(normalize(raw)) < PDF_TEXT_MIN_CHARS or not chars:
+        return False
+    return sum(c.isascii() and c.isalnum() for c in chars) / len(chars) >= 0.6
+
+def iter_pdf_pages(pdf_path, log=None, name=None):
+    """
+    Yield each page of a PDF lazily, one at a time: a TextLayer when the
+    embedded text passes text_layer_ok(), otherwise a RasterImage rendered
+    at 2x straight into memory. A PDF that cannot be read is reported to
+    `log` (the audit's log callback; the module logger without one) as
+    `name`, and yields the pages read so far.
+    """
+    def error(e):
+        msg = f"PDF error {name or pdf_path}: {e}"
+        if log:
+            log(msg, "err")
+        else:
+            logger.warning(msg)
+
     try:
         doc = fitz.open(pdf_path)
-        for i, page in enumerate(doc):
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_path = os.path.join(output_dir, f"pdf_page_{i}.jpg")
-            pix.save(img_path)
-            images.append(img_path)
     except Exception as e:
-        print(f"PDF error: {e}")
-    return images
+        error(e)
+        return
+    try:
+        for page in doc:
+            raw = page.get_text()
+            if text_layer_ok(raw):
+                yield TextLayer(normalize(raw))
+                continue
+            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2), alpha=False)
+            yield RasterImage(pix.width, pix.height, pix.n, pix.samples)
+            del pix
+    except Exception as e:
+        error(e)
+    finally:
+        doc.close()
+
+def zip_bill_entries(z, log=None):
+    """
+    (seq, ZipInfo) of the bill entries of an open ZipFile: files that are
+    not ignored, have an ALLOWED_BILL_EXT extension, a safe relative path
+    (no zip-slip) and a declared size within MAX_ZIP_ENTRY_MB. Rejected
+    unsafe and oversize entries are reported to `log`.
+    """
+    limit = MAX_ZIP_ENTRY_MB * 2**20
+    for seq, info in enumerate(z.infolist()):
+        rel = info.filename
+        if info.is_dir() or is_ignored(rel):
+            continue
+        if os.path.splitext(rel)[1].lower() not in ALLOWED_BILL_EXT:
+            continue
+        parts = rel.replace("\\", "/").split("/")
+        if rel.startswith(("/", "\\")) or ".." in parts or ":" in parts[0]:
+            if log:
+                log(f"Skipped unsafe path: {rel}", "err")
+            continue
+        if info.file_size > limit:
+            if log:
+                log(f"Skipped {rel}: larger than {MAX_ZIP_ENTRY_MB} MB", "err")
+            continue
+        yield seq, info
+
+def zip_bill_count(zip_path):
+    """Bill entries zip_bill_entries() accepts; raises zipfile.BadZipFile."""
+    with zipfile.ZipFile(zip_path, "r") as z:
+        return sum(1 for _ in zip_bill_entries(z))
+
+def iter_zip_bills(zip_path, stage_dir, log=print):
+    """
+    Stream bill images out of a ZIP one entry at a time.
+    Entries are filtered on the central directory by zip_bill_entries()
+    and only the ones that are pulled get extracted, to a generated name
+    under `stage_dir`, so archive paths never touch the filesystem. An
+    entry that turns out larger than MAX_ZIP_ENTRY_MB while extracting is
+    skipped too. PDF pages are yielded lazily as TextLayer / RasterImage
+    objects and the staged PDF is removed after its last page.
+    Yields (source, rel_path); the consumer deletes staged image files.
+    """
+    limit = MAX_ZIP_ENTRY_MB * 2**20
+    with zipfile.ZipFile(zip_path, "r") as z:
+        for seq, info in zip_bill_entries(z, log):
+            rel = info.filename
+            ext = os.path.splitext(rel)[1].lower()
+            staged = os.path.join(stage_dir, f"{seq:06d}{ext}")
+            written = 0
+            with z.open(info) as src, open(staged, "wb") as dst:
+                for chunk in iter(lambda: src.read(1 << 20), b""):
+                    written += len(chunk)
+                    if written > limit:
+                        break
+                    dst.write(chunk)
+            if written > limit:
+                os.remove(staged)
+                log(f"Skipped {rel}: larger than {MAX_ZIP_ENTRY_MB} MB", "err")
+                continue
+
+            if ext == ".pdf":
+                try:
+                    for page in iter_pdf_pages(staged, log, rel):
+                        yield page, rel
+                finally:
+                    os.remove(staged)
+            else:
+                yield staged, rel
 
-def ocr_image_subprocess(img_path):
+def ocr_image_subprocess(img_path, info=None):
     """
-    Run OCR in an isolated subprocess.
-    The child process loads OpenCV + Tesseract, runs OCR, prints JSON, and exits.
-    All image memory is FULLY released when the subprocess exits — no leak.
+    Run OCR in an isolated worker process from the shared pool.
+    `img_path` is an image file or an in-memory RasterImage, whose pixels
+    are piped to the worker without an encode/decode round trip.
+    If `info` is a dict it receives the worker's per-pass timings.
+    The worker loads OpenCV + Tesseract once and serves many images; it is
+    recycled after a fixed number of images or when its RSS grows past the
+    limit, so image memory never accumulates in the web process.
     This is the key fix for the 512MB Render memory crash.
     """
+    t = time.perf_counter()
+    source = "pdf_page" if isinstance(img_path, RasterImage) else "image"
     try:
-        result = subprocess.run(
-            [sys.executable, WORKER_PATH, img_path],
-            capture_output=True, text=True, timeout=90
-        )
-        if result.returncode == 0 and result.stdout.strip():
-            data = json.loads(result.stdout.strip())
-            return data.get("text", "")
-        return ""
+        cost = estimate_ocr_mb(image_pixels(img_path))
+        if isinstance(img_path, RasterImage):
+            img = img_path
+            metrics.inc("ocr_bytes_total", len(img.data), source=source)
+            data = get_ocr_pool().run(
+                {"raw": [img.width, img.height, img.channels]},
+                cost_mb=cost, payload=img.data)
+        else:
+            metrics.inc("ocr_bytes_total", os.path.getsize(img_path), source=source)
+            data = get_ocr_pool().run({"path": img_path}, cost_mb=cost)
+        if info is not None:
+            info["passes"] = data.get("passes", [])
+        return data.get("text", "")
     except Exception as e:
-        print(f"Subprocess OCR error {img_path}: {e}")
+        metrics.inc("ocr_errors_total")
+        logger.warning("Subprocess OCR error %s: %s", img_path, e)
         return ""
+    finally:
+        metrics.observe("ocr_image_seconds", time.perf_counter() - t, source=source)
 
-# ── Scoring ───────────────────────────────────────────────────────────────────
+def duplicate_finder(thumb_dir):
+    """
+    A DuplicateFinder for one audit, or None when detection is off. With
+    the distributed OCR queue the web process has no OCR workers to hash
+    and compare thumbnails on, so there is no duplicate detection either.
+    """
+    if not DEDUP_MAX_DISTANCE or get_ocr_queue() is not None:
+        return None
+    return DuplicateFinder(thumb_dir)
 
-def bill_number_score(bill_no_raw, ocr_text):
-    if not bill_no_raw or len(bill_no_raw) < 2:
-        return 0, False
-    forms = {normalize(bill_no_raw), normalize_billno(bill_no_raw)}
-    digits = re.sub(r"[^0-9]", "", bill_no_raw)
-    if len(digits) >= 3:
-        forms.add(digits)
-    forms.discard("")
-    for form in sorted(forms, key=len, reverse=True):
-        if re.search(r'\b' + re.escape(form) + r'\b', ocr_text):
-            if form.isdigit() and len(form) <= 4:
-                return 25, True
-            elif form.isdigit():
-                return 35, True
-            else:
-                return 45, True
-    best = max((fuzz.partial_ratio(f, ocr_text) for f in forms), default=0)
-    return best * 0.15, False
+def image_dhash(img_path, thumb_path):
+    """
+    Perceptual hash (int) of an image file or RasterImage, computed by a
+    pool worker on a greyscale copy that it also saves to `thumb_path`;
+    None for text layers or errors.
+    """
+    task = {"op": "dhash", "thumb": thumb_path, "width": DEDUP_THUMB_WIDTH}
+    try:
+        if isinstance(img_path, TextLayer):
+            return None
+        if isinstance(img_path, RasterImage):
+            img = img_path
+            step = max(1, img.width // DEDUP_THUMB_WIDTH)
+            small = np.frombuffer(img.data, np.uint8).reshape(
+                img.height, img.width, img.channels)[::step, ::step]
+            h, w = small.shape[:2]
+            data = get_ocr_pool().run({**task, "raw": [w, h, img.channels]},
+                                      payload=np.ascontiguousarray(small).tobytes())
+        else:
+            # A greyscale decode: a third of the memory of an OCR task
+            data = get_ocr_pool().run({**task, "path": img_path})
+        return int(data["dhash"], 16) if data.get("dhash") else None
+    except Exception as e:
+        logger.warning("dHash error %s: %s", img_path, e)
+        return None
 
 
-def score_match(bill_no, vendor, item, amount_str, ocr_text, bill_date, file_date):
+class DuplicateFinder:
     """
-    Scoring breakdown (max 100):
-      Bill number in OCR    → 0–45 pts
-      Date match (filename) → 0–25 pts  ← NEW: compensates for garbled headers
-      Vendor fuzzy          → 0–15 pts
-      Item fuzzy            → 0–30 pts  ← increased weight (most reliable signal)
-      Amount match          → 0–10 pts
+    Online near-duplicate detection for the OCR pipeline. The first image
+    of a cluster is its original and gets OCR'd; a later image whose dHash
+    is within `max_distance` bits of an original, and whose thumbnail
+    matches it block by block (worker compare), waits for and reuses the
+    original's text. Hashes are split into max_distance + 1 bands: two
+    hashes that close agree exactly on at least one band, so lookups only
+    look at same-band candidates. Thumbnails live in `thumb_dir`.
+
+    Images are hashed in parallel but decided in index (archive) order:
+    image i is only compared and registered once every lower index has
+    been, so which image of a cluster is the original never depends on
+    thread timing. Callers must claim() every index from 0 up.
     """
-    if not ocr_text:
-        return 0
-    score, _ = bill_number_score(bill_no, ocr_text)
 
-    # Date bonus: bill date from CSV vs date parsed from image filename
-    if bill_date and file_date:
-        # Normalise both to YYYY-MM-DD prefix (first 10 chars)
-        bd = str(bill_date).strip()[:10]
-        fd = str(file_date).strip()[:10]
-        if bd == fd:
-            score += 25
+    def __init__(self, thumb_dir, max_distance=DEDUP_MAX_DISTANCE,
+                 max_diff=DEDUP_MAX_DIFF, max_candidates=DEDUP_MAX_CANDIDATES):
+        self.thumb_dir      = thumb_dir
+        self.max_distance   = max_distance
+        self.max_diff       = max_diff
+        self.max_candidates = max_candidates
+        n = max_distance + 1
+        self._bands      = [(64 * b // n, 64 * (b + 1) // n) for b in range(n)]
+        self._index      = [defaultdict(list) for _ in range(n)]
+        self._hashes     = {}     # original index -> hash
+        self._texts      = {}     # original index -> text
+        self._ready      = {}     # original index -> Event
+        self._lock       = threading.Lock()
+        self._turn       = threading.Condition()
+        self._next       = 0      # lowest index not decided yet
+        self.duplicates  = {}     # index -> (original index, hash distance)
+        os.makedirs(thumb_dir, exist_ok=True)
 
-    if vendor and len(vendor) >= 2:
-        score += fuzz.partial_ratio(vendor, ocr_text) * 0.15
+    def _keys(self, h):
+        for b, (lo, hi) in enumerate(self._bands):
+            yield b, (h >> lo) & ((1 << (hi - lo)) - 1)
 
-    if item and len(item) >= 2:
-        score += fuzz.partial_ratio(item, ocr_text) * 0.30
+    def _thumb(self, i):
+        return os.path.join(self.thumb_dir, f"{i:06d}.png")
 
-    if amount_str:
-        amt = re.sub(r"\.0+$", "", amount_str.strip())
-        if amt in extract_numbers(ocr_text):
-            score += 10
+    def _candidates(self, h):
+        with self._lock:
+            found = {}
+            for b, key in self._keys(h):
+                for orig in self._index[b][key]:
+                    d = (h ^ self._hashes[orig]).bit_count()
+                    if d <= self.max_distance:
+                        found[orig] = d
+        return sorted(found.items(), key=lambda kv: (kv[1], kv[0]))[:self.max_candidates]
 
-    return min(round(score, 1), 100)
+    def claim(self, i, source):
+        """
+        Index of the original `source` duplicates, or None after registering
+        `i` as an original (the caller then OCRs it and calls publish()).
+        Text layers and unhashable images are never duplicates. A None
+        `source` (text already cached) takes the turn without hashing:
+        `i` is neither a duplicate nor an original later images can match.
+        """
+        h = image_dhash(source, self._thumb(i)) if source is not None else None
+        with self._turn:
+            self._turn.wait_for(lambda: self._next >= i)
+        try:
+            return self._decide(i, h)
+        finally:
+            with self._turn:
+                self._next = i + 1
+                self._turn.notify_all()
 
+    def _decide(self, i, h):
+        if h is None:
+            return None
+        for orig, distance in self._candidates(h):
+            try:
+                reply = get_ocr_pool().run({"op": "compare", "a": self._thumb(orig),
+                                            "b": self._thumb(i)})
+            except Exception as e:
+                logger.warning("Duplicate check error %s: %s", self._thumb(i), e)
+                break                    # keep it as an original
+            if reply.get("diff", 255.0) <= self.max_diff:
+                with self._lock:
+                    self.duplicates[i] = (orig, distance)
+                os.remove(self._thumb(i))
+                return orig
+        with self._lock:
+            self._hashes[i] = h
+            self._ready[i] = threading.Event()
+            for b, key in self._keys(h):
+                self._index[b][key].append(i)
+        return None
 
-def classify(score):
-    if score >= 50:
-        return "Matched",              "Match confirmed"
-    elif score >= 30:
-        return "Mismatch / Duplicate", "Partial match — verify manually"
-    else:
-        return "Not Found",            "No matching bill image detected"
+    def publish(self, i, text):
+        if i in self._ready:
+            self._texts[i] = text
+            self._ready[i].set()
 
-# ── Excel writer ──────────────────────────────────────────────────────────────
+    def text_of(self, orig):
+        self._ready[orig].wait()
+        return self._texts[orig]
 
-def generate_excel(results, output_path):
-    wb = Workbook(); ws = wb.active; ws.title = "Audit Report"
-    headers = ["File Name","Folder","Bill Number","Bill Date","Vendor Name",
-               "Customer/Hotel","Item Description","Quantity","Rate (Rs)",
-               "Total Amount (Rs)","AI Confidence","Match Status","Match Detail"]
-    hfill = PatternFill(start_color="1E3A5F", end_color="1E3A5F", fill_type="solid")
-    hfont = Font(bold=True, color="FFFFFF", size=11)
-    for col, h in enumerate(headers, 1):
-        c = ws.cell(row=1, column=col, value=h)
-        c.fill = hfill; c.font = hfont
-        c.alignment = Alignment(horizontal="center", vertical="center")
-    ws.row_dimensions[1].height = 30
-    green  = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-    red    = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-    yellow = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")
-    for i, r in enumerate(results, 2):
-        row_data = [r.get("file_name",""), r.get("folder",""), r.get("bill_number",""),
-                    r.get("bill_date",""), r.get("vendor_name",""), r.get("customer_name",""),
-                    r.get("item_description",""), r.get("quantity",""), r.get("rate",""),
-                    r.get("total_amount",""), r.get("confidence",""),
-                    r.get("match_status",""), r.get("match_detail","")]
-        s = r.get("match_status","")
-        rf = green if s=="Matched" else red if s=="Not Found" else yellow if "Mismatch" in s else None
-        for col, val in enumerate(row_data, 1):
-            c = ws.cell(row=i, column=col, value=val)
-            c.alignment = Alignment(vertical="center")
-            if rf: c.fill = rf
-    col_widths = [22,18,15,12,30,25,25,10,12,15,12,14,35]
-    for col, width in enumerate(col_widths, 1):
-        ws.column_dimensions[ws.cell(row=1,column=col).column_letter].width = width
-    ws.freeze_panes = "A2"
-    wb.save(output_path)
+    def close(self):
+        shutil.rmtree(self.thumb_dir, ignore_errors=True)
 
-# ── Background worker ─────────────────────────────────────────────────────────
+# ── Distributed OCR queue ─────────────────────────────────────────────────────
+# With OCR_QUEUE=sqlite the web app does not OCR itself: each image is
+# published to a shared queue and OCR'd by `python app.py worker` processes,
+# which can run in other containers that mount OCR_QUEUE_DIR. Workers claim
+# tasks with a lease; a task whose lease runs out (crashed or stuck worker)
+# goes back to the queue, up to OCR_QUEUE_MAX_ATTEMPTS tries. Workers also
+# heartbeat; if none has been seen for OCR_QUEUE_CLAIM_SECS while an image
+# waits to be claimed, the audit fails instead of waiting. OCRQueue is
+# the backend interface; SQLiteOCRQueue keeps tasks in a SQLite file and
+# image bytes as files next to it, which works on one host or a shared
+# volume with working file locks.
+OCR_QUEUE              = os.environ.get("OCR_QUEUE", "local").lower()
+OCR_QUEUE_DIR          = os.environ.get("OCR_QUEUE_DIR", "/tmp/ocr_queue")
+OCR_QUEUE_LEASE_SECS   = int(os.environ.get("OCR_QUEUE_LEASE_SECS", OCR_TIMEOUT + 30))
+OCR_QUEUE_MAX_ATTEMPTS = int(os.environ.get("OCR_QUEUE_MAX_ATTEMPTS", 3))
+OCR_QUEUE_INFLIGHT     = int(os.environ.get("OCR_QUEUE_INFLIGHT", 16))
+OCR_QUEUE_POLL_SECS    = float(os.environ.get("OCR_QUEUE_POLL_SECS", 0.2))
+OCR_QUEUE_CLAIM_SECS   = float(os.environ.get("OCR_QUEUE_CLAIM_SECS", 30))
 
-def run_audit(job_id, work_dir, zip_path, csv_path):
-    job = jobs[job_id]
 
-    def log(msg, t="info"):
-        job["all_logs"].append({"msg": msg, "type": t})
-        job["new_logs"].append({"msg": msg, "type": t})
+class OCRQueueUnavailable(RuntimeError):
+    """No OCR worker is serving the queue; fails the audit rather than one image."""
 
-    def update(progress, step):
-        job["progress"] = progress
-        job["step"] = step
 
-    try:
-        update(8, "Extracting ZIP...")
-        extract_dir = os.path.join(work_dir, "extracted")
-        os.makedirs(extract_dir, exist_ok=True)
-        with zipfile.ZipFile(zip_path, "r") as z:
-            z.extractall(extract_dir)
-
-        csv_df = None
-        if csv_path and os.path.exists(csv_path):
-            update(12, "Reading reference file...")
-            try:
-                csv_df = pd.read_csv(csv_path) if csv_path.endswith(".csv") \
-                         else pd.read_excel(csv_path, engine="openpyxl")
-                csv_df.columns = csv_df.columns.str.strip()
-                log(f"Reference file: {len(csv_df)} rows", "ok")
-            except Exception as e:
-                log(f"Reference file error: {e}", "err")
-
-        update(16, "Scanning for images...")
-        bill_images = []
-        for root, dirs, files in os.walk(extract_dir):
-            for f in files:
-                rel  = os.path.relpath(os.path.join(root, f), extract_dir)
-                full = os.path.join(root, f)
-                if is_ignored(rel): continue
-                ext = os.path.splitext(f)[1].lower()
-                if ext == ".pdf":
-                    bill_images.extend([(img, rel) for img in pdf_to_images(full, root)])
-                elif ext in ALLOWED_BILL_EXT:
-                    bill_images.append((full, rel))
-
-        total_imgs = len(bill_images)
-        log(f"Found {total_imgs} bill images", "info")
-
-        # ── OCR each image in a subprocess (memory-safe) ──────────────────────
-        ocr_cache = []   # list of (img_path, filename, file_date, ocr_text)
-        for i, (img_path, rel_path) in enumerate(bill_images):
-            fname = os.path.basename(rel_path)
-            update(16 + int((i / max(total_imgs, 1)) * 50),
-                   f"OCR {i+1}/{total_imgs}: {fname}")
+class OCRQueue(ABC):
+    """
+    Work queue between OCR producers (audits) and remote OCR workers.
+    Tasks are images; results are the worker's {"text", "passes"} reply.
+    """
 
-            file_date = extract_date_from_filename(fname)
-            txt = ocr_image_subprocess(img_path)
+    @abstractmethod
+    def submit(self, img_path):
+        """Queue an image for OCR; returns its task id."""
 
-            if txt and len(txt.strip()) > 10:
-                ocr_cache.append((img_path, fname, file_date, txt))
-                date_info = f" date={file_date}" if file_date else ""
-                log(f"OCR OK: {fname}{date_info} ({len(txt)} chars)", "ok")
-            else:
-                log(f"OCR empty: {fname}", "err")
+    @abstractmethod
+    def wait(self, task_id, timeout):
+        """
+        The result of a task, or None if it failed or `timeout` seconds
+        passed after it was first claimed. Raises OCRQueueUnavailable
+        when no worker is serving the queue.
+        """
+
+    @abstractmethod
+    def beat(self, worker_id):
+        """Record that worker `worker_id` is alive."""
+
+    @abstractmethod
+    def claim(self, worker_id):
+        """Lease the next task to a worker: (task_id, token, image path) or None."""
 
-            job["new_logs"] = job["new_logs"][-30:]
-
-        # ── Match ─────────────────────────────────────────────────────────────
-        results = []
-        if csv_df is not None:
-            update(68, "Matching records to bills...")
-            log("Smart matching with date + item signals...", "info")
-            total_rows = len(csv_df)
-
-            for idx, (_, row) in enumerate(csv_df.iterrows()):
-                update(68 + int((idx / max(total_rows, 1)) * 22),
-                       f"Row {idx+1}/{total_rows}")
-
-                bill_no   = str(row.get("Bill Number", ""))
-                vendor    = normalize(str(row.get("Vendor Name", "")))
-                item      = normalize(str(row.get("Item Name", "")))
-                amount    = normalize(str(row.get("Item Total", "")))
-                bill_date = str(row.get("Bill Date", "")).strip()[:10]
-
-                best_score = 0; best_path = ""; best_fname = ""; best_signals = ""
-
-                for img_path, fname, file_date, text in ocr_cache:
-                    s = score_match(bill_no, vendor, item, amount,
-                                    text, bill_date, file_date)
-                    if s > best_score:
-                        best_score = s; best_path = img_path; best_fname = fname
-
-                        # Build signal description
-                        sigs = []
-                        forms = {normalize(bill_no), normalize_billno(bill_no)}
-                        digs = re.sub(r"[^0-9]", "", bill_no)
-                        if len(digs) >= 3: forms.add(digs)
-                        for f in forms:
-                            if f and re.search(r'\b'+re.escape(f)+r'\b', text):
-                                sigs.append(f"BillNo:{bill_no}"); break
-                        if file_date and bill_date == file_date:
-                            sigs.append(f"Date:{file_date}")
-                        vr = fuzz.partial_ratio(vendor, text)
-                        if vr >= 55: sigs.append(f"Vendor:{vr}%")
-                        amt = re.sub(r"\.0+$","",amount.strip())
-                        if amt and amt in extract_numbers(text): sigs.append(f"Amt:{amt}")
-                        best_signals = " | ".join(sigs) if sigs else "item fuzzy only"
-
-                status, _ = classify(best_score)
-                results.append({
-                    "file_name":        best_fname,
-                    "folder":           os.path.dirname(best_path) if best_path else "",
-                    "bill_number":      bill_no,
-                    "bill_date":        str(row.get("Bill Date", "")),
-                    "vendor_name":      str(row.get("Vendor Name", "")),
-                    "customer_name":    str(row.get("Branch Name", "")),
-                    "item_description": str(row.get("Item Name", "")),
-                    "quantity":         str(row.get("Quantity", "")),
-                    "rate":             str(row.get("Rate", "")),
-                    "total_amount":     str(row.get("Item Total", "")),
-                    "confidence":       best_score,
-                    "match_status":     status,
-                    "match_detail":     best_signals,
-                })
-                t = "ok" if status=="Matched" else ("err" if status=="Not Found" else "info")
-                log(f"{status} ({best_score}) | {bill_no} | "
-                    f"{str(row.get('Vendor Name',''))[:15]} | {best_signals}", t)
+    @abstractmethod
+    def complete(self, task_id, token, result):
+        """Store a result; False if the lease behind `token` has expired."""
+
+    @abstractmethod
+    def purge(self, older_than):
+        """Drop tasks older than `older_than` seconds, with their images."""
+
+    def ocr(self, img_path, info=None):
+        """
+        Publish one image and block until a worker has OCR'd it. The
+        timeout covers every lease attempt but not time spent queued.
+        """
+        task_id = self.submit(img_path)
+        timeout = OCR_QUEUE_LEASE_SECS * OCR_QUEUE_MAX_ATTEMPTS + 60
+        result = self.wait(task_id, timeout) or {}
+        if info is not None:
+            info["passes"] = result.get("passes", [])
+        return result.get("text", "")
+
+
+class SQLiteOCRQueue(OCRQueue):
+    """OCRQueue in `root`/queue.sqlite3, with task images under `root`/blobs."""
+
+    def __init__(self, root=OCR_QUEUE_DIR):
+        self.root   = root
+        self.blobs  = os.path.join(root, "blobs")
+        self._local = threading.local()
+        os.makedirs(self.blobs, exist_ok=True)
+        with self._conn() as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS ocr_tasks (
+                    id TEXT PRIMARY KEY, blob TEXT, meta TEXT,
+                    status TEXT, attempts INTEGER DEFAULT 0,
+                    worker TEXT, token TEXT, lease_until REAL, claimed REAL,
+                    result TEXT, created REAL);
+                CREATE INDEX IF NOT EXISTS ocr_tasks_status
+                    ON ocr_tasks(status, created);
+                CREATE TABLE IF NOT EXISTS ocr_workers (
+                    id TEXT PRIMARY KEY, seen REAL);
+            """)
+
+    def _conn(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(os.path.join(self.root, "queue.sqlite3"), timeout=30)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def submit(self, img_path):
+        task_id = uuid.uuid4().hex
+        if isinstance(img_path, RasterImage):
+            meta = {"raw": [img_path.width, img_path.height, img_path.channels]}
+            blob = os.path.join(self.blobs, f"{task_id}.raw")
+            with open(blob, "wb") as f:
+                f.write(img_path.data)
         else:
-            for img_path, fname, file_date, _ in ocr_cache:
-                results.append({
-                    "file_name":fname,"folder":"","bill_number":"","bill_date":"",
-                    "vendor_name":"","customer_name":"","item_description":"",
-                    "quantity":"","rate":"","total_amount":"",
-                    "confidence":"","match_status":"No CSV","match_detail":""
-                })
-
-        update(92, "Writing Excel report...")
-        report_path = os.path.join(REPORT_FOLDER, f"audit_{job_id}.xlsx")
-        generate_excel(results, report_path)
-
-        matched  = sum(1 for r in results if r["match_status"] == "Matched")
-        mismatch = sum(1 for r in results if r["match_status"] in
-                       ("Not Found", "Mismatch / Duplicate"))
-        log(f"Done — {matched} matched, {mismatch} flagged, {len(results)} total", "ok")
-        job.update({
-            "status": "done", "progress": 100, "step": "Audit complete",
-            "report_path": report_path,
-            "summary": {"total": len(results), "matched": matched, "mismatch": mismatch}
-        })
+            meta = {}
+            blob = os.path.join(self.blobs, task_id + os.path.splitext(img_path)[1])
+            shutil.copyfile(img_path, blob)
+        with self._conn() as db:
+            db.execute("""INSERT INTO ocr_tasks (id, blob, meta, status, created)
+                          VALUES (?, ?, ?, 'queued', ?)""",
+                       (task_id, os.path.basename(blob), json.dumps(meta), time.time()))
+        return task_id
 
-    except Exception as e:
-        import traceback
-        job.update({"status": "error", "error": str(e) + "\n" + traceback.format_exc()})
-    finally:
-        shutil.rmtree(work_dir, ignore_errors=True)
-        gc.collect()
+    def wait(self, task_id, timeout):
+        """
+        The task's result, or None if it failed or was not done `timeout`
+        seconds after a worker first claimed it. Raises OCRQueueUnavailable
+        when it is waiting for a worker and none has been seen for
+        OCR_QUEUE_CLAIM_SECS.
+        """
+        try:
+            while True:
+                db, now = self._conn(), time.time()
+                row = db.execute("""SELECT status, result, claimed, lease_until, attempts
+                                    FROM ocr_tasks WHERE id=?""", (task_id,)).fetchone()
+                if row is None or row["status"] == "failed":
+                    return None
+                if row["status"] == "done":
+                    return json.loads(row["result"])
+                if row["status"] == "queued" or row["lease_until"] < now:
+                    if row["attempts"] >= OCR_QUEUE_MAX_ATTEMPTS:
+                        return None
+                    # Before any worker has registered, the oldest waiting
+                    # task tells how long the queue has gone unserved
+                    seen = (db.execute("SELECT MAX(seen) FROM ocr_workers").fetchone()[0]
+                            or db.execute("""SELECT MIN(created) FROM ocr_tasks
+                                             WHERE status='queued'""").fetchone()[0] or now)
+                    if now - seen > OCR_QUEUE_CLAIM_SECS:
+                        raise OCRQueueUnavailable(
+                            f"No OCR worker has served the queue in {self.root} for "
+                            f"{OCR_QUEUE_CLAIM_SECS:g}s; start one with "
+                            f"'python app.py worker --queue-dir {self.root}'")
+                elif now - row["claimed"] > timeout:
+                    logger.warning("OCR queue: task %s not done %ss after it was claimed",
+                                   task_id, timeout)
+                    return None
+                time.sleep(OCR_QUEUE_POLL_SECS)
+        finally:
+            self._forget(task_id)
 
-# ── Routes ────────────────────────────────────────────────────────────────────
+    def _forget(self, task_id):
+        with self._conn() as db:
+            row = db.execute("SELECT blob FROM ocr_tasks WHERE id=?", (task_id,)).fetchone()
+            db.execute("DELETE FROM ocr_tasks WHERE id=?", (task_id,))
+        if row:
+            try:
+                os.remove(os.path.join(self.blobs, row["blob"]))
+            except OSError:
+                pass
 
-@app.route("/")
-def index():
-    return render_template_string(HTML)
+    def beat(self, worker_id):
+        """Tell producers that `worker_id` is alive and serving the queue."""
+        with self._conn() as db:
+            db.execute("INSERT OR REPLACE INTO ocr_workers VALUES (?,?)",
+                       (worker_id, time.time()))
 
-@app.route("/start", methods=["POST"])
-def start():
-    job_id   = str(uuid.uuid4())[:8]
-    work_dir = os.path.join(UPLOAD_FOLDER, job_id)
-    os.makedirs(work_dir, exist_ok=True)
-    zip_file = request.files.get("zip_file")
-    if not zip_file:
-        return jsonify({"error": "No ZIP file"}), 400
-    zip_path = os.path.join(work_dir, "bills.zip")
-    zip_file.save(zip_path)
-    csv_path = None
-    csv_file = request.files.get("csv_file")
-    if csv_file:
-        ext      = os.path.splitext(csv_file.filename)[1].lower() or ".xlsx"
-        csv_path = os.path.join(work_dir, f"data{ext}")
-        csv_file.save(csv_path)
-    jobs[job_id] = {
-        "status":"processing","progress":5,"step":"Files received...",
-        "all_logs":[],"new_logs":[],"summary":{},"report_path":None,"error":None
-    }
-    t = threading.Thread(target=run_audit, args=(job_id, work_dir, zip_path, csv_path))
-    t.daemon = True; t.start()
-    return jsonify({"job_id": job_id})
+    def claim(self, worker_id):
+        """
+        Lease the oldest runnable task: queued, or leased with an expired
+        lease. Returns (task_id, token, source) or None; `source` is an
+        image path or RasterImage ready for ocr_image_subprocess().
+        """
+        now = time.time()
+        with self._conn() as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("""UPDATE ocr_tasks SET status='failed'
+                          WHERE status='leased' AND lease_until<? AND attempts>=?""",
+                       (now, OCR_QUEUE_MAX_ATTEMPTS))
+            row = db.execute("""SELECT id, blob, meta FROM ocr_tasks
+                                WHERE status='queued'
+                                   OR (status='leased' AND lease_until<?)
+                                ORDER BY created LIMIT 1""", (now,)).fetchone()
+            if row is None:
+                return None
+            token = uuid.uuid4().hex
+            db.execute("""UPDATE ocr_tasks SET status='leased', worker=?, token=?,
+                            lease_until=?, attempts=attempts+1,
+                            claimed=COALESCE(claimed, ?) WHERE id=?""",
+                       (worker_id, token, now + OCR_QUEUE_LEASE_SECS, now, row["id"]))
+        path, meta = os.path.join(self.blobs, row["blob"]), json.loads(row["meta"])
+        if "raw" in meta:
+            w, h, n = meta["raw"]
+            with open(path, "rb") as f:
+                return row["id"], token, RasterImage(w, h, n, f.read())
+        return row["id"], token, path
 
-@app.route("/status/<job_id>")
-def status(job_id):
-    if job_id not in jobs:
-        return jsonify({"status": "not_found"}), 404
-    job = jobs[job_id]
-    out = {k: job[k] for k in ("status","progress","step","summary","error")}
-    out["new_logs"] = job["new_logs"]
-    job["new_logs"] = []
-    return jsonify(out)
+    def complete(self, task_id, token, result):
+        """Post a result; ignored if the lease was lost to another worker."""
+        with self._conn() as db:
+            cur = db.execute("""UPDATE ocr_tasks SET status='done', result=?
+                                WHERE id=? AND token=? AND status='leased'""",
+                             (json.dumps(result), task_id, token))
+        return cur.rowcount == 1
+
+    def purge(self, older_than):
+        """Drop tasks (and blobs) older than `older_than` seconds whose producer is gone."""
+        with self._conn() as db:
+            rows = db.execute("SELECT id FROM ocr_tasks WHERE created<?",
+                              (time.time() - older_than,)).fetchall()
+            db.execute("DELETE FROM ocr_workers WHERE seen<?",
+                       (time.time() - older_than,))
+        for row in rows:
+            self._forget(row["id"])
+
+
+OCR_QUEUE_BACKENDS = {"sqlite": SQLiteOCRQueue}
+
+_ocr_queue = None
+_ocr_queue_lock = threading.Lock()
+
+def get_ocr_queue():
+    """The configured OCRQueue, or None when OCR runs on the local pool."""
+    global _ocr_queue
+    if OCR_QUEUE == "local":
+        return None
+    with _ocr_queue_lock:
+        if _ocr_queue is None:
+            _ocr_queue = OCR_QUEUE_BACKENDS[OCR_QUEUE]()
+        return _ocr_queue
+
+
+def ocr_image(img_path, info=None):
+    """OCR one image on the shared queue if configured, else the local pool."""
+    queue = get_ocr_queue()
+    if queue is None:
+        return ocr_image_subprocess(img_path, info)
+    try:
+        return queue.ocr(img_path, info)
+    except OCRQueueUnavailable:
+        raise
+    except Exception as e:
+        metrics.inc("ocr_errors_total")
+        logger.warning("OCR queue error %s: %s", img_path, e)
+        return ""
+
+
+def run_ocr_worker(queue, concurrency=None, idle_sleep=0.5):
+    """
+    Serve an OCRQueue forever: claim, OCR on the local worker pool, post
+    the result. `concurrency` threads keep up to that many pool workers busy.
+    """
+    worker_id = f"{os.uname().nodename}:{os.getpid()}"
+    threads = concurrency or get_ocr_pool().size
+    logger.info("OCR worker %s: %d threads, backend %s", worker_id, threads, OCR_BACKEND)
+
+    def loop():
+        while True:
+            claimed = queue.claim(worker_id)
+            if claimed is None:
+                time.sleep(idle_sleep)
+                continue
+            task_id, token, source = claimed
+            info = {}
+            text = ocr_image_subprocess(source, info)
+            if not queue.complete(task_id, token, {"text": text,
+                                                   "passes": info.get("passes", [])}):
+                logger.warning("OCR worker: lease on %s was lost; result dropped", task_id)
+
+    for n in range(threads):
+        threading.Thread(target=loop, daemon=True, name=f"ocr-queue-{n}").start()
+    while True:
+        try:
+            queue.beat(worker_id)
+        except sqlite3.Error as e:
+            logger.warning("OCR worker heartbeat error: %s", e)
+        time.sleep(OCR_QUEUE_CLAIM_SECS / 3)
+
+# ── OCR result cache ──────────────────────────────────────────────────────────
+
+OCR_FINGERPRINT = hashlib.sha256(
+    (WORKER_CODE + "\0" + json.dumps(OCR_WORKER_ENV, sort_keys=True)).encode()
+).hexdigest()[:16]
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class OCRCache:
+    """
+    SQLite-backed OCR text cache shared by every audit thread and gunicorn
+    worker on the host. Keys are `<image sha256>:<OCR_FINGERPRINT>`, so a
+    change to WORKER_CODE or the Tesseract config invalidates old entries.
+    Least recently used entries are evicted once the stored text exceeds
+    `max_mb`. Triggers keep the total size in the one-row ocr_cache_total
+    table, so a put() only walks the LRU index when it has to evict.
+    """
+
+    def __init__(self, cache_dir=OCR_CACHE_DIR, max_mb=OCR_CACHE_MAX_MB):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path      = os.path.join(cache_dir, "ocr_cache.sqlite3")
+        self.max_bytes = max_mb * 2**20
+        self._local    = threading.local()
+        with self._conn() as db:
+            db.executescript("""
+                BEGIN IMMEDIATE;
+                CREATE TABLE IF NOT EXISTS ocr_cache (
+                    key TEXT PRIMARY KEY, text TEXT NOT NULL,
+                    size INTEGER NOT NULL, last_used REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS ocr_cache_lru ON ocr_cache(last_used);
+                CREATE TABLE IF NOT EXISTS ocr_cache_total (
+                    id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL);
+                INSERT OR IGNORE INTO ocr_cache_total
+                    SELECT 0, COALESCE(SUM(size), 0) FROM ocr_cache;
+                CREATE TRIGGER IF NOT EXISTS ocr_cache_ins AFTER INSERT ON ocr_cache
+                    BEGIN UPDATE ocr_cache_total SET bytes = bytes + NEW.size; END;
+                CREATE TRIGGER IF NOT EXISTS ocr_cache_del AFTER DELETE ON ocr_cache
+                    BEGIN UPDATE ocr_cache_total SET bytes = bytes - OLD.size; END;
+                CREATE TRIGGER IF NOT EXISTS ocr_cache_upd AFTER UPDATE OF size ON ocr_cache
+                    BEGIN UPDATE ocr_cache_total SET bytes = bytes + NEW.size - OLD.size; END;
+                COMMIT;
+            """)
+
+    def _conn(self):
+        # One connection per thread and per process (never reused across fork)
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    @staticmethod
+    def key_for(img_path):
+        if isinstance(img_path, RasterImage):
+            h = hashlib.sha256(f"{img_path.width}x{img_path.height}x"
+                               f"{img_path.channels}:".encode())
+            h.update(img_path.data)
+            return f"{h.hexdigest()}:{OCR_FINGERPRINT}"
+        return f"{file_sha256(img_path)}:{OCR_FINGERPRINT}"
+
+    def get(self, key):
+        with self._conn() as db:
+            row = db.execute("SELECT text FROM ocr_cache WHERE key=?",
+                             (key,)).fetchone()
+            if row is not None:
+                db.execute("UPDATE ocr_cache SET last_used=? WHERE key=?",
+                           (time.time(), key))
+        return row[0] if row else None
+
+    def put(self, key, text):
+        with self._conn() as db:
+            # An upsert, not INSERT OR REPLACE: REPLACE's implicit delete
+            # would not fire the total-size trigger
+            db.execute("""INSERT INTO ocr_cache VALUES (?,?,?,?)
+                          ON CONFLICT(key) DO UPDATE SET text=excluded.text,
+                            size=excluded.size, last_used=excluded.last_used""",
+                       (key, text, len(text.encode()), time.time()))
+            excess = db.execute("SELECT bytes FROM ocr_cache_total").fetchone()[0] \
+                     - self.max_bytes
+            if excess > 0:
+                self._evict(db, excess)
+
+    @staticmethod
+    def _evict(db, excess, batch=256):
+        """Delete least recently used entries until `excess` bytes are freed."""
+        while excess > 0:
+            rows = db.execute("SELECT key, size FROM ocr_cache ORDER BY last_used "
+                              "LIMIT ?", (batch,)).fetchall()
+            if not rows:
+                return
+            keys = []
+            for key, size in rows:
+                keys.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            db.executemany("DELETE FROM ocr_cache WHERE key=?", keys)
+
+
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
+
+def get_ocr_cache():
+    """Shared OCRCache, or None when disabled or unavailable."""
+    global _ocr_cache
+    if OCR_CACHE_MAX_MB <= 0:
+        return None
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            try:
+                _ocr_cache = OCRCache()
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("OCR cache disabled: %s", e)
+                return None
+        return _ocr_cache
+
+def ocr_cache_lookup(img_path):
+    """(cache key, cached text or None) for an image; (None, None) without a cache."""
+    cache = get_ocr_cache()
+    if not cache or isinstance(img_path, TextLayer):
+        return None, None
+    try:
+        key = cache.key_for(img_path)
+        return key, cache.get(key)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning("OCR cache read error %s: %s", img_path, e)
+        return None, None
+
+def cached_ocr(img_path, stats=None, stats_lock=None, lookup=None):
+    """
+    OCR text for an image, served from the OCRCache when the same content
+    was already OCR'd by the same pipeline. Empty results are not cached so
+    timeouts get retried next time. PDF text layers are returned as is.
+    `lookup` is an ocr_cache_lookup() result the caller already has.
+    `stats` counts "hits", "misses" and "text_layer" pages, and totals
+    count/seconds per OCR pass under "passes".
+    """
+    if isinstance(img_path, TextLayer):
+        metrics.inc("ocr_cache_total", result="text_layer")
+        if stats is not None:
+            with stats_lock:
+                stats["text_layer"] = stats.get("text_layer", 0) + 1
+        return img_path.text
+    cache = get_ocr_cache()
+    key, txt = lookup or ocr_cache_lookup(img_path)
+    hit = txt is not None
+    info = {}
+    if not hit:
+        txt = ocr_image(img_path, info)
+        if key and txt:
+            try:
+                cache.put(key, txt)
+            except sqlite3.Error as e:
+                logger.warning("OCR cache write error %s: %s", img_path, e)
+    if cache:
+        metrics.inc("ocr_cache_total", result="hit" if hit else "miss")
+    if stats is not None:
+        with stats_lock:
+            stats["hits" if hit else "misses"] += 1
+            for p in info.get("passes", []):
+                count_secs = stats.setdefault("passes", {}).setdefault(p["pass"], [0, 0.0])
+                count_secs[0] += 1
+                count_secs[1] += p["secs"]
+    return txt
+
+class OCRShare:
+    """
+    One audit's share of OCR concurrency when several run in a process:
+    at most limit() of its images are OCR'd at once. limit() is re-read
+    whenever one of its slots frees up and on changed(), so the share
+    grows and shrinks as other audits start and finish.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._busy = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self._busy >= self.limit():
+                self._cond.wait()
+            self._busy += 1
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self._busy -= 1
+            self._cond.notify_all()
+
+    def changed(self):
+        with self._cond:
+            self._cond.notify_all()
+
+
+def ocr_images_parallel(img_paths, on_done=None, stats=None, window=None,
+                        cleanup=False, workers=None, dedup=None, known=None,
+                        share=None):
+    """
+    OCR many images concurrently on the shared pool.
+    `img_paths` may be a lazy iterable, e.g. files being extracted from a
+    ZIP: at most `window` paths are pulled ahead of finished OCR, and with
+    `cleanup` each file is deleted once OCR'd, so only a small window of
+    images is on disk at a time. Returns texts in input order, whatever
+    order the tasks finish in. `on_done(index, text)` is called as each one
+    completes; cache hits and misses are counted into `stats` if given.
+    `workers` caps how many pool workers this call keeps busy, and an
+    OCRShare as `share` caps it further by a limit that may change. With a
+    DuplicateFinder as `dedup`, near-duplicate images reuse the text of
+    the first one in their cluster instead of being OCR'd; images already
+    in the OCR cache are not hashed for it, since their text costs nothing.
+    Images whose index is in `known` ({index: text}, e.g. restored from a
+    checkpoint) are not OCR'd but still go through `dedup`, so clusters
+    come out the same as in a run that OCR'd everything.
+    """
+    if get_ocr_queue() is not None:
+        threads = workers or OCR_QUEUE_INFLIGHT
+    else:
+        threads = min(workers or get_ocr_pool().size, get_ocr_pool().size)
+    slots = threading.Semaphore(window or threads * 2)
+    stats_lock = threading.Lock()
+    texts = {}
+
+    def task(i, path):
+        try:
+            restored = known is not None and i in known
+            lookup = ocr_cache_lookup(path) if not restored else (None, None)
+            orig = None
+            if dedup is not None:
+                orig = dedup.claim(i, path if lookup[1] is None else None)
+            if orig is not None:
+                metrics.inc("ocr_duplicates_total")
+                texts[i] = dedup.text_of(orig)
+            else:
+                try:
+                    if restored:
+                        texts[i] = known[i]
+                    elif lookup[1] is not None:
+                        texts[i] = cached_ocr(path, stats, stats_lock, lookup)
+                    else:
+                        with share or nullcontext():
+                            texts[i] = cached_ocr(path, stats, stats_lock, lookup)
+                finally:
+                    if dedup is not None:
+                        dedup.publish(i, texts.get(i, ""))
+        finally:
+            if cleanup and isinstance(path, str):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            slots.release()
+        if on_done:
+            on_done(i, texts[i])
+
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        futures = []
+        paths = iter(img_paths)
+        while True:
+            slots.acquire()
+            path = next(paths, None)
+            if path is None:
+                break
+            futures.append(ex.submit(task, len(futures), path))
+        for fut in futures:
+            fut.result()
+    return [texts[i] for i in range(len(futures))]
+
+# ── Match features ────────────────────────────────────────────────────────────
+
+class BillNoForm:
+    """One normalised spelling of a bill number, compiled once."""
+    __slots__ = ("text", "tokens", "points", "pattern")
+
+    def __init__(self, text):
+        self.text    = text
+        self.tokens  = tuple(text.split())
+        self.points  = (25 if len(text) <= 4 else 35) if text.isdigit() else 45
+        self.pattern = re.compile(r'\b' + re.escape(text) + r'\b')
+
+
+@lru_cache(maxsize=4096)
+def billno_forms(bill_no):
+    """Spellings of a bill number to look for in OCR text, longest first."""
+    forms = {normalize(bill_no), normalize_billno(bill_no)}
+    digits = re.sub(r"[^0-9]", "", bill_no)
+    if len(digits) >= 3:
+        forms.add(digits)
+    forms.discard("")
+    return tuple(BillNoForm(f) for f in sorted(forms, key=len, reverse=True))
+
+
+class DocFeatures:
+    """
+    Match features of one OCR'd bill, computed once after OCR: the text,
+    its whole-word token set and the numbers extract_numbers() would find.
+    """
+    __slots__ = ("text", "words", "numbers")
+
+    def __init__(self, text):
+        self.text    = text
+        self.words   = frozenset(re.findall(r"\w+", text))
+        self.numbers = frozenset(extract_numbers(text))
+
+    def contains(self, form):
+        """Same as re.search(r'\bform\b', text); a set lookup for one token."""
+        if len(form.tokens) == 1:
+            return form.text in self.words
+        return (self.words.issuperset(form.tokens)
+                and form.pattern.search(self.text) is not None)
+
+
+class RowFeatures:
+    """
+    Normalised fields of one CSV row, computed once per row.
+    `bill_key` identifies the bill the line item belongs to: every line of
+    one bill shares the bill-number, vendor and date score components.
+    """
+    __slots__ = ("bill_no", "vendor", "item", "amount", "amt", "bill_date",
+                 "forms", "bill_key")
+
+    def __init__(self, bill_no, vendor, item, amount, bill_date):
+        self.bill_no   = bill_no
+        self.vendor    = vendor
+        self.item      = item
+        self.amount    = amount
+        self.amt       = re.sub(r"\.0+$", "", amount.strip()) if amount else ""
+        self.bill_date = bill_date
+        self.forms     = billno_forms(bill_no)
+        self.bill_key  = (bill_no, vendor, bill_date)
+
+# ── Scoring ───────────────────────────────────────────────────────────────────
+
+def bill_number_score(bill_no_raw, ocr_text, doc=None):
+    if not bill_no_raw or len(bill_no_raw) < 2:
+        return 0, False
+    forms = billno_forms(bill_no_raw)
+    for form in forms:
+        if doc.contains(form) if doc else form.pattern.search(ocr_text):
+            return form.points, True
+    best = max((fuzz.partial_ratio(f.text, ocr_text) for f in forms), default=0)
+    return best * 0.15, False
+
+
+def score_match(bill_no, vendor, item, amount_str, ocr_text, bill_date, file_date,
+                doc=None):
+    """
+    Scoring breakdown (max 100):
+      Bill number in OCR    → 0–45 pts
+      Date match (filename) → 0–25 pts  ← NEW: compensates for garbled headers
+      Vendor fuzzy          → 0–15 pts
+      Item fuzzy            → 0–30 pts  ← increased weight (most reliable signal)
+      Amount match          → 0–10 pts
+    `doc` is the bill's DocFeatures, when already computed.
+    """
+    if not ocr_text:
+        return 0
+    score, _ = bill_number_score(bill_no, ocr_text, doc)
+
+    # Date bonus: bill date from CSV vs date parsed from image filename
+    if bill_date and file_date:
+        # Normalise both to YYYY-MM-DD prefix (first 10 chars)
+        bd = str(bill_date).strip()[:10]
+        fd = str(file_date).strip()[:10]
+        if bd == fd:
+            score += 25
+
+    if vendor and len(vendor) >= 2:
+        score += fuzz.partial_ratio(vendor, ocr_text) * 0.15
+
+    if item and len(item) >= 2:
+        score += fuzz.partial_ratio(item, ocr_text) * 0.30
+
+    if amount_str:
+        amt = re.sub(r"\.0+$", "", amount_str.strip())
+        if amt in (doc.numbers if doc else extract_numbers(ocr_text)):
+            score += 10
+
+    return min(round(score, 1), 100)
+
+
+def classify(score):
+    if score >= 50:
+        return "Matched",              "Match confirmed"
+    elif score >= 30:
+        return "Mismatch / Duplicate", "Partial match — verify manually"
+    else:
+        return "Not Found",            "No matching bill image detected"
+
+# ── Candidate retrieval ───────────────────────────────────────────────────────
+
+class OCRIndex:
+    """
+    Inverted index over the OCR'd bills, built once per audit.
+    Maps word tokens, numeric amounts and filename dates to bill positions,
+    so exact bill-number, amount and date signals are looked up per row
+    instead of regex-scanning every OCR text.
+    """
+
+    def __init__(self, ocr_cache, docs):
+        self.by_token  = defaultdict(set)
+        self.by_number = defaultdict(set)
+        self.by_date   = defaultdict(set)
+        for i, ((_, _, file_date, _), doc) in enumerate(zip(ocr_cache, docs)):
+            for tok in doc.words:
+                self.by_token[tok].add(i)
+            for num in doc.numbers:
+                self.by_number[num].add(i)
+            if file_date:
+                self.by_date[str(file_date).strip()[:10]].add(i)
+
+    def billno_hits(self, form):
+        """Bills whose text contains every token of a BillNoForm."""
+        docs = set(self.by_token.get(form.tokens[0], ()))
+        for tok in form.tokens[1:]:
+            docs &= self.by_token.get(tok, set())
+        return docs
+
+
+MATCH_BLOCK_ROWS = 1000   # CSV rows scored per batched cdist call
+
+class BatchScorer:
+    """
+    Vectorised score_match over the OCR'd bills.
+    For each bill's rows, the OCRIndex gives the candidate bills: those
+    sharing an exact bill-number, date or amount signal with them. Vendor,
+    item and bill-number fuzzy ratios come from rapidfuzz cdist calls on
+    the unique strings against the candidates' texts only. A bill with no
+    exact signal scores at most the fuzzy maximum (15 + 15 + 30), so lines
+    whose best candidate that bound could still beat, or tie earlier, are
+    rescored together against every text, one cdist call per field for a
+    block of rows.
+    Scores are combined in the same order of float operations as
+    score_match, so the confidences and the first-maximum winner are
+    bit-for-bit identical to scoring every bill.
+    """
+
+    def __init__(self, ocr_cache):
+        self.texts = [text for _, _, _, text in ocr_cache]
+        self.docs  = [DocFeatures(text) for text in self.texts]
+        self.index = OCRIndex(ocr_cache, self.docs)
+        self.n     = len(self.texts)
+
+    def _ratios(self, queries, cols):
+        queries = sorted(set(queries))
+        if not queries or not len(cols):
+            return {}, np.zeros((0, len(cols)))
+        texts = self.texts if len(cols) == self.n else [self.texts[i] for i in cols]
+        m = process.cdist(queries, texts, scorer=fuzz.partial_ratio,
+                          dtype=np.float64, workers=-1)
+        return {q: k for k, q in enumerate(queries)}, m
+
+    def _candidates(self, head):
+        """Bills sharing an exact bill-number or date signal with a bill's rows."""
+        cand = set()
+        if head.bill_no and len(head.bill_no) >= 2:
+            for form in head.forms:
+                cand |= self.index.billno_hits(form)
+        if head.bill_date:
+            cand |= self.index.by_date.get(str(head.bill_date).strip()[:10], set())
+        return cand
+
+    @staticmethod
+    def _beatable(row, best_score, best_i, outside):
+        """Could a bill without exact signals, the first being `outside`, win for `row`?"""
+        bound = ((15 if row.bill_no and len(row.bill_no) >= 2 else 0)
+                 + (15 if row.vendor and len(row.vendor) >= 2 else 0)
+                 + (30 if row.item and len(row.item) >= 2 else 0))
+        return bound > best_score or (bound == best_score and bound > 0
+                                      and outside < best_i)
+
+    def _bill_vector(self, row, colpos, form_pos, form_m, vendor_pos, vendor_m):
+        """Bill number + date + vendor components, shared by all lines of a bill."""
+        vec = np.zeros(len(colpos))
+        if row.bill_no and len(row.bill_no) >= 2:
+            if row.forms:
+                vec = form_m[[form_pos[f.text] for f in row.forms]].max(axis=0) * 0.15
+            for form in reversed(row.forms):   # longest form wins, as in bill_number_score
+                for i in self.index.billno_hits(form):
+                    if i in colpos and self.docs[i].contains(form):
+                        vec[colpos[i]] = form.points
+        if row.bill_date:
+            for i in self.index.by_date.get(str(row.bill_date).strip()[:10], ()):
+                if i in colpos:
+                    vec[colpos[i]] += 25
+        vr = vendor_m[vendor_pos[row.vendor]]
+        if row.vendor and len(row.vendor) >= 2:
+            vec += vr * 0.15
+        return vec, vr
+
+    def score_rows(self, rows):
+        """
+        Best (score, position, vendor_ratio) per RowFeatures, in row order.
+        Rows are grouped by bill so the bill-level components are computed
+        once per bill and only item and amount are added per line.
+        Position is -1 and vendor_ratio 0 when no bill scores above 0.
+        """
+        if not self.n:
+            return [(0, -1, 0)] * len(rows)
+        groups = defaultdict(list)
+        for k, r in enumerate(rows):
+            groups[r.bill_key].append(k)
+
+        out = [None] * len(rows)
+        block, block_lines = [], 0
+        for positions in groups.values():
+            block.append(positions)
+            block_lines += len(positions)
+            if block_lines >= MATCH_BLOCK_ROWS:
+                self._score_block(rows, block, out)
+                block, block_lines = [], 0
+        if block:
+            self._score_block(rows, block, out)
+        return out
+
+    def _score_block(self, rows, bills, out):
+        retry = []
+        for positions in bills:
+            cols = self._candidates(rows[positions[0]])
+            for k in positions:
+                if rows[k].amount:
+                    cols |= self.index.by_number.get(rows[k].amt, set())
+            retry += self._score_lines(rows, [positions], out, sorted(cols)) \
+                     if cols else [positions]
+        if retry:
+            self._score_lines(rows, retry, out, range(self.n))
+
+    def _score_lines(self, rows, bills, out, cols):
+        """
+        Score the lines of `bills` against the texts at positions `cols`.
+        Returns the bills, cut to the lines concerned, whose best score a
+        bill outside `cols` could still beat; those lines are not set.
+        """
+        full   = len(cols) == self.n
+        colpos = {i: k for k, i in enumerate(cols)}
+        outside = next((i for i in range(self.n) if i not in colpos), self.n)
+        heads = [rows[positions[0]] for positions in bills]
+        vpos, vm = self._ratios((r.vendor for r in heads), cols)
+        fpos, fm = self._ratios((f.text for r in heads
+                                 if r.bill_no and len(r.bill_no) >= 2
+                                 for f in r.forms), cols)
+        ipos, im = self._ratios((rows[k].item for positions in bills for k in positions
+                                 if rows[k].item and len(rows[k].item) >= 2), cols)
+        retry = []
+        for head, positions in zip(heads, bills):
+            bill_vec, vr = self._bill_vector(head, colpos, fpos, fm, vpos, vm)
+            again = []
+            for k in positions:
+                r = rows[k]
+                s = bill_vec.copy()
+                if r.item and len(r.item) >= 2:
+                    s += im[ipos[r.item]] * 0.30
+                if r.amount:
+                    for i in self.index.by_number.get(r.amt, ()):
+                        if i in colpos:
+                            s[colpos[i]] += 10
+                best_score, best_k = self._first_max(s)
+                best_i = cols[best_k] if best_k >= 0 else -1
+                if not full and self._beatable(r, best_score, best_i, outside):
+                    again.append(k)
+                    continue
+                out[k] = (best_score, best_i,
+                          float(vr[best_k]) if best_k >= 0 else 0)
+            if again:
+                retry.append(again)
+        return retry
+
+    @staticmethod
+    def _first_max(s):
+        if not len(s):
+            return 0, -1
+        # Only entries that could round to the maximum need Python's round()
+        top = min(float(s.max()), 100) - 0.2
+        best_score, best_i = 0, -1
+        for i in np.flatnonzero(s >= top):
+            score = min(round(float(s[i]), 1), 100)
+            if score > best_score:
+                best_score, best_i = score, int(i)
+        return best_score, best_i
+
+# ── Reference file ────────────────────────────────────────────────────────────
+
+REFERENCE_CHUNK_ROWS = 20_000
+
+# Zoho export columns the matcher and report use, in RefRow order
+REFERENCE_COLUMNS = ["Bill Number", "Vendor Name", "Item Name", "Item Total",
+                     "Bill Date", "Branch Name", "Quantity", "Rate"]
+
+RefRow = namedtuple("RefRow", [
+    "bill_number", "vendor_name", "item_name", "item_total", "bill_date",
+    "branch_name", "quantity", "rate",
+    # derived: normalised vendor / item / total and the YYYY-MM-DD date key
+    "vendor_norm", "item_norm", "total_norm", "date_key"])
+
+def normalize_series(s):
+    """Vectorised normalize() over a string Series."""
+    return (s.str.lower()
+             .str.replace(r"[^a-z0-9\s]", " ", regex=True)
+             .str.replace(r"\s+", " ", regex=True)
+             .str.strip())
+
+def _excel_value(v):
+    """A cell value as pd.read_excel delivers it: blanks are NaN, whole floats ints."""
+    if v is None or v == "":
+        return np.nan
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+def _iter_xlsx_chunks(path, chunksize):
+    """Yield DataFrames of REFERENCE_COLUMNS from a read-only openpyxl sheet."""
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+        pos = {name: header.index(name) for name in REFERENCE_COLUMNS if name in header}
+        chunk = []
+        for values in rows:
+            if values is None or all(v is None for v in values):
+                continue
+            chunk.append([_excel_value(values[p]) if p < len(values) else np.nan
+                          for p in pos.values()])
+            if len(chunk) >= chunksize:
+                yield pd.DataFrame(chunk, columns=list(pos))
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=list(pos))
+    finally:
+        wb.close()
+
+def _iter_csv_chunks(path, chunksize):
+    for chunk in pd.read_csv(path, usecols=lambda c: c.strip() in REFERENCE_COLUMNS,
+                             chunksize=chunksize):
+        chunk.columns = chunk.columns.str.strip()
+        yield chunk
+
+def read_reference(path, chunksize=REFERENCE_CHUNK_ROWS):
+    """
+    Load the Zoho reference export as a list of RefRow tuples.
+    Only REFERENCE_COLUMNS are read; CSVs in chunks and .xlsx through a
+    read-only openpyxl sheet. Values keep pandas' default dtypes, joined
+    over the whole file, and are rendered with str() as the report has
+    always shown them: a blank cell is "nan", a numeric column with blanks
+    or decimals "1500.0". The matcher's normalised fields are computed per
+    chunk with pandas string operations.
+    """
+    chunks = _iter_csv_chunks(path, chunksize) if path.lower().endswith(".csv") \
+             else _iter_xlsx_chunks(path, chunksize)
+    frames = list(chunks)
+    if not frames:
+        return []
+    # One concat so a column's dtype is the same in every chunk (ints
+    # become floats if any chunk has a blank), as one read_csv would give
+    table = pd.concat(frames, ignore_index=True)
+    del frames
+    rows = []
+    for start in range(0, len(table), chunksize):
+        part = table.iloc[start:start + chunksize]
+        df = pd.DataFrame({c: part[c].map(str) if c in part else ""
+                           for c in REFERENCE_COLUMNS}, index=part.index)
+        df["vendor_norm"] = normalize_series(df["Vendor Name"])
+        df["item_norm"]   = normalize_series(df["Item Name"])
+        df["total_norm"]  = normalize_series(df["Item Total"])
+        df["date_key"]    = df["Bill Date"].str.strip().str[:10]
+        rows.extend(map(RefRow._make, df.itertuples(index=False, name=None)))
+    return rows
+
+# ── Matching stage ────────────────────────────────────────────────────────────
+
+def match_results(ref_rows, ocr_cache, log, update):
+    """
+    Match every RefRow against the OCR'd bills and yield one report row
+    dict per reference row, in file order, as soon as it is ready.
+    """
+    total_rows = len(ref_rows)
+    scorer = BatchScorer(ocr_cache)
+    rows = [RowFeatures(ref.bill_number, ref.vendor_norm, ref.item_norm,
+                        ref.total_norm, ref.date_key)
+            for ref in ref_rows]
+    log(f"{total_rows} rows across "
+        f"{len({r.bill_key for r in rows})} distinct bills", "info")
+    scored = scorer.score_rows(rows)
+
+    for idx, ref in enumerate(ref_rows):
+        update(68 + int((idx / max(total_rows, 1)) * 24),
+               f"Row {idx+1}/{total_rows}")
+
+        r = rows[idx]
+        bill_no, bill_date = r.bill_no, r.bill_date
+        best_score, best_i, vr = scored[idx]
+        best_path = best_fname = best_signals = ""
+        if best_i >= 0:
+            best_path, best_fname, file_date, _ = ocr_cache[best_i]
+            doc = scorer.docs[best_i]
+
+            # Build signal description
+            sigs = []
+            if any(doc.contains(f) for f in r.forms):
+                sigs.append(f"BillNo:{bill_no}")
+            if file_date and bill_date == file_date:
+                sigs.append(f"Date:{file_date}")
+            if vr >= 55: sigs.append(f"Vendor:{vr}%")
+            if r.amt and r.amt in doc.numbers: sigs.append(f"Amt:{r.amt}")
+            best_signals = " | ".join(sigs) if sigs else "item fuzzy only"
+
+        status, _ = classify(best_score)
+        t = "ok" if status=="Matched" else ("err" if status=="Not Found" else "info")
+        log(f"{status} ({best_score}) | {bill_no} | "
+            f"{ref.vendor_name[:15]} | {best_signals}", t)
+        yield {
+            "file_name":        best_fname,
+            "folder":           os.path.dirname(best_path) if best_path else "",
+            "bill_number":      bill_no,
+            "bill_date":        ref.bill_date,
+            "vendor_name":      ref.vendor_name,
+            "customer_name":    ref.branch_name,
+            "item_description": ref.item_name,
+            "quantity":         ref.quantity,
+            "rate":             ref.rate,
+            "total_amount":     ref.item_total,
+            "confidence":       best_score,
+            "match_status":     status,
+            "match_detail":     best_signals,
+        }
+
+def unmatched_results(ocr_cache):
+    """Report rows when no reference file was given: one per OCR'd bill."""
+    for img_path, fname, file_date, _ in ocr_cache:
+        yield {
+            "file_name":fname,"folder":"","bill_number":"","bill_date":"",
+            "vendor_name":"","customer_name":"","item_description":"",
+            "quantity":"","rate":"","total_amount":"",
+            "confidence":"","match_status":"No CSV","match_detail":""
+        }
+
+def tally(results, summary):
+    """Pass results through while counting them into `summary`."""
+    for r in results:
+        summary["total"] += 1
+        if r["match_status"] == "Matched":
+            summary["matched"] += 1
+        elif r["match_status"] in ("Not Found", "Mismatch / Duplicate"):
+            summary["mismatch"] += 1
+        yield r
+
+# ── Excel writer ──────────────────────────────────────────────────────────────
+
+REPORT_HEADERS = ["File Name","Folder","Bill Number","Bill Date","Vendor Name",
+                  "Customer/Hotel","Item Description","Quantity","Rate (Rs)",
+                  "Total Amount (Rs)","AI Confidence","Match Status","Match Detail"]
+REPORT_FIELDS  = ["file_name","folder","bill_number","bill_date","vendor_name",
+                  "customer_name","item_description","quantity","rate",
+                  "total_amount","confidence","match_status","match_detail"]
+REPORT_WIDTHS  = [22,18,15,12,30,25,25,10,12,15,12,14,35]
+
+def _report_styles():
+    from openpyxl.styles import PatternFill, Font, Alignment, NamedStyle
+    def fill(color):
+        return PatternFill(start_color=color, end_color=color, fill_type="solid")
+    mid = Alignment(vertical="center")
+    return [
+        NamedStyle("audit_header", fill=fill("1E3A5F"),
+                   font=Font(bold=True, color="FFFFFF", size=11),
+                   alignment=Alignment(horizontal="center", vertical="center")),
+        NamedStyle("audit_matched",   fill=fill("C6EFCE"), alignment=mid),
+        NamedStyle("audit_not_found", fill=fill("FFC7CE"), alignment=mid),
+        NamedStyle("audit_review",    fill=fill("FFEB9C"), alignment=mid),
+        NamedStyle("audit_plain",     alignment=mid),
+    ]
+
+DUPLICATE_HEADERS = ["File Name", "Folder", "Duplicate Of", "Original Folder",
+                     "Hash Distance (bits)"]
+DUPLICATE_WIDTHS  = [22, 18, 22, 18, 12]
+
+def generate_excel(results, output_path, timings=None, duplicates=()):
+    """
+    Write the audit report with a streaming (write-only) workbook.
+    `results` may be any iterable of result dicts, e.g. a generator fed by
+    the matcher, so rows are written as they are produced; every cell
+    shares one of a few named styles instead of carrying its own.
+    `timings()`, if given, is called after the last row and its
+    {stage: seconds} written to a second "Timings" sheet. `duplicates`,
+    (rel_path, original_rel_path, distance) tuples of images whose OCR was
+    skipped as near-duplicates, are listed on a "Duplicates" sheet.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Audit Report")
+    for style in _report_styles():
+        wb.add_named_style(style)
+    for col, width in enumerate(REPORT_WIDTHS, 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    ws.freeze_panes = "A2"
+    ws.row_dimensions[1].height = 30
+
+    def styled(value, style):
+        c = WriteOnlyCell(ws, value=value)
+        c.style = style
+        return c
+
+    ws.append([styled(h, "audit_header") for h in REPORT_HEADERS])
+    for r in results:
+        s = r.get("match_status","")
+        style = "audit_matched" if s=="Matched" else "audit_not_found" if s=="Not Found" \
+                else "audit_review" if "Mismatch" in s else "audit_plain"
+        ws.append([styled(r.get(f, ""), style) for f in REPORT_FIELDS])
+    if duplicates:
+        ds = wb.create_sheet("Duplicates")
+        for col, width in enumerate(DUPLICATE_WIDTHS, 1):
+            ds.column_dimensions[get_column_letter(col)].width = width
+        ds.append([styled(h, "audit_header") for h in DUPLICATE_HEADERS])
+        for rel, original, distance in duplicates:
+            ds.append([styled(v, "audit_review") for v in (
+                os.path.basename(rel), os.path.dirname(rel),
+                os.path.basename(original), os.path.dirname(original), distance)])
+    if timings is not None:
+        stages = timings()
+        ts = wb.create_sheet("Timings")
+        ts.column_dimensions["A"].width = 18
+        ts.column_dimensions["B"].width = 12
+        ts.append([styled("Stage", "audit_header"), styled("Seconds", "audit_header")])
+        for name, secs in stages.items():
+            ts.append([styled(name, "audit_plain"), styled(secs, "audit_plain")])
+        ts.append([styled("total", "audit_plain"),
+                   styled(round(sum(stages.values()), 3), "audit_plain")])
+    wb.save(output_path)
+
+# ── Job store ─────────────────────────────────────────────────────────────────
+
+JOB_DB_PATH         = os.environ.get("JOB_DB_PATH", "/tmp/audit_jobs.sqlite3")
+JOB_TTL_HOURS       = float(os.environ.get("JOB_TTL_HOURS", 24))
+JOB_MAX_FINISHED    = int(os.environ.get("JOB_MAX_FINISHED", 50))
+JOB_LOG_LIMIT       = int(os.environ.get("JOB_LOG_LIMIT", 500))
+JOB_LOG_BATCH       = int(os.environ.get("JOB_LOG_BATCH", 50))
+JOB_LOG_FLUSH_SECS  = float(os.environ.get("JOB_LOG_FLUSH_SECS", 0.5))
+JOB_STALE_HOURS     = float(os.environ.get("JOB_STALE_HOURS", 6))
+JOB_HEARTBEAT_SECS  = float(os.environ.get("JOB_HEARTBEAT_SECS", 30))
+JOB_HEARTBEAT_TIMEOUT = float(os.environ.get("JOB_HEARTBEAT_TIMEOUT", 180))
+JANITOR_INTERVAL    = int(os.environ.get("JANITOR_INTERVAL", 300))
+SSE_POLL_INTERVAL   = float(os.environ.get("SSE_POLL_INTERVAL", 0.5))
+SSE_HEARTBEAT       = int(os.environ.get("SSE_HEARTBEAT", 15))
+MAX_CONCURRENT_AUDITS = int(os.environ.get("MAX_CONCURRENT_AUDITS", 1))
+JOB_QUEUE_SIZE      = int(os.environ.get("JOB_QUEUE_SIZE", 10))
+QUEUE_RETRY_AFTER   = int(os.environ.get("QUEUE_RETRY_AFTER", 60))
+JOB_CORPUS_MAX_MB   = int(os.environ.get("JOB_CORPUS_MAX_MB", 200))
+
+JOB_FIELDS = ("status", "progress", "step", "summary", "error", "report_path",
+              "inputs", "created", "updated")
+
+
+class JobStore(ABC):
+    """
+    Where audit jobs live. Every gunicorn worker must see the same jobs,
+    so /status and /download work whichever worker a request lands on.
+    Jobs are plain dicts with JOB_FIELDS; logs are a per-job ring buffer of
+    the last JOB_LOG_LIMIT lines, numbered by a per-job sequence.
+    """
+
+    @abstractmethod
+    def create(self, job_id, **fields):
+        """Store a new job."""
+
+    @abstractmethod
+    def get(self, job_id):
+        """The job dict, or None if unknown."""
+
+    @abstractmethod
+    def update(self, job_id, **fields):
+        """Set some of a job's JOB_FIELDS."""
+
+    @abstractmethod
+    def append_logs(self, job_id, entries):
+        """Append (msg, type) log lines."""
+
+    @abstractmethod
+    def take_new_logs(self, job_id):
+        """Log lines not handed out by a previous call."""
+
+    @abstractmethod
+    def logs_since(self, job_id, after_seq):
+        """Log lines with seq > after_seq, oldest first."""
+
+    @abstractmethod
+    def enqueue(self, job_id, inputs, limit):
+        """Queue a job unless `limit` are queued or running; False when full."""
+
+    @abstractmethod
+    def claim_next(self, max_running, owner):
+        """Start the oldest queued job if a slot is free: (job_id, inputs) or None."""
+
+    @abstractmethod
+    def heartbeat(self, owner):
+        """Mark the jobs `owner` is running as alive."""
+
+    @abstractmethod
+    def reap_orphans(self, timeout):
+        """Requeue or fail running jobs whose process is gone."""
+
+    @abstractmethod
+    def queue_position(self, job_id):
+        """1-based position among queued jobs, or None if not queued."""
+
+    @abstractmethod
+    def active_count(self):
+        """Number of queued and running jobs."""
+
+    @abstractmethod
+    def put_corpus(self, job_id, blob):
+        """Keep a job's packed OCR corpus for re-audits."""
+
+    @abstractmethod
+    def get_corpus(self, job_id):
+        """A job's packed OCR corpus, or None once evicted."""
+
+    @abstractmethod
+    def put_results(self, job_id, sheet, group, columns):
+        """Store one row group of a result sheet as {field: bytes}."""
+
+    @abstractmethod
+    def result_groups(self, job_id, sheet):
+        """Row group numbers stored for a sheet, in order."""
+
+    @abstractmethod
+    def get_results(self, job_id, sheet, group, fields):
+        """{field: bytes} of one row group."""
+
+    @abstractmethod
+    def put_metrics(self, process_key, snapshot):
+        """Store a process's metrics snapshot."""
+
+    @abstractmethod
+    def all_metrics(self):
+        """{process key: snapshot} for every process that has flushed."""
+
+    @abstractmethod
+    def evict(self):
+        """Drop expired finished jobs and everything stored with them."""
+
+
+class SQLiteJobStore(JobStore):
+    """
+    JobStore in one SQLite file (WAL mode) shared by all processes on the
+    host. evict() drops finished jobs past JOB_TTL_HOURS or beyond the
+    newest JOB_MAX_FINISHED, together with their report files, stored
+    results and retained OCR corpus. The file is only created on first
+    use, so the batch CLI, which never touches jobs, leaves no database.
+    """
+
+    def __init__(self, path=JOB_DB_PATH):
+        self.path         = path
+        self._local       = threading.local()
+        self._schema_pid  = None
+        self._schema_lock = threading.Lock()
+
+    def _create_schema(self, db):
+        with db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY, status TEXT, progress INTEGER,
+                    step TEXT, summary TEXT, error TEXT, report_path TEXT,
+                    created REAL, updated REAL, finished REAL,
+                    log_seq INTEGER DEFAULT 0, delivered_seq INTEGER DEFAULT 0,
+                    inputs TEXT, owner TEXT, heartbeat REAL);
+                CREATE TABLE IF NOT EXISTS job_logs (
+                    job_id TEXT, seq INTEGER, msg TEXT, type TEXT,
+                    PRIMARY KEY (job_id, seq));
+                CREATE TABLE IF NOT EXISTS job_corpus (
+                    job_id TEXT PRIMARY KEY, data BLOB, bytes INTEGER,
+                    created REAL);
+                CREATE TABLE IF NOT EXISTS job_results (
+                    job_id TEXT, sheet TEXT, grp INTEGER, field TEXT, data BLOB,
+                    PRIMARY KEY (job_id, sheet, grp, field));
+                CREATE TABLE IF NOT EXISTS metric_snapshots (
+                    process TEXT PRIMARY KEY, data TEXT, updated REAL);
+                CREATE INDEX IF NOT EXISTS jobs_finished ON jobs(finished);
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created);
+            """)
+
+    def _conn(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, os.getpid()
+            with self._schema_lock:
+                if self._schema_pid != os.getpid():
+                    self._create_schema(db)
+                    self._schema_pid = os.getpid()
+        return db
+
+    @staticmethod
+    def _row_to_job(row):
+        job = {k: row[k] for k in JOB_FIELDS}
+        job["summary"] = json.loads(job["summary"] or "{}")
+        job["inputs"]  = json.loads(job["inputs"] or "{}")
+        return job
+
+    def create(self, job_id, **fields):
+        now = time.time()
+        job = {"status": "processing", "progress": 0, "step": "", "summary": {},
+               "error": None, "report_path": None, **fields}
+        with self._conn() as db:
+            db.execute("""INSERT INTO jobs (id, status, progress, step, summary,
+                            error, report_path, created, updated)
+                          VALUES (?,?,?,?,?,?,?,?,?)""",
+                       (job_id, job["status"], job["progress"], job["step"],
+                        json.dumps(job["summary"]), job["error"],
+                        job["report_path"], now, now))
+
+    def get(self, job_id):
+        row = self._conn().execute("SELECT * FROM jobs WHERE id=?",
+                                   (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def update(self, job_id, **fields):
+        fields = {k: v for k, v in fields.items() if k in JOB_FIELDS}
+        for k in ("summary", "inputs"):
+            if k in fields:
+                fields[k] = json.dumps(fields[k])
+        fields["updated"] = fields["heartbeat"] = time.time()
+        if fields.get("status") in ("done", "error"):
+            fields["finished"] = fields["updated"]
+        cols = ", ".join(f"{k}=?" for k in fields)
+        with self._conn() as db:
+            db.execute(f"UPDATE jobs SET {cols} WHERE id=?",
+                       (*fields.values(), job_id))
+
+    def append_logs(self, job_id, entries):
+        """Append (msg, type) log lines in one transaction."""
+        with self._conn() as db:
+            db.execute("UPDATE jobs SET log_seq = log_seq + ? WHERE id=?",
+                       (len(entries), job_id))
+            seq = db.execute("SELECT log_seq FROM jobs WHERE id=?",
+                             (job_id,)).fetchone()
+            if seq is None:
+                return
+            first = seq[0] - len(entries) + 1
+            db.executemany("INSERT INTO job_logs VALUES (?,?,?,?)",
+                           [(job_id, first + k, msg, type_)
+                            for k, (msg, type_) in enumerate(entries)])
+            db.execute("DELETE FROM job_logs WHERE job_id=? AND seq<=?",
+                       (job_id, seq[0] - JOB_LOG_LIMIT))
+
+    def take_new_logs(self, job_id):
+        """Log lines not handed out by a previous call (atomic hand-off)."""
+        with self._conn() as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT delivered_seq, log_seq FROM jobs WHERE id=?",
+                             (job_id,)).fetchone()
+            if row is None:
+                return []
+            logs = db.execute("""SELECT msg, type FROM job_logs
+                                 WHERE job_id=? AND seq>? ORDER BY seq""",
+                              (job_id, row["delivered_seq"])).fetchall()
+            db.execute("UPDATE jobs SET delivered_seq=? WHERE id=?",
+                       (row["log_seq"], job_id))
+        return [{"msg": r["msg"], "type": r["type"]} for r in logs]
+
+    def logs_since(self, job_id, after_seq):
+        """Log lines with seq > after_seq still in the ring buffer, oldest first."""
+        rows = self._conn().execute("""SELECT seq, msg, type FROM job_logs
+                                       WHERE job_id=? AND seq>? ORDER BY seq""",
+                                    (job_id, after_seq)).fetchall()
+        return [{"seq": r["seq"], "msg": r["msg"], "type": r["type"]} for r in rows]
+
+    def enqueue(self, job_id, inputs, limit):
+        """
+        Queue a job for the scheduler unless `limit` jobs are already
+        queued or running. Returns False (and stores nothing) when full.
+        """
+        now = time.time()
+        with self._conn() as db:
+            db.execute("BEGIN IMMEDIATE")
+            active = db.execute("""SELECT COUNT(*) FROM jobs
+                                   WHERE status IN ('queued', 'processing')""").fetchone()[0]
+            if active >= limit:
+                return False
+            db.execute("""INSERT INTO jobs (id, status, progress, step, summary,
+                            inputs, created, updated)
+                          VALUES (?, 'queued', 0, 'Waiting in queue...', '{}', ?, ?, ?)""",
+                       (job_id, json.dumps(inputs), now, now))
+        return True
+
+    def claim_next(self, max_running, owner):
+        """
+        Atomically move the oldest queued job to 'processing' if fewer than
+        `max_running` jobs are running, recording `owner` ("host:pid") as
+        the process running it. Returns (job_id, inputs) or None.
+        """
+        with self._conn() as db:
+            db.execute("BEGIN IMMEDIATE")
+            running = db.execute("SELECT COUNT(*) FROM jobs WHERE status='processing'"
+                                 ).fetchone()[0]
+            if running >= max_running:
+                return None
+            row = db.execute("""SELECT id, inputs FROM jobs WHERE status='queued'
+                                ORDER BY created LIMIT 1""").fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            db.execute("""UPDATE jobs SET status='processing', progress=5,
+                            step='Files received...', updated=?, owner=?,
+                            heartbeat=? WHERE id=?""",
+                       (now, owner, now, row["id"]))
+        return row["id"], json.loads(row["inputs"] or "{}")
+
+    def heartbeat(self, owner):
+        """Mark every job `owner` is running as still alive."""
+        with self._conn() as db:
+            db.execute("""UPDATE jobs SET heartbeat=?
+                          WHERE status='processing' AND owner=?""", (time.time(), owner))
+
+    def reap_orphans(self, timeout):
+        """
+        Release the slots of 'processing' jobs whose process is gone: no
+        heartbeat for `timeout` seconds, or an owner pid on this host that
+        no longer exists. Such a job is queued again once if its uploaded
+        files are still on disk, otherwise (or the second time) it fails.
+        Returns {job_id: "queued" | "error"}.
+        """
+        now, host = time.time(), socket.gethostname()
+        reaped = {}
+        with self._conn() as db:
+            db.execute("BEGIN IMMEDIATE")
+            for row in db.execute("""SELECT id, owner, heartbeat, updated, inputs
+                                     FROM jobs WHERE status='processing'""").fetchall():
+                owner_host, _, pid = (row["owner"] or "").rpartition(":")
+                beat = row["heartbeat"] or row["updated"] or 0
+                if beat >= now - timeout and not (owner_host == host and pid.isdigit()
+                                                  and not _pid_alive(int(pid))):
+                    continue
+                inputs = json.loads(row["inputs"] or "{}")
+                paths  = [inputs.get(k) for k in ("zip_path", "csv_path") if inputs.get(k)]
+                if paths and not inputs.get("requeued") and all(map(os.path.exists, paths)):
+                    inputs["requeued"] = True
+                    db.execute("""UPDATE jobs SET status='queued', progress=0,
+                                    step='Waiting in queue...', owner=NULL, heartbeat=NULL,
+                                    inputs=?, updated=? WHERE id=?""",
+                               (json.dumps(inputs), now, row["id"]))
+                    reaped[row["id"]] = "queued"
+                else:
+                    db.execute("""UPDATE jobs SET status='error', finished=?, updated=?,
+                                    error='Interrupted: the server process running this audit stopped'
+                                  WHERE id=?""", (now, now, row["id"]))
+                    reaped[row["id"]] = "error"
+        for job_id, status in reaped.items():
+            self.append_logs(job_id, [(
+                "The server process running this audit stopped; "
+                + ("it was queued again" if status == "queued" else "giving up"), "err")])
+        return reaped
+
+    def queue_position(self, job_id):
+        """1-based position among queued jobs, or None if not queued."""
+        row = self._conn().execute("""SELECT COUNT(*) FROM jobs q, jobs j
+                                      WHERE j.id=? AND j.status='queued'
+                                        AND q.status='queued' AND q.created<=j.created""",
+                                   (job_id,)).fetchone()
+        return row[0] or None
+
+    def active_count(self):
+        return self._conn().execute("""SELECT COUNT(*) FROM jobs
+                                       WHERE status IN ('queued', 'processing')"""
+                                    ).fetchone()[0]
+
+    def put_corpus(self, job_id, blob):
+        with self._conn() as db:
+            db.execute("INSERT OR REPLACE INTO job_corpus VALUES (?,?,?,?)",
+                       (job_id, blob, len(blob), time.time()))
+
+    def get_corpus(self, job_id):
+        row = self._conn().execute("SELECT data FROM job_corpus WHERE job_id=?",
+                                   (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def put_results(self, job_id, sheet, group, columns):
+        """Store one row group of a result sheet: {field: compressed column}."""
+        with self._conn() as db:
+            db.executemany("INSERT OR REPLACE INTO job_results VALUES (?,?,?,?,?)",
+                           [(job_id, sheet, group, f, blob) for f, blob in columns.items()])
+
+    def result_groups(self, job_id, sheet):
+        return [r[0] for r in self._conn().execute(
+            """SELECT DISTINCT grp FROM job_results WHERE job_id=? AND sheet=?
+               ORDER BY grp""", (job_id, sheet))]
+
+    def get_results(self, job_id, sheet, group, fields):
+        marks = ",".join("?" * len(fields))
+        return {r[0]: r[1] for r in self._conn().execute(
+            f"""SELECT field, data FROM job_results
+                WHERE job_id=? AND sheet=? AND grp=? AND field IN ({marks})""",
+            (job_id, sheet, group, *fields))}
+
+    def put_metrics(self, process_key, snapshot):
+        with self._conn() as db:
+            db.execute("INSERT OR REPLACE INTO metric_snapshots VALUES (?,?,?)",
+                       (process_key, json.dumps(snapshot), time.time()))
+
+    def all_metrics(self):
+        """{process key: snapshot} for every process that has flushed."""
+        return {r[0]: json.loads(r[1]) for r in
+                self._conn().execute("SELECT process, data FROM metric_snapshots")}
+
+    def _delete(self, db, job_ids):
+        for job_id in job_ids:
+            row = db.execute("SELECT report_path FROM jobs WHERE id=?",
+                             (job_id,)).fetchone()
+            if row and row["report_path"]:
+                try:
+                    os.remove(row["report_path"])
+                except OSError:
+                    pass
+            db.execute("DELETE FROM job_logs WHERE job_id=?", (job_id,))
+            db.execute("DELETE FROM job_corpus WHERE job_id=?", (job_id,))
+            db.execute("DELETE FROM job_results WHERE job_id=?", (job_id,))
+            db.execute("DELETE FROM jobs WHERE id=?", (job_id,))
+
+    def evict(self):
+        now = time.time()
+        with self._conn() as db:
+            expired = [r[0] for r in db.execute(
+                "SELECT id FROM jobs WHERE finished IS NOT NULL AND finished<?",
+                (now - JOB_TTL_HOURS * 3600,))]
+            surplus = [r[0] for r in db.execute(
+                """SELECT id FROM jobs WHERE finished IS NOT NULL
+                   ORDER BY finished DESC LIMIT -1 OFFSET ?""", (JOB_MAX_FINISHED,))]
+            self._delete(db, set(expired) | set(surplus))
+            # Retained OCR corpora share one size budget; past it the oldest
+            # are dropped (their jobs stay, but can no longer be re-audited)
+            db.execute("""DELETE FROM job_corpus WHERE job_id IN (
+                            SELECT job_id FROM (
+                              SELECT job_id, SUM(bytes) OVER (ORDER BY created DESC)
+                                     AS running FROM job_corpus)
+                            WHERE running > ?)""", (JOB_CORPUS_MAX_MB * 1024 * 1024,))
+            # Snapshots of processes gone for a day; their counters reset
+            db.execute("DELETE FROM metric_snapshots WHERE updated<?",
+                       (now - JOB_TTL_HOURS * 3600,))
+            known = {r[0] for r in db.execute("SELECT report_path FROM jobs")}
+        # Reports nobody references any more (e.g. from before a DB reset)
+        for name in os.listdir(REPORT_FOLDER):
+            path = os.path.join(REPORT_FOLDER, name)
+            try:
+                if path not in known and os.path.getmtime(path) < now - JOB_TTL_HOURS * 3600:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+job_store = SQLiteJobStore()
+
+_janitor_pid = None
+_janitor_lock = threading.Lock()
+_metrics_key = None
+
+def start_janitor():
+    """Start this process's eviction and metrics-flush threads (once per process)."""
+    global _janitor_pid, _metrics_key
+    with _janitor_lock:
+        if _janitor_pid == os.getpid():
+            return
+        _janitor_pid = os.getpid()
+        _metrics_key = f"{os.getpid()}-{int(time.time())}"
+    process_key = _metrics_key
+
+    def loop():
+        while True:
+            try:
+                job_store.reap_orphans(JOB_HEARTBEAT_TIMEOUT)
+                job_store.evict()
+                if get_ocr_queue() is not None:
+                    get_ocr_queue().purge(JOB_STALE_HOURS * 3600)
+                ChunkedUpload.purge(UPLOAD_TTL_HOURS * 3600)
+            except Exception:
+                logger.exception("Job janitor error")
+            time.sleep(JANITOR_INTERVAL)
+
+    threading.Thread(target=loop, daemon=True, name="job-janitor").start()
+
+    def flush_metrics():
+        while True:
+            time.sleep(METRICS_FLUSH_SECS)
+            try:
+                job_store.put_metrics(process_key, metrics.snapshot())
+            except sqlite3.Error as e:
+                logger.warning("Metrics flush error: %s", e)
+
+    threading.Thread(target=flush_metrics, daemon=True, name="metrics-flush").start()
+
+
+class AuditScheduler:
+    """
+    Runs queued audits, at most MAX_CONCURRENT_AUDITS at a time across all
+    processes sharing the job store. /start only enqueues; every process
+    runs one dispatcher thread that claims the oldest queued job whenever
+    a slot is free, so a job queued by one gunicorn worker may be run by
+    another. Audits running in one process split its OCR pool evenly
+    (OCRShare), re-balanced whenever one of them starts or finishes.
+
+    Claimed jobs record this process as their owner, and the dispatcher
+    refreshes their heartbeat every JOB_HEARTBEAT_SECS. Jobs left behind
+    by a dead process are requeued or failed by reap_orphans() when a
+    scheduler starts and on every heartbeat, so they do not hold a slot.
+    """
+
+    def __init__(self, store, max_running=MAX_CONCURRENT_AUDITS, poll=1.0):
+        self.store       = store
+        self.max_running = max_running
+        self.poll        = poll
+        self._wake       = threading.Event()
+        self._pid        = None
+        self._lock       = threading.Lock()
+        self._shares     = {}
+
+    def ocr_limit(self):
+        """OCR tasks each audit running in this process may have in flight."""
+        total = OCR_QUEUE_INFLIGHT if get_ocr_queue() is not None else get_ocr_pool().size
+        with self._lock:
+            running = len(self._shares)
+        return max(1, total // max(1, running))
+
+    def _set_share(self, job_id, share):
+        with self._lock:
+            if share is None:
+                self._shares.pop(job_id, None)
+            else:
+                self._shares[job_id] = share
+            shares = list(self._shares.values())
+        for s in shares:
+            s.changed()
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._loop, daemon=True, name="audit-scheduler").start()
+
+    @property
+    def owner(self):
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self):
+        last_beat = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_beat >= JOB_HEARTBEAT_SECS:
+                    last_beat = time.monotonic()
+                    self.store.heartbeat(self.owner)
+                    self.store.reap_orphans(JOB_HEARTBEAT_TIMEOUT)
+                while True:
+                    claimed = self.store.claim_next(self.max_running, self.owner)
+                    if claimed is None:
+                        break
+                    job_id, inputs = claimed
+                    threading.Thread(target=self._run, args=(job_id, inputs),
+                                     daemon=True, name=f"audit-{job_id}").start()
+            except Exception:
+                logger.exception("Audit scheduler error")
+            self._wake.wait(self.poll)
+            self._wake.clear()
+
+    def _run(self, job_id, inputs):
+        try:
+            if inputs.get("reaudit_of"):
+                run_reaudit(job_id, inputs["reaudit_of"], inputs["work_dir"],
+                            inputs["csv_path"])
+            else:
+                share = OCRShare(self.ocr_limit)
+                self._set_share(job_id, share)
+                run_audit(job_id, inputs["work_dir"], inputs["zip_path"],
+                          inputs.get("csv_path"), ocr_share=share)
+        finally:
+            self._set_share(job_id, None)
+            self.wake()
+
+
+scheduler = AuditScheduler(job_store)
+
+# ── Result columns ────────────────────────────────────────────────────────────
+
+RESULTS_GROUP_ROWS = int(os.environ.get("RESULTS_GROUP_ROWS", 5000))
+RESULTS_PAGE_MAX   = 1000
+DUPLICATE_FIELDS   = ["rel_path", "original_rel_path", "distance"]
+EXPORT_FORMATS     = {"csv": "text/csv", "jsonl": "application/x-ndjson",
+                      "parquet": "application/vnd.apache.parquet"}
+
+class ResultColumns:
+    """
+    A job's report rows kept column by column in the job store, in row
+    groups of RESULTS_GROUP_ROWS (each group/field one compressed JSON
+    list), much like a Parquet file. Filters only decode the columns they
+    test, a page only decodes the groups it touches, and exports stream
+    one group at a time, so no request holds the whole report in memory.
+    """
+
+    def __init__(self, store, job_id, sheet="results", fields=REPORT_FIELDS):
+        self.store  = store
+        self.job_id = job_id
+        self.sheet  = sheet
+        self.fields = fields
+
+    def write(self, rows):
+        """Store an iterable of row dicts; returns the number of rows."""
+        group, buf, count = 0, [], 0
+        for r in rows:
+            buf.append(r)
+            count += 1
+            if len(buf) == RESULTS_GROUP_ROWS:
+                self._put(group, buf)
+                group, buf = group + 1, []
+        if buf or not group:
+            self._put(group, buf)
+        return count
+
+    def _put(self, group, rows):
+        self.store.put_results(self.job_id, self.sheet, group, {
+            f: zlib.compress(json.dumps([r.get(f, "") for r in rows],
+                                        separators=(",", ":")).encode(), 6)
+            for f in self.fields})
+
+    def exists(self):
+        return bool(self.store.result_groups(self.job_id, self.sheet))
+
+    def groups(self, fields=None, groups=None):
+        """Yield (group, {field: values}) in row order, decoding only `fields`."""
+        fields = fields or self.fields
+        for group in (self.store.result_groups(self.job_id, self.sheet)
+                      if groups is None else groups):
+            blobs = self.store.get_results(self.job_id, self.sheet, group, fields)
+            yield group, {f: json.loads(zlib.decompress(blobs[f])) for f in fields}
+
+    def rows(self):
+        for _, cols in self.groups():
+            for values in zip(*(cols[f] for f in self.fields)):
+                yield dict(zip(self.fields, values))
+
+    def select(self, statuses=None, min_confidence=None, max_confidence=None):
+        """(group, position) of every row passing the filters, in row order."""
+        ranged = min_confidence is not None or max_confidence is not None
+        fields = ["match_status"] + (["confidence"] if ranged else [])
+        picked = []
+        for group, cols in self.groups(fields):
+            for i, status in enumerate(cols["match_status"]):
+                if statuses and status not in statuses:
+                    continue
+                if ranged:
+                    conf = cols["confidence"][i]
+                    if not isinstance(conf, (int, float)) \
+                       or (min_confidence is not None and conf < min_confidence) \
+                       or (max_confidence is not None and conf > max_confidence):
+                        continue
+                picked.append((group, i))
+        return picked
+
+    def page(self, picked):
+        """Row dicts for (group, position) pairs from select()."""
+        decoded = dict(self.groups(groups=sorted({g for g, _ in picked})))
+        return [{f: decoded[g][f][i] for f in self.fields} for g, i in picked]
+
+
+def store_results(job_id, rows, duplicates=()):
+    """Store a finished job's report rows and duplicate list; returns the row count."""
+    ResultColumns(job_store, job_id, "duplicates", DUPLICATE_FIELDS).write(
+        dict(zip(DUPLICATE_FIELDS, d)) for d in duplicates)
+    return ResultColumns(job_store, job_id).write(rows)
+
+def excel_report(job_id, job):
+    """
+    Path of the job's Excel report, built from its stored results on the
+    first download and kept at job["report_path"] for later ones. None if
+    the job has neither.
+    """
+    report_path = job["report_path"]
+    if os.path.exists(report_path):
+        return report_path
+    results = ResultColumns(job_store, job_id)
+    if not results.exists():
+        return None
+    duplicates = [(d["rel_path"], d["original_rel_path"], d["distance"]) for d in
+                  ResultColumns(job_store, job_id, "duplicates", DUPLICATE_FIELDS).rows()]
+    stages = job["summary"].get("timings")
+    # Concurrent first downloads may both build it; the last rename wins
+    tmp = f"{report_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        generate_excel(results.rows(), tmp, timings=(lambda: stages) if stages else None,
+                       duplicates=duplicates)
+        os.replace(tmp, report_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return report_path
+
+def export_results(results, fmt):
+    """Stream stored results as CSV, JSON lines or Parquet, one row group at a time."""
+    fields = results.fields
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(fields)
+        for _, cols in results.groups():
+            writer.writerows(zip(*(cols[f] for f in fields)))
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    elif fmt == "jsonl":
+        for _, cols in results.groups():
+            yield "".join(json.dumps(dict(zip(fields, values))) + "\n"
+                          for values in zip(*(cols[f] for f in fields)))
+    elif fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([(f, pa.float64() if f == "confidence" else pa.string())
+                            for f in fields])
+        sink = _StreamSink()
+        writer = pq.ParquetWriter(sink, schema)
+        for _, cols in results.groups():
+            writer.write_table(pa.table({
+                f: [v if isinstance(v, (int, float)) else None for v in cols[f]]
+                   if f == "confidence" else [str(v) for v in cols[f]]
+                for f in fields}, schema=schema))
+            yield sink.take()
+        writer.close()
+        yield sink.take()
+
+class _StreamSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last take()."""
+
+    def __init__(self):
+        super().__init__()
+        self._pending, self._written = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._pending.append(bytes(data))
+        self._written += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._written
+
+    def take(self):
+        out, self._pending = b"".join(self._pending), []
+        return out
+
+
+# ── Background worker ─────────────────────────────────────────────────────────
+
+def pack_corpus(ocr_cache, duplicates=()):
+    """Serialise an OCR corpus (the ocr_cache tuples) to a compressed blob."""
+    data = {"corpus": ocr_cache, "duplicates": list(duplicates)}
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 6)
+
+def unpack_corpus(blob):
+    """(ocr_cache, duplicates) from pack_corpus()."""
+    data = json.loads(zlib.decompress(blob))
+    return ([tuple(entry) for entry in data["corpus"]],
+            [tuple(entry) for entry in data["duplicates"]])
+
+def job_reporter(job_id):
+    """
+    log(), update() and flush() callbacks that write to the job store.
+    The matcher logs every row, so log lines are buffered and written one
+    transaction per JOB_LOG_BATCH lines or JOB_LOG_FLUSH_SECS, and before
+    each persisted progress update; call flush() before the job finishes.
+    """
+    last_update = [0.0, None]
+    pending, last_flush = [], [time.monotonic()]
+    lock = threading.Lock()
+
+    def flush():
+        with lock:
+            if pending:
+                job_store.append_logs(job_id, pending[:])
+                pending.clear()
+            last_flush[0] = time.monotonic()
+
+    def log(msg, t="info"):
+        with lock:
+            pending.append((msg, t))
+            due = (len(pending) >= JOB_LOG_BATCH
+                   or time.monotonic() - last_flush[0] >= JOB_LOG_FLUSH_SECS)
+        if due:
+            flush()
+
+    def update(progress, step):
+        # Progress changes on every image/row; only persist it when the
+        # percentage moves or twice a second
+        now = time.monotonic()
+        if progress != last_update[1] or now - last_update[0] >= 0.5:
+            last_update[:] = [now, progress]
+            flush()
+            job_store.update(job_id, progress=progress, step=step)
+
+    return log, update, flush
+
+def load_reference(csv_path, log, update):
+    if not (csv_path and os.path.exists(csv_path)):
+        return None
+    update(8, "Reading reference file...")
+    try:
+        ref_rows = read_reference(csv_path)
+        log(f"Reference file: {len(ref_rows)} rows", "ok")
+        return ref_rows
+    except Exception as e:
+        log(f"Reference file error: {e}", "err")
+        return None
+
+def ocr_corpus(bill_images, texts, skip=()):
+    """
+    ocr_cache tuples (rel_path, filename, file_date, ocr_text) for usable
+    texts; indexes in `skip` (near-duplicates) are left out so the matcher
+    scores each bill once.
+    """
+    corpus = []
+    for i, (rel_path, txt) in enumerate(zip(bill_images, texts)):
+        if i in skip:
+            continue
+        if txt and len(txt.strip()) > 10:
+            fname = os.path.basename(rel_path)
+            corpus.append((rel_path, fname, extract_date_from_filename(fname), txt))
+    return corpus
+
+def build_report(ref_rows, ocr_cache, write, log, update, timings, duplicates=()):
+    """
+    Match + report stage shared by audits, re-audits and the CLI (streamed).
+    `write(rows, timings)` consumes the result rows as they are matched:
+    the CLI writes the Excel report, web jobs store result columns.
+    """
+    if ref_rows is not None:
+        update(68, "Matching records to bills...")
+        log("Smart matching with date + item signals...", "info")
+        results = match_results(ref_rows, ocr_cache, log, update)
+    else:
+        update(92, "Writing report...")
+        results = unmatched_results(ocr_cache)
+
+    summary = {"total": 0, "matched": 0, "mismatch": 0}
+    # Matching runs inside the writer's loop: time spent producing rows is
+    # "match", the rest of the writer's wall time is "report"
+    started, matched_before = time.perf_counter(), timings.stages.get("match", 0.0)
+
+    def report_timings():
+        match_secs = timings.stages.get("match", 0.0) - matched_before
+        timings.stages["report"] = time.perf_counter() - started - match_secs
+        return {name: round(secs, 3) for name, secs in timings.stages.items()}
+
+    write(tally(timings.iterate("match", results), summary), report_timings)
+    report_timings()
+    summary["timings"] = timings.finish()
+    if duplicates:
+        summary["duplicates"] = len(duplicates)
+    return summary
+
+def finish_report(job_id, ref_rows, ocr_cache, log, update, flush, timings,
+                  duplicates=()):
+    # The Excel report is only built when first downloaded (excel_report)
+    report_path = os.path.join(REPORT_FOLDER, f"audit_{job_id}.xlsx")
+    summary = build_report(ref_rows, ocr_cache,
+                           lambda rows, _: store_results(job_id, rows, duplicates),
+                           log, update, timings, duplicates)
+    log(f"Done — {summary['matched']} matched, {summary['mismatch']} flagged, "
+        f"{summary['total']} total", "ok")
+    job_store.put_corpus(job_id, pack_corpus(ocr_cache, duplicates))
+    flush()
+    job_store.update(job_id, status="done", progress=100, step="Audit complete",
+                     report_path=report_path, summary=summary)
+    metrics.inc("audit_jobs_total", status="done")
+
+def ocr_archive(zip_path, work_dir, log, update, timings, ocr_share=None):
+    """
+    Extract, de-duplicate and OCR every bill in a ZIP (the audit's OCR
+    stage), within `ocr_share` (an OCRShare) if given. Returns
+    (bill_images, ocr_cache, duplicates): the rel_path of each image/page
+    in archive order, the ocr_corpus() tuples, and
+    (rel_path, original_rel_path, distance) for near-duplicates.
+    """
+    update(12, "Reading ZIP directory...")
+    expected = [zip_bill_count(zip_path)]
+    log(f"Found {expected[0]} bill files in archive", "info")
+
+    # ── Extract + OCR as a pipeline (memory- and disk-safe) ──────────────────
+    # Entries are extracted one at a time while earlier ones are OCR'd in
+    # parallel worker processes and deleted right after. Completion order
+    # is arbitrary; ocr_cache keeps archive order so reports are
+    # reproducible.
+    stage_dir = os.path.join(work_dir, "staged")
+    os.makedirs(stage_dir, exist_ok=True)
+    bill_images = []   # rel_path per image/page, in archive order
+    done = [0]
+    progress_lock = threading.Lock()
+
+    def staged_images():
+        last_rel = None
+        for path, rel in iter_zip_bills(zip_path, stage_dir, log):
+            if rel == last_rel:            # extra PDF page
+                with progress_lock:
+                    expected[0] += 1
+            last_rel = rel
+            bill_images.append(rel)
+            yield path
+
+    dedup = duplicate_finder(os.path.join(work_dir, "thumbs"))
+
+    def on_ocr_done(i, txt):
+        fname = os.path.basename(bill_images[i])
+        with progress_lock:
+            done[0] += 1
+            total = max(expected[0], done[0], 1)
+            update(16 + int((done[0] / total) * 50),
+                   f"OCR {done[0]}/{total}: {fname}")
+            if dedup and i in dedup.duplicates:
+                orig, distance = dedup.duplicates[i]
+                log(f"Duplicate: {fname} ≈ {os.path.basename(bill_images[orig])} "
+                    f"({distance} bits), OCR skipped", "info")
+            elif txt and len(txt.strip()) > 10:
+                date_info = extract_date_from_filename(fname)
+                date_info = f" date={date_info}" if date_info else ""
+                log(f"OCR OK: {fname}{date_info} ({len(txt)} chars)", "ok")
+            else:
+                log(f"OCR empty: {fname}", "err")
+
+    update(16, "OCR scanning...")
+    share_limit = ocr_share.limit() if ocr_share else None
+    if expected[0] and get_ocr_queue() is not None:
+        log(f"OCR via the shared queue, up to "
+            f"{min(share_limit or OCR_QUEUE_INFLIGHT, expected[0])} images in flight", "info")
+    elif expected[0]:
+        workers = min(share_limit or get_ocr_pool().size, get_ocr_pool().size)
+        log(f"OCR on up to {min(workers, expected[0])} workers", "info")
+    cache_stats = {"hits": 0, "misses": 0}
+    # Extraction (incl. PDF page rendering) feeds OCR lazily: time spent
+    # producing pages is "extract", the rest of the pipeline is "ocr"
+    started = time.perf_counter()
+    texts = ocr_images_parallel(timings.iterate("extract", staged_images()),
+                                on_ocr_done, stats=cache_stats, cleanup=True,
+                                dedup=dedup, share=ocr_share)
+    timings.add("ocr", time.perf_counter() - started
+                       - timings.stages.get("extract", 0.0))
+    if dedup:
+        dedup.close()
+    log(f"OCR'd {len(bill_images)} bill images", "info")
+    if cache_stats.get("text_layer"):
+        log(f"PDF text layer used for {cache_stats['text_layer']} pages "
+            f"(no OCR needed)", "info")
+    if cache_stats.get("passes"):
+        log("OCR passes: " + ", ".join(
+            f"{name} {n}x avg {secs / n:.2f}s"
+            for name, (n, secs) in cache_stats["passes"].items()), "info")
+    if get_ocr_cache():
+        log(f"OCR cache: {cache_stats['hits']} hits, "
+            f"{cache_stats['misses']} misses", "info")
+
+    found = dedup.duplicates if dedup else {}
+    duplicates = [(bill_images[i], bill_images[orig], distance)
+                  for i, (orig, distance) in sorted(found.items())]
+    if duplicates:
+        log(f"{len(duplicates)} near-duplicate images reused an earlier "
+            f"image's text; listed on the Duplicates sheet", "info")
+    return bill_images, ocr_corpus(bill_images, texts, skip=found), duplicates
+
+def run_audit(job_id, work_dir, zip_path, csv_path, ocr_share=None):
+    log, update, flush = job_reporter(job_id)
+    timings = JobTimings()
+
+    try:
+        with timings.stage("reference"):
+            ref_rows = load_reference(csv_path, log, update)
+        metrics.inc("audit_input_bytes_total", os.path.getsize(zip_path))
+
+        ocr_cache, duplicates = ocr_archive(zip_path, work_dir, log, update, timings,
+                                            ocr_share)[1:]
+
+        finish_report(job_id, ref_rows, ocr_cache, log, update, flush, timings,
+                      duplicates)
+
+    except Exception as e:
+        import traceback
+        flush()
+        metrics.inc("audit_jobs_total", status="error")
+        job_store.update(job_id, status="error",
+                         error=str(e) + "\n" + traceback.format_exc())
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        gc.collect()
+
+def run_reaudit(job_id, source_job_id, work_dir, csv_path):
+    """Re-run matching + report for a finished job's OCR corpus and a new reference file."""
+    log, update, flush = job_reporter(job_id)
+    timings = JobTimings()
+
+    try:
+        blob = job_store.get_corpus(source_job_id)
+        if blob is None:
+            raise RuntimeError(f"OCR results of job {source_job_id} are no longer available")
+        ocr_cache, duplicates = unpack_corpus(blob)
+        log(f"Reusing OCR of {len(ocr_cache)} bill images from job {source_job_id}", "ok")
+        with timings.stage("reference"):
+            ref_rows = load_reference(csv_path, log, update)
+        finish_report(job_id, ref_rows, ocr_cache, log, update, flush, timings,
+                      duplicates)
+
+    except Exception as e:
+        import traceback
+        flush()
+        metrics.inc("audit_jobs_total", status="error")
+        job_store.update(job_id, status="error",
+                         error=str(e) + "\n" + traceback.format_exc())
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        gc.collect()
+
+# ── Batch CLI ─────────────────────────────────────────────────────────────────
+# Offline audits without Flask or the job store:
+#
+#   python app.py audit --bills DIR|ZIP --reference zoho.xlsx --out report.xlsx
+#                       [--jobs N] [--checkpoint FILE] [--fresh]
+#
+# OCR runs on the same worker-process pool, sized by --jobs. Every finished
+# image is appended to a JSON-lines checkpoint, so an interrupted run picks
+# up where it stopped when started again with the same arguments.
+
+def dir_bill_files(root):
+    """(path, rel_path) of the bill files under `root`, in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root).replace(os.sep, "/")
+            if not is_ignored(rel) and os.path.splitext(name)[1].lower() in ALLOWED_BILL_EXT:
+                yield path, rel
+
+def iter_dir_bills(root, log=print):
+    """Like iter_zip_bills() for a directory on disk; files are never deleted."""
+    for path, rel in dir_bill_files(root):
+        if rel.lower().endswith(".pdf"):
+            for page in iter_pdf_pages(path, log, rel):
+                yield page, rel
+        else:
+            yield path, rel
+
+
+class ProgressBar:
+    """Single-line progress on stderr; plain lines every few seconds when not a terminal."""
+
+    def __init__(self, label, width=30):
+        self.label, self.width = label, width
+        self.tty = sys.stderr.isatty()
+        self._last = 0.0
+
+    def show(self, done, total, note="", final=False):
+        total = max(total, done, 1)
+        now = time.monotonic()
+        if not final and now - self._last < (0.1 if self.tty else 5):
+            return
+        self._last = now
+        filled = int(self.width * done / total)
+        line = (f"{self.label} [{'#' * filled}{'.' * (self.width - filled)}] "
+                f"{done}/{total} {note[:40]}")
+        if self.tty:
+            sys.stderr.write("\r" + line.ljust(100) + ("\n" if final else ""))
+        else:
+            sys.stderr.write(line + "\n")
+        sys.stderr.flush()
+
+
+def load_checkpoint(path):
+    """{"rel#page": entry} of images finished by an earlier run."""
+    done = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue             # torn last line of a killed run
+                done[entry["key"]] = entry
+    return done
+
+
+def cli_audit(args):
+    # The web defaults budget for a small shared container; a batch run
+    # sizes the pool for --jobs workers of default-sized photos
+    jobs = args.jobs or OCR_MAX_WORKERS
+    pool = get_ocr_pool(size=jobs,
+                        budget_mb=args.memory_mb or int(jobs * estimate_ocr_mb(None)))
+    print(f"OCR: {pool.size} workers, {pool.budget.total_mb:.0f} MB budget", file=sys.stderr)
+
+    def log(msg, t="info"):
+        if t == "err" or args.verbose:
+            print(f"[{t}] {msg}", file=sys.stderr)
+
+    timings = JobTimings()
+    with timings.stage("reference"):
+        ref_rows = load_reference(args.reference, log, lambda *a: None)
+    if args.reference and ref_rows is None:
+        sys.exit(f"Could not read reference file {args.reference}")
+
+    checkpoint_path = args.checkpoint or args.out + ".ocr-checkpoint.jsonl"
+    if args.fresh and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    finished = load_checkpoint(checkpoint_path)
+    if finished:
+        print(f"Resuming: {len(finished)} images already OCR'd", file=sys.stderr)
+
+    is_zip = os.path.isfile(args.bills) and zipfile.is_zipfile(args.bills)
+    stage_dir = None
+    if is_zip:
+        stage_dir = os.path.join(UPLOAD_FOLDER, f"cli_{uuid.uuid4().hex[:8]}")
+        os.makedirs(stage_dir)
+        with zipfile.ZipFile(args.bills) as z:
+            expected = sum(1 for info in z.infolist()
+                           if not info.is_dir() and not is_ignored(info.filename)
+                           and os.path.splitext(info.filename)[1].lower()
+                               in ALLOWED_BILL_EXT)
+        sources = iter_zip_bills(args.bills, stage_dir, log)
+    elif os.path.isdir(args.bills):
+        expected = sum(1 for _ in dir_bill_files(args.bills))
+        sources = iter_dir_bills(args.bills, log)
+    else:
+        sys.exit(f"--bills must be a directory or a ZIP file: {args.bills}")
+
+    keys, texts = [], {}          # archive order; slot -> text
+    restored = {}                 # slot -> text from the checkpoint
+    dedup = duplicate_finder(os.path.join(UPLOAD_FOLDER, f"cli_thumbs_{uuid.uuid4().hex[:8]}"))
+    seen = defaultdict(int)
+    bar = ProgressBar("OCR")
+    lock = threading.Lock()
+    done = [0]
+
+    # Restored images are not OCR'd again, but still pass through the
+    # duplicate finder (re-hashed) so clusters match a fresh run's
+    def pending():
+        for source, rel in sources:
+            key = f"{rel}#{seen[rel]}"
+            seen[rel] += 1
+            slot = len(keys)
+            keys.append((key, rel))
+            if key in finished:
+                restored[slot] = finished[key]["text"]
+            yield source
+
+    with open(checkpoint_path, "a", encoding="utf-8") as ckpt:
+        def on_done(slot, txt):
+            with lock:
+                texts[slot] = txt
+                if txt and slot not in restored:
+                    ckpt.write(json.dumps({"key": keys[slot][0], "text": txt}) + "\n")
+                    ckpt.flush()
+                done[0] += 1
+                bar.show(done[0], max(expected, len(keys)),
+                         os.path.basename(keys[slot][1]))
+
+        started = time.perf_counter()
+        try:
+            ocr_images_parallel(timings.iterate("extract", pending()), on_done,
+                                cleanup=is_zip, dedup=dedup, known=restored)
+        finally:
+            if stage_dir:
+                shutil.rmtree(stage_dir, ignore_errors=True)
+            if dedup:
+                dedup.close()
+        timings.add("ocr", time.perf_counter() - started
+                           - timings.stages.get("extract", 0.0))
+    bar.show(done[0], done[0], final=True)
+
+    dup_of = dedup.duplicates if dedup else {}
+    rels = [rel for _, rel in keys]
+    ocr_cache = ocr_corpus(rels, [texts.get(slot, "") for slot in range(len(keys))],
+                           skip=dup_of)
+    duplicates = [(rels[slot], rels[orig], distance)
+                  for slot, (orig, distance) in sorted(dup_of.items())]
+    match_bar = ProgressBar("Match")
+    write = lambda rows, report_timings: generate_excel(
+        rows, args.out, timings=report_timings, duplicates=duplicates)
+    summary = build_report(ref_rows, ocr_cache, write, log,
+                           lambda pct, step: match_bar.show(pct - 68, 24, step),
+                           timings, duplicates)
+    match_bar.show(24, 24, final=True)
+    print(f"{summary['matched']} matched, {summary['mismatch']} flagged, "
+          f"{summary['total']} total -> {args.out}")
+    if duplicates:
+        print(f"{len(duplicates)} near-duplicate images skipped (Duplicates sheet)")
+    print("Timings: " + ", ".join(f"{k} {v:.1f}s" for k, v in summary["timings"].items()))
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Purchase audit: web app or batch CLI")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("serve", help="run the web app (default)")
+    audit = sub.add_parser("audit", help="audit a directory or ZIP of bills offline")
+    audit.add_argument("--bills", required=True, help="directory or ZIP of bill images/PDFs")
+    audit.add_argument("--reference", help="Zoho export (CSV/XLSX)")
+    audit.add_argument("--out", required=True, help="Excel report to write")
+    audit.add_argument("--jobs", type=int, help="OCR worker processes "
+                       f"(default {OCR_MAX_WORKERS})")
+    audit.add_argument("--memory-mb", type=int, help="OCR memory budget; caps --jobs "
+                       f"(default: {estimate_ocr_mb(None):.0f} MB per job)")
+    audit.add_argument("--checkpoint", help="OCR checkpoint file "
+                       "(default: <out>.ocr-checkpoint.jsonl)")
+    audit.add_argument("--fresh", action="store_true", help="ignore an existing checkpoint")
+    audit.add_argument("-v", "--verbose", action="store_true")
+    worker = sub.add_parser("worker", help="OCR tasks from the shared queue (OCR_QUEUE)")
+    worker.add_argument("--queue-dir", default=OCR_QUEUE_DIR,
+                        help=f"shared queue directory (default {OCR_QUEUE_DIR})")
+    worker.add_argument("--concurrency", type=int,
+                        help="images OCR'd at once (default: local pool size)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "audit":
+        cli_audit(args)
+    elif args.command == "worker":
+        backend = OCR_QUEUE if OCR_QUEUE != "local" else "sqlite"
+        run_ocr_worker(OCR_QUEUE_BACKENDS[backend](args.queue_dir), args.concurrency)
+    else:
+        port = int(os.environ.get("PORT", 8000))
+        app.run(debug=False, host="0.0.0.0", port=port)
+
+# ── Chunked uploads ───────────────────────────────────────────────────────────
+# Large archives are sent as fixed-size chunks (init -> PUT chunks -> finalize)
+# instead of one multipart request, so a network blip only costs the chunks
+# in flight and the browser can send several at once.
+
+UPLOAD_CHUNK_MB  = int(os.environ.get("UPLOAD_CHUNK_MB", 8))
+UPLOAD_MAX_MB    = int(os.environ.get("UPLOAD_MAX_MB", 4096))
+UPLOAD_TTL_HOURS = float(os.environ.get("UPLOAD_TTL_HOURS", 24))
+UPLOAD_COPY_BYTES = 1 << 20
+CHUNKED_UPLOAD_DIR = os.path.join(UPLOAD_FOLDER, "chunked")
+
+class ChunkedUpload:
+    """
+    One resumable upload, kept on disk so any gunicorn worker can take any
+    chunk. `dir` holds meta.json, the preallocated data file that chunks
+    are written into at their offset, and one marker per received chunk
+    (chunks/<index>, holding the chunk's SHA-256) written only after its
+    bytes are. A chunk whose marker exists is not written again, so
+    client retries are harmless.
+
+    The finalize checksum is the SHA-256 of the hex chunk digests
+    concatenated in order: the browser can compute it chunk by chunk
+    without hashing the whole archive in memory.
+
+    Chunk writes hold a shared flock on `dir`/lock and finalize() an
+    exclusive one, so the data file is never renamed under a writer;
+    both re-read meta.json once they hold the lock.
+    """
+
+    def __init__(self, upload_id):
+        self.id  = upload_id
+        self.dir = os.path.join(CHUNKED_UPLOAD_DIR, upload_id)
+        self._reload()
+
+    def _reload(self):
+        with open(os.path.join(self.dir, "meta.json")) as f:
+            self.meta = json.load(f)
+
+    @contextmanager
+    def _locked(self, mode):
+        fd = os.open(os.path.join(self.dir, "lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, mode)
+            self._reload()
+            yield
+        finally:
+            os.close(fd)
+
+    @classmethod
+    def create(cls, filename, size, chunk_size=UPLOAD_CHUNK_MB << 20):
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(CHUNKED_UPLOAD_DIR, upload_id)
+        os.makedirs(os.path.join(path, "chunks"))
+        with open(os.path.join(path, "data.part"), "wb") as f:
+            f.truncate(size)
+        meta = {"filename": filename, "size": size, "chunk_size": chunk_size,
+                "finalized": False, "created": time.time()}
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        return cls(upload_id)
+
+    @classmethod
+    def open(cls, upload_id):
+        """The upload with this id, or None if it is unknown or expired."""
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id or ""):
+            return None
+        try:
+            return cls(upload_id)
+        except (OSError, ValueError):
+            return None
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.meta["size"] // self.meta["chunk_size"]))
+
+    @property
+    def data_path(self):
+        return os.path.join(self.dir, "data" if self.meta["finalized"] else "data.part")
+
+    def digests(self):
+        """{chunk index: hex SHA-256} of the chunks received so far."""
+        out = {}
+        for name in os.listdir(os.path.join(self.dir, "chunks")):
+            if name.isdigit():
+                with open(os.path.join(self.dir, "chunks", name)) as f:
+                    out[int(name)] = f.read().strip()
+        return out
+
+    def state(self):
+        return {"upload_id": self.id, "size": self.meta["size"],
+                "chunk_size": self.meta["chunk_size"], "chunks": self.chunk_count,
+                "received": sorted(self.digests()), "finalized": self.meta["finalized"]}
+
+    def write_chunk(self, offset, length, stream, sha256=None):
+        """
+        Stream one chunk from `stream` into the data file at `offset`.
+        Returns False if the chunk had already been received. Raises
+        ValueError for a misaligned or short chunk, a digest mismatch or
+        a finalized upload, FileNotFoundError if the upload was removed.
+        """
+        with self._locked(fcntl.LOCK_SH):
+            return self._write_chunk(offset, length, stream, sha256)
+
+    def _write_chunk(self, offset, length, stream, sha256):
+        size, chunk_size = self.meta["size"], self.meta["chunk_size"]
+        if self.meta["finalized"]:
+            raise ValueError("upload is already finalized")
+        if offset < 0 or offset % chunk_size or offset >= max(size, 1):
+            raise ValueError(f"offset must be a multiple of {chunk_size} below {size}")
+        index = offset // chunk_size
+        if length != min(chunk_size, size - offset):
+            raise ValueError(f"chunk {index} must be {min(chunk_size, size - offset)} bytes")
+        marker = os.path.join(self.dir, "chunks", str(index))
+        if os.path.exists(marker):
+            return False
+
+        digest, written = hashlib.sha256(), 0
+        fd = os.open(os.path.join(self.dir, "data.part"), os.O_WRONLY)
+        try:
+            while written < length:
+                buf = stream.read(min(UPLOAD_COPY_BYTES, length - written))
+                if not buf:
+                    break
+                os.pwrite(fd, buf, offset + written)
+                digest.update(buf)
+                written += len(buf)
+        finally:
+            os.close(fd)
+        if written != length:
+            raise ValueError(f"chunk {index} ended after {written} of {length} bytes")
+        if sha256 and sha256.lower() != digest.hexdigest():
+            raise ValueError(f"chunk {index} checksum mismatch")
+        tmp = f"{marker}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp, "w") as f:
+            f.write(digest.hexdigest())
+        os.replace(tmp, marker)
+        return True
+
+    def finalize(self, checksum=None):
+        """Check every chunk arrived (and the checksum, if given); returns the file path."""
+        with self._locked(fcntl.LOCK_EX):
+            return self._finalize(checksum)
+
+    def _finalize(self, checksum):
+        if self.meta["finalized"]:
+            return self.data_path
+        digests = self.digests()
+        missing = [i for i in range(self.chunk_count) if i not in digests]
+        if missing and self.meta["size"]:
+            raise ValueError(f"{len(missing)} chunks missing, first is {missing[0]}")
+        if checksum:
+            combined = "".join(digests[i] for i in sorted(digests))
+            if checksum.lower() != hashlib.sha256(combined.encode()).hexdigest():
+                raise ValueError("upload checksum mismatch")
+        os.replace(os.path.join(self.dir, "data.part"), os.path.join(self.dir, "data"))
+        self.meta["finalized"] = True
+        tmp = os.path.join(self.dir, f"meta.json.{os.getpid()}")
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(self.dir, "meta.json"))
+        return self.data_path
+
+    def take(self, dest_path):
+        """Move the finalized file to `dest_path` and forget the upload."""
+        os.replace(self.data_path, dest_path)
+        self.discard()
+
+    def discard(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    @staticmethod
+    def purge(max_age_secs):
+        """Remove uploads nobody has written to for `max_age_secs`."""
+        cutoff = time.time() - max_age_secs
+        try:
+            names = os.listdir(CHUNKED_UPLOAD_DIR)
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(CHUNKED_UPLOAD_DIR, name)
+            try:
+                newest = max(os.path.getmtime(os.path.join(path, f))
+                             for f in ("meta.json", "chunks"))
+            except (OSError, ValueError):
+                newest = 0
+            if newest < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+# ── Routes ────────────────────────────────────────────────────────────────────
+
+def start_background():
+    """Start this process's janitor and audit scheduler threads (idempotent)."""
+    start_janitor()
+    scheduler.start()
+
+@app.before_request
+def _start_background():
+    start_background()
+
+def _queue_full():
+    resp = jsonify({"error": "The server is busy with other audits. "
+                             "Please try again in a minute."})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(QUEUE_RETRY_AFTER)
+    return resp
+
+# The page has no per-request data: render it once at import
+with app.app_context():
+    INDEX_PAGE = render_template_string(HTML)
+
+@app.route("/")
+def index():
+    return INDEX_PAGE
+
+@app.route("/start", methods=["POST"])
+def start():
+    queue_limit = MAX_CONCURRENT_AUDITS + JOB_QUEUE_SIZE
+    if job_store.active_count() >= queue_limit:
+        return _queue_full()
+    upload   = None
+    zip_file = request.files.get("zip_file")
+    if request.form.get("upload_id"):
+        upload = ChunkedUpload.open(request.form["upload_id"])
+        if upload is None or not upload.meta["finalized"]:
+            return jsonify({"error": "Upload not found or not finalized"}), 400
+    elif not zip_file:
+        return jsonify({"error": "No ZIP file"}), 400
+    job_id   = str(uuid.uuid4())[:8]
+    work_dir = os.path.join(UPLOAD_FOLDER, job_id)
+    os.makedirs(work_dir, exist_ok=True)
+    zip_path = os.path.join(work_dir, "bills.zip")
+    if upload:
+        upload.take(zip_path)
+    else:
+        zip_file.save(zip_path)
+    csv_path = None
+    csv_file = request.files.get("csv_file")
+    if csv_file:
+        ext      = os.path.splitext(csv_file.filename)[1].lower() or ".xlsx"
+        csv_path = os.path.join(work_dir, f"data{ext}")
+        csv_file.save(csv_path)
+    inputs = {"work_dir": work_dir, "zip_path": zip_path, "csv_path": csv_path}
+    if not job_store.enqueue(job_id, inputs, queue_limit):
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return _queue_full()
+    scheduler.wake()
+    return jsonify({"job_id": job_id,
+                    "queue_position": job_store.queue_position(job_id)})
+
+@app.route("/uploads", methods=["POST"])
+def upload_init():
+    """Start a chunked upload: JSON {filename, size} -> upload_id and chunk size."""
+    body = request.get_json(silent=True) or {}
+    size = body.get("size")
+    if not isinstance(size, int) or size < 0:
+        return jsonify({"error": "size (bytes) is required"}), 400
+    if size > UPLOAD_MAX_MB << 20:
+        return jsonify({"error": f"Archive is larger than {UPLOAD_MAX_MB} MB"}), 413
+    os.makedirs(CHUNKED_UPLOAD_DIR, exist_ok=True)
+    if shutil.disk_usage(CHUNKED_UPLOAD_DIR).free < size:
+        return jsonify({"error": "Not enough disk space for this archive"}), 507
+    upload = ChunkedUpload.create(os.path.basename(str(body.get("filename", ""))), size)
+    return jsonify(upload.state()), 201
+
+@app.route("/uploads/<upload_id>")
+def upload_state(upload_id):
+    """Which chunks the server has, so a client can resume after a failure."""
+    upload = ChunkedUpload.open(upload_id)
+    if upload is None:
+        return jsonify({"error": "Unknown upload"}), 404
+    return jsonify(upload.state())
+
+@app.route("/uploads/<upload_id>/chunk", methods=["PUT"])
+def upload_chunk(upload_id):
+    """Raw chunk body at ?offset=N, optionally with its hex SHA-256 in X-Chunk-SHA256."""
+    upload = ChunkedUpload.open(upload_id)
+    if upload is None:
+        return jsonify({"error": "Unknown upload"}), 404
+    offset = request.args.get("offset", type=int)
+    if offset is None or request.content_length is None:
+        return jsonify({"error": "offset and Content-Length are required"}), 400
+    try:
+        written = upload.write_chunk(offset, request.content_length, request.stream,
+                                     request.headers.get("X-Chunk-SHA256"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409 if upload.meta["finalized"] else 400
+    except FileNotFoundError:
+        # Finalized and handed to an audit (or expired) while this chunk arrived
+        return jsonify({"error": "Upload no longer accepts chunks"}), 409
+    metrics.inc("upload_chunks_total", result="written" if written else "duplicate")
+    if written:
+        metrics.inc("upload_bytes_total", request.content_length)
+    return jsonify({"chunk": offset // upload.meta["chunk_size"], "duplicate": not written})
+
+@app.route("/uploads/<upload_id>/finalize", methods=["POST"])
+def upload_finalize(upload_id):
+    """Check the upload is complete and is a readable ZIP; JSON {checksum}."""
+    upload = ChunkedUpload.open(upload_id)
+    if upload is None:
+        return jsonify({"error": "Unknown upload"}), 404
+    checksum = (request.get_json(silent=True) or {}).get("checksum")
+    try:
+        path = upload.finalize(checksum)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError:
+        return jsonify({"error": "Unknown upload"}), 404
+    try:
+        entries = zip_bill_count(path)
+    except zipfile.BadZipFile:
+        upload.discard()
+        return jsonify({"error": "Not a valid ZIP archive"}), 400
+    return jsonify({"upload_id": upload_id, "bill_files": entries})
+
+@app.route("/reaudit/<job_id>", methods=["POST"])
+def reaudit(job_id):
+    """Match a finished job's OCR results against a new reference file."""
+    if job_store.get_corpus(job_id) is None:
+        return jsonify({"error": "OCR results for this job have expired; "
+                                 "please upload the bills again"}), 404
+    csv_file = request.files.get("csv_file")
+    if not csv_file:
+        return jsonify({"error": "No reference file"}), 400
+    queue_limit = MAX_CONCURRENT_AUDITS + JOB_QUEUE_SIZE
+    if job_store.active_count() >= queue_limit:
+        return _queue_full()
+    new_id   = str(uuid.uuid4())[:8]
+    work_dir = os.path.join(UPLOAD_FOLDER, new_id)
+    os.makedirs(work_dir, exist_ok=True)
+    ext      = os.path.splitext(csv_file.filename)[1].lower() or ".xlsx"
+    csv_path = os.path.join(work_dir, f"data{ext}")
+    csv_file.save(csv_path)
+    inputs = {"work_dir": work_dir, "csv_path": csv_path, "reaudit_of": job_id}
+    if not job_store.enqueue(new_id, inputs, queue_limit):
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return _queue_full()
+    scheduler.wake()
+    return jsonify({"job_id": new_id,
+                    "queue_position": job_store.queue_position(new_id)})
+
+@app.route("/status/<job_id>")
+def status(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"status": "not_found"}), 404
+    out = {k: job[k] for k in ("status","progress","step","summary","error")}
+    if job["status"] == "queued":
+        out["queue_position"] = job_store.queue_position(job_id)
+    after = request.args.get("after", type=int)
+    if after is None:
+        out["new_logs"] = job_store.take_new_logs(job_id)
+    else:
+        # Fallback for clients that were on /events: resume from their last seq
+        out["new_logs"] = job_store.logs_since(job_id, after)
+    return jsonify(out)
+
+def _sse(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route("/events/<job_id>")
+def events(job_id):
+    """
+    Server-Sent Events stream of a job: `log` events carry the log seq as
+    their id (so EventSource resumes with Last-Event-ID), `progress` events
+    are sent when progress/step change, and a final `end` event carries
+    the same payload as /status once the job is done or failed.
+    """
+    if job_store.get(job_id) is None:
+        return jsonify({"status": "not_found"}), 404
+    last_seq = request.headers.get("Last-Event-ID", type=int) or 0
+
+    def stream(seq):
+        shown, beat = None, time.monotonic()
+        yield "retry: 2000\n\n"
+        while True:
+            job = job_store.get(job_id)
+            if job is None:
+                yield _sse("end", {"status": "not_found"})
+                return
+            for l in job_store.logs_since(job_id, seq):
+                seq = l["seq"]
+                yield _sse("log", {"msg": l["msg"], "type": l["type"]}, seq)
+            position = (job_store.queue_position(job_id)
+                        if job["status"] == "queued" else None)
+            if (job["progress"], job["step"], position) != shown:
+                shown = (job["progress"], job["step"], position)
+                yield _sse("progress", {"progress": job["progress"], "step": job["step"],
+                                        "queue_position": position})
+            if job["status"] in ("done", "error"):
+                yield _sse("end", {k: job[k] for k in
+                                   ("status","progress","step","summary","error")})
+                return
+            if time.monotonic() - beat >= SSE_HEARTBEAT:
+                beat = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(SSE_POLL_INTERVAL)
+
+    return Response(stream(last_seq), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Other processes' last flushed snapshots plus this process's live values
+    snapshots = [s for key, s in job_store.all_metrics().items() if key != _metrics_key]
+    return Response(metrics.render(snapshots + [metrics.snapshot()]),
+                    mimetype="text/plain; version=0.0.4")
+
+@app.route("/results/<job_id>")
+def results_page(job_id):
+    """
+    One page of a finished job's result rows as JSON. Filters: `status`
+    (repeatable match_status), `min_confidence` / `max_confidence`;
+    paging: `offset` and `limit` (at most RESULTS_PAGE_MAX).
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job["status"] != "done":
+        return jsonify({"error": f"Job is {job['status']}"}), 409
+    results = ResultColumns(job_store, job_id)
+    if not results.exists():
+        return jsonify({"error": "Results are not available for this job"}), 404
+    try:
+        min_conf = request.args.get("min_confidence", type=float)
+        max_conf = request.args.get("max_confidence", type=float)
+        offset   = max(0, int(request.args.get("offset", 0)))
+        limit    = min(max(1, int(request.args.get("limit", 100))), RESULTS_PAGE_MAX)
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    picked = results.select(set(request.args.getlist("status")), min_conf, max_conf)
+    rows = results.page(picked[offset:offset + limit])
+    return jsonify({"job_id": job_id, "total": len(picked), "offset": offset,
+                    "limit": limit, "rows": rows,
+                    "next_offset": offset + limit if offset + limit < len(picked) else None})
 
 @app.route("/download/<job_id>")
 def download(job_id):
-    if job_id not in jobs or not jobs[job_id].get("report_path"):
+    """The Excel report, or ?format=csv|jsonl|parquet streamed from stored results."""
+    job = job_store.get(job_id)
+    if job is None or not job.get("report_path"):
         return "Not ready", 404
-    rp = jobs[job_id]["report_path"]
-    if os.path.exists(rp):
-        return send_file(rp, as_attachment=True,
-                         download_name="Purchase_Audit_Report.xlsx")
-    return "File not found", 404
+    fmt = request.args.get("format", "xlsx").lower()
+    if fmt == "xlsx":
+        rp = excel_report(job_id, job)
+        if rp:
+            metrics.inc("result_exports_total", format=fmt)
+            return send_file(rp, as_attachment=True,
+                             download_name="Purchase_Audit_Report.xlsx")
+        return "File not found", 404
+    if fmt not in EXPORT_FORMATS:
+        return f"Unknown format {fmt!r}; use xlsx, {', '.join(EXPORT_FORMATS)}", 400
+    if fmt == "parquet" and not importlib.util.find_spec("pyarrow"):
+        return "Parquet export needs pyarrow installed on the server", 501
+    results = ResultColumns(job_store, job_id)
+    if not results.exists():
+        return "File not found", 404
+    metrics.inc("result_exports_total", format=fmt)
+    return Response(export_results(results, fmt), mimetype=EXPORT_FORMATS[fmt],
+                    headers={"Content-Disposition":
+                             f"attachment; filename=Purchase_Audit_Report.{fmt}"})
 
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 8000))
-    app.run(debug=False, host="0.0.0.0", port=port)
+    main()
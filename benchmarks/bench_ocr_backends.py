@@ -0,0 +1,88 @@
+"""
+Per-image comparison of the OCR backends available to the worker pool.
+
+    python benchmarks/bench_ocr_backends.py [IMAGE ...] [--repeat N] [--json OUT]
+
+Without images a handful of synthetic bills are rendered with OpenCV.
+Every backend gets its own long-lived OCRWorker, warmed up on the first
+image, so the numbers are steady-state per-image costs including the
+pipe round trip. Backends that are not installed are skipped.
+"""
+import argparse, importlib.util, json, os, statistics, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+BACKENDS = ["pytesseract", "tesserocr"]
+
+
+def synthetic_bills(out_dir, count=5):
+    import cv2
+    import numpy as np
+    paths = []
+    for k in range(count):
+        img = np.full((1600, 1200, 3), 255, np.uint8)
+        lines = [f"TAX INVOICE  No: INV-{1000 + k}", "Sharma Traders, Pune",
+                 f"Date: {10 + k:02d}/01/2026", "Rice 25kg      2   1500.00",
+                 "Toor Dal 1kg   5    650.00", f"TOTAL          {2150 + k}.00"]
+        for i, line in enumerate(lines):
+            cv2.putText(img, line, (60, 120 + i * 90), cv2.FONT_HERSHEY_SIMPLEX,
+                        1.4, (0, 0, 0), 3, cv2.LINE_AA)
+        path = os.path.join(out_dir, f"bill_{k}.png")
+        cv2.imwrite(path, img)
+        paths.append(path)
+    return paths
+
+
+def bench(backend, images, repeat):
+    worker = app.OCRWorker(env={"OCR_BACKEND": backend})
+    try:
+        worker.run({"path": images[0]}, app.OCR_TIMEOUT)          # warm-up
+        per_image = []
+        for path in images:
+            secs, passes = [], {}
+            for _ in range(repeat):
+                t = time.perf_counter()
+                reply = worker.run({"path": path}, app.OCR_TIMEOUT)
+                secs.append(time.perf_counter() - t)
+                for p in reply.get("passes", []):
+                    passes.setdefault(p["pass"], []).append(p["secs"])
+            per_image.append({
+                "image": os.path.basename(path),
+                "seconds": statistics.median(secs),
+                "chars": len(reply.get("text", "")),
+                "passes": {k: statistics.median(v) for k, v in passes.items()},
+            })
+    finally:
+        worker.close()
+    times = [r["seconds"] for r in per_image]
+    return {"images": len(images), "repeat": repeat,
+            "mean_s": statistics.mean(times), "median_s": statistics.median(times),
+            "per_image": per_image}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("images", nargs="*")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        images = args.images or synthetic_bills(tmp)
+        results = {}
+        for backend in BACKENDS:
+            if backend != "pytesseract" and not importlib.util.find_spec(backend):
+                print(f"{backend}: not installed, skipped")
+                continue
+            results[backend] = bench(backend, images, args.repeat)
+            print(f"{backend:12s} mean {results[backend]['mean_s']:.3f}s  "
+                  f"median {results[backend]['median_s']:.3f}s per image")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+End-to-end benchmark of the audit pipeline on synthetic data.
+
+    python benchmarks/bench_pipeline.py [--bills N] [--rows N] [--json OUT]
+
+Renders N synthetic bills with OpenCV (random noise, rotation, resolution
+and format, plus text-layer and scanned multi-page PDFs), zips them in a
+few folders and writes a Zoho-style CSV whose rows point at known bills
+(and a share of decoy rows whose bills are not in the archive). The
+pipeline then runs stage by stage exactly as run_audit chains it:
+
+    reference   read_reference()
+    ocr         ocr_archive() (extract, near-duplicate check, OCR, corpus)
+    match       match_results()
+    report      generate_excel()
+
+For each stage it reports wall time, peak RSS (this process plus the OCR
+worker processes, sampled) and items/sec; accuracy is measured against
+the generated ground truth. Everything is local, no network. The OCR
+result cache is off unless --cache is given, so repeated runs measure
+real OCR work.
+"""
+import argparse, csv, json, os, random, sys, tempfile, threading, time, zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+VENDORS = ["Sharma Traders", "Gupta Stores", "Patel Provisions", "Mehta Dairy",
+           "Singh Poultry", "Rao Vegetables", "Iyer Spices", "Khan Meat Supply",
+           "Das Fish Market", "Joshi Bakery", "Nair Coconut Co", "Verma Oil Mills"]
+ITEMS = ["Rice 25kg", "Toor Dal 1kg", "Sunflower Oil 15L", "Sugar 50kg",
+         "Milk 10L", "Paneer 5kg", "Chicken 10kg", "Onion 20kg", "Tomato 15kg",
+         "Butter 2kg", "Wheat Flour 50kg", "Tea Powder 1kg", "Coffee 500g"]
+
+
+class RSSSampler:
+    """Peak RSS of this process plus all its children, sampled in a thread."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_mb  = 0.0
+        self._stop    = threading.Event()
+        self._thread  = threading.Thread(target=self._loop, daemon=True)
+
+    @staticmethod
+    def _children():
+        pids = set()
+        for tid in os.listdir("/proc/self/task"):
+            try:
+                with open(f"/proc/self/task/{tid}/children") as f:
+                    pids.update(f.read().split())
+            except OSError:
+                pass
+        return pids
+
+    def sample(self):
+        total = app._proc_rss_mb(os.getpid()) or 0.0
+        for pid in self._children():
+            total += app._proc_rss_mb(pid) or 0.0
+        self.peak_mb = max(self.peak_mb, total)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+def stage(results, name, items, fn):
+    with RSSSampler() as rss:
+        t = time.perf_counter()
+        out = fn()
+        secs = time.perf_counter() - t
+    count = items(out) if callable(items) else items
+    results[name] = {"seconds": round(secs, 4), "peak_rss_mb": round(rss.peak_mb, 1),
+                     "items": count, "per_sec": round(count / secs, 2) if secs else None}
+    print(f"{name:10s} {secs:8.3f}s  {count:6d} items  {results[name]['per_sec']}/s  "
+          f"peak RSS {rss.peak_mb:.0f} MB")
+    return out
+
+
+# ── Synthetic data ────────────────────────────────────────────────────────────
+
+def bill_lines(bill):
+    lines = ["TAX INVOICE", bill["vendor"], f"Bill No: {bill['bill_no']}",
+             f"Date: {bill['date'][8:10]}/{bill['date'][5:7]}/{bill['date'][:4]}"]
+    for item, qty, rate in bill["items"]:
+        lines.append(f"{item:20s} {qty:3d} {rate:8.2f} {qty * rate:9.2f}")
+    lines.append(f"TOTAL {sum(q * r for _, q, r in bill['items']):.2f}")
+    return lines
+
+
+def render_bill(bill, rng, scale=1.0, noise=0.0, angle=0.0):
+    import cv2
+    import numpy as np
+    h, w = int(1600 * scale), int(1200 * scale)
+    img = np.full((h, w, 3), 255, np.uint8)
+    for i, line in enumerate(bill_lines(bill)):
+        cv2.putText(img, line, (int(60 * scale), int((120 + i * 80) * scale)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.2 * scale, (0, 0, 0),
+                    max(1, int(3 * scale)), cv2.LINE_AA)
+    if angle:
+        m = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        img = cv2.warpAffine(img, m, (w, h), borderValue=(255, 255, 255))
+    if noise:
+        grain = rng.normal(0, noise, img.shape)
+        img = np.clip(img.astype(np.float32) + grain, 0, 255).astype(np.uint8)
+    return img
+
+
+def write_pdf(path, bill, img=None):
+    import fitz
+    import cv2
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    if img is None:
+        for i, line in enumerate(bill_lines(bill)):
+            page.insert_text((50, 60 + i * 20), line, fontsize=11)
+    else:
+        page.insert_image(page.rect, stream=cv2.imencode(".png", img)[1].tobytes())
+    doc.new_page(width=595, height=842).insert_text(
+        (50, 60), "Terms and conditions apply. Goods once sold are not returned.",
+        fontsize=11)
+    doc.save(path)
+    doc.close()
+
+
+def generate(out_dir, n_bills, n_rows, decoys, pdf_share, seed):
+    import cv2
+    import numpy as np
+    rnd = random.Random(seed)
+    rng = np.random.default_rng(seed)
+    bills = []
+    for k in range(n_bills):
+        day, month = rnd.randint(1, 28), rnd.randint(1, 12)
+        bills.append({
+            "bill_no": f"SB-{10000 + k}", "vendor": rnd.choice(VENDORS),
+            "date": f"2026-{month:02d}-{day:02d}",
+            "items": [(item, rnd.randint(1, 9), float(rnd.randint(20, 900)))
+                      for item in rnd.sample(ITEMS, rnd.randint(1, 5))],
+        })
+
+    zip_path = os.path.join(out_dir, "bills.zip")
+    files = {}
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as z:
+        for k, bill in enumerate(bills):
+            folder = f"branch_{k % 4}"
+            stem = f"{bill['date'][8:10]}_{bill['date'][5:7]}_{bill['date'][2:4]}_{k}"
+            roll = rnd.random()
+            if roll < pdf_share / 2:
+                name = f"{stem}.pdf"
+                write_pdf(os.path.join(out_dir, name), bill)
+            elif roll < pdf_share:
+                name = f"{stem}.pdf"
+                write_pdf(os.path.join(out_dir, name), bill,
+                          render_bill(bill, rng, scale=0.7, noise=8))
+            else:
+                name = f"{stem}.{rnd.choice(['jpg', 'png'])}"
+                img = render_bill(bill, rng, scale=rnd.uniform(0.5, 1.0),
+                                  noise=rnd.choice([0, 6, 15]),
+                                  angle=rnd.uniform(-3, 3))
+                cv2.imwrite(os.path.join(out_dir, name), img)
+            z.write(os.path.join(out_dir, name), f"{folder}/{name}")
+            os.remove(os.path.join(out_dir, name))
+            files[bill["bill_no"]] = name
+
+    csv_path = os.path.join(out_dir, "reference.csv")
+    truth = []
+    with open(csv_path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["Bill Number", "Vendor Name", "Item Name", "Item Total",
+                    "Bill Date", "Branch Name", "Quantity", "Rate"])
+        for i in range(n_rows):
+            if rnd.random() < decoys:
+                bill_no, vendor = f"XX-{90000 + i}", rnd.choice(VENDORS)
+                date, (item, qty, rate) = "2025-06-15", (rnd.choice(ITEMS), 1, 99.0)
+                truth.append(None)
+            else:
+                bill = bills[i % n_bills]
+                bill_no, vendor, date = bill["bill_no"], bill["vendor"], bill["date"]
+                item, qty, rate = bill["items"][i % len(bill["items"])]
+                truth.append(files[bill_no])
+            w.writerow([bill_no, vendor, item, f"{qty * rate:.2f}", date,
+                        "Main", qty, f"{rate:.2f}"])
+    return zip_path, csv_path, truth
+
+
+def accuracy(results, truth):
+    hits = wrong = missed = false_pos = 0
+    for r, expected in zip(results, truth):
+        matched = r["match_status"] == "Matched"
+        if expected is None:
+            false_pos += matched
+        elif matched and r["file_name"] == expected:
+            hits += 1
+        elif matched:
+            wrong += 1
+        else:
+            missed += 1
+    real = sum(t is not None for t in truth)
+    return {"rows": len(truth), "rows_with_bill": real, "matched_correct": hits,
+            "matched_wrong_file": wrong, "missed": missed,
+            "decoys_matched": false_pos,
+            "recall": round(hits / real, 4) if real else None,
+            "precision": round(hits / (hits + wrong + false_pos), 4)
+                         if hits + wrong + false_pos else None}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--bills", type=int, default=50)
+    ap.add_argument("--rows", type=int, default=1000)
+    ap.add_argument("--decoys", type=float, default=0.1,
+                    help="share of reference rows whose bill is not in the ZIP")
+    ap.add_argument("--pdf-share", type=float, default=0.2,
+                    help="share of bills saved as 2-page PDFs (half text, half scanned)")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--cache", action="store_true", help="keep the OCR result cache on")
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    if not args.cache:
+        os.environ["OCR_CACHE_MAX_MB"] = "0"
+    global app
+    import app  # noqa: E402  (after OCR_CACHE_MAX_MB is set)
+
+    noop = lambda *a, **k: None
+    out = {"config": vars(args), "ocr_backend": app.OCR_BACKEND,
+           "ocr_pool_size": app.get_ocr_pool().size, "stages": {}}
+    stages = out["stages"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t = time.perf_counter()
+        zip_path, csv_path, truth = generate(tmp, args.bills, args.rows, args.decoys,
+                                             args.pdf_share, args.seed)
+        print(f"generated {args.bills} bills, {args.rows} rows "
+              f"in {time.perf_counter() - t:.1f}s")
+
+        ref_rows = stage(stages, "reference", len, lambda: app.read_reference(csv_path))
+
+        work_dir = os.path.join(tmp, "work")
+        bill_images, ocr_cache, duplicates = stage(
+            stages, "ocr", lambda out: len(out[0]), lambda: app.ocr_archive(
+                zip_path, work_dir, noop, noop, app.JobTimings()))
+        out["duplicates"] = len(duplicates)
+
+        results = stage(stages, "match", len,
+                        lambda: list(app.match_results(ref_rows, ocr_cache, noop, noop)))
+        stage(stages, "report", len(results), lambda: app.generate_excel(
+            results, os.path.join(tmp, "report.xlsx"), duplicates=duplicates))
+
+    out["total_seconds"] = round(sum(s["seconds"] for s in stages.values()), 4)
+    out["accuracy"] = accuracy(results, truth)
+    print(json.dumps(out["accuracy"]))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(out, f, indent=2)
+    app.get_ocr_pool().close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Cold-start benchmark of the web server.
+
+    python benchmarks/bench_startup.py [--server flask|gunicorn|both] [--repeat N] [--json OUT]
+
+Starts the server on a free port and measures the time from process
+spawn until GET / first answers 200, then the peak RSS of the server
+processes (gunicorn master plus workers) right after that first
+response. Each mode is started --repeat times and the median is kept.
+
+    flask      python app.py serve      (development server)
+    gunicorn   gunicorn -c gunicorn.conf.py wsgi:app
+
+With --preload-heavy the gunicorn master also imports the PDF, dataframe
+and fuzzy-matching libraries before forking (PRELOAD_HEAVY_MODULES=1);
+otherwise gunicorn.conf.py's default applies (on only with more than one
+worker). Worker count follows WEB_CONCURRENCY as in gunicorn.conf.py.
+"""
+import argparse, json, os, signal, socket, statistics, subprocess, sys, time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COMMANDS = {
+    "flask":    [sys.executable, "app.py", "serve"],
+    "gunicorn": [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def tree_rss_mb(pid):
+    import app
+    pids = [pid]
+    for p in pids:
+        try:
+            for tid in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{tid}/children") as f:
+                    pids.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+    return sum(app._proc_rss_mb(p) or 0.0 for p in pids)
+
+
+def start_once(mode, preload_heavy, timeout):
+    port = free_port()
+    env = dict(os.environ, PORT=str(port))
+    if preload_heavy:
+        env["PRELOAD_HEAVY_MODULES"] = "1"
+    t = time.perf_counter()
+    proc = subprocess.Popen(COMMANDS[mode], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{mode} exited with code {proc.returncode}")
+            if time.perf_counter() - t > timeout:
+                raise RuntimeError(f"{mode} did not answer within {timeout}s")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as r:
+                    if r.status == 200:
+                        break
+            except OSError:
+                time.sleep(0.02)
+        secs = time.perf_counter() - t
+        return secs, tree_rss_mb(proc.pid)
+    finally:
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        proc.wait()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--server", choices=["flask", "gunicorn", "both"], default="both")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--preload-heavy", action="store_true")
+    ap.add_argument("--timeout", type=float, default=60)
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    modes = ["flask", "gunicorn"] if args.server == "both" else [args.server]
+    out = {"config": vars(args), "servers": {}}
+    for mode in modes:
+        runs = [start_once(mode, args.preload_heavy, args.timeout) for _ in range(args.repeat)]
+        secs = [s for s, _ in runs]
+        rss = [r for _, r in runs]
+        out["servers"][mode] = {"first_response_s": round(statistics.median(secs), 4),
+                                "min_s": round(min(secs), 4), "max_s": round(max(secs), 4),
+                                "rss_mb": round(statistics.median(rss), 1)}
+        print(f"{mode:9s} first response {statistics.median(secs):7.3f}s "
+              f"(min {min(secs):.3f}, max {max(secs):.3f})  RSS {statistics.median(rss):.0f} MB")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(out, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Gunicorn settings for the audit web app.
+
+The app is loaded once in the master (preload_app) and forked, so workers
+share its memory copy-on-write. Importing app is cheap: PDF, dataframe,
+fuzzy-matching and Excel libraries load lazily on first use. With more
+than one worker the master imports them before forking instead
+(PRELOAD_HEAVY_MODULES, default on only when workers > 1), so their pages
+are shared rather than each worker loading its own copy on its first
+audit; a single worker keeps the fast cold start.
+
+Threads (janitor, audit scheduler, metrics flush) and the OCR worker pool
+are per process and only start after the fork, in post_worker_init.
+
+Memory, sized for a 512 MB instance (PSS, measured):
+
+    master + 1 worker, idle                 ~40 MB
+    heavy modules, once an audit ran        ~90 MB
+    each further worker (modules preloaded) ~10 MB, plus what an audit
+                                            dirties of the shared pages
+    OCR pool (OCR_MEMORY_BUDGET_MB)         380 MB
+                                            -------
+                                            ~510 MB
+
+Every gunicorn worker runs its own OCR pool, so app.py gives each one
+OCR_MEMORY_BUDGET_MB / WEB_CONCURRENCY and OCR_MAX_WORKERS / WEB_CONCURRENCY;
+adding workers splits the budget rather than multiplying it. One worker is
+the default: its threads already serve the UI and event streams, and all
+audits share one scheduler queue whichever worker accepted them.
+"""
+import os
+
+bind             = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers          = int(os.environ.get("WEB_CONCURRENCY", 1))
+# gthread: /events streams hold a thread each for the length of an audit
+worker_class     = "gthread"
+threads          = int(os.environ.get("GUNICORN_THREADS", 8))
+preload_app      = True
+# gthread: seconds a worker may go without notifying the master before it
+# is killed and restarted; not a limit on request or upload duration
+timeout          = 120
+graceful_timeout = 30
+accesslog        = "-"
+
+HEAVY_MODULES = ["numpy", "pandas", "fitz", "rapidfuzz.fuzz", "rapidfuzz.process",
+                 "openpyxl"]
+
+
+def on_starting(server):
+    if os.environ.get("PRELOAD_HEAVY_MODULES", "1" if workers > 1 else "0") == "1":
+        import importlib
+        for name in HEAVY_MODULES:
+            importlib.import_module(name)
+
+
+def post_worker_init(worker):
+    from app import start_background
+    start_background()
@@ -0,0 +1,14 @@
+"""
+Point the app's on-disk state (job store, OCR cache, OCR queue) at a
+throwaway directory before app is imported, so tests never touch /tmp
+state shared with a running server.
+"""
+import os, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_state = tempfile.mkdtemp(prefix="audit-tests-")
+os.environ.setdefault("JOB_DB_PATH", os.path.join(_state, "jobs.sqlite3"))
+os.environ.setdefault("OCR_CACHE_DIR", os.path.join(_state, "ocr_cache"))
+os.environ.setdefault("OCR_QUEUE_DIR", os.path.join(_state, "ocr_queue"))
@@ -0,0 +1,19 @@
+import app
+
+
+def test_dir_bill_files_skips_ignored_folders(tmp_path):
+    (tmp_path / "march").mkdir()
+    (tmp_path / "__MACOSX").mkdir()
+    for rel in ("march/a.jpg", "march/notes.txt", "__MACOSX/._a.jpg", "b.pdf"):
+        (tmp_path / rel).write_bytes(b"x")
+    assert [rel for _, rel in app.dir_bill_files(str(tmp_path))] == ["b.pdf", "march/a.jpg"]
+
+
+def test_ocr_pool_takes_explicit_size_and_budget(monkeypatch):
+    monkeypatch.setattr(app, "_ocr_pool", None)
+    monkeypatch.setattr(app, "OCR_MEMORY_BUDGET_MB", 380)
+    pool = app.get_ocr_pool(size=8, budget_mb=8 * 220)
+    assert (pool.size, pool.budget.total_mb) == (8, 8 * 220)
+    assert app.get_ocr_pool() is pool
+    monkeypatch.setattr(app, "_ocr_pool", None)
+    assert app.get_ocr_pool(size=8, budget_mb=200).size == 200 // app.OCR_TASK_BASE_MB
@@ -0,0 +1,82 @@
+import random, threading, time, uuid
+
+import app
+
+
+class FakePool:
+    """Stands in for the OCR pool: thumbnails always compare as identical."""
+
+    size = 2
+
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def run(self, task, payload=None):
+        if self.fail:
+            raise TimeoutError("compare timed out")
+        return {"diff": 0.0}
+
+
+def claim_all(finder, n, reverse=True):
+    """Claim indexes 0..n-1 from racing threads, highest index started first."""
+    originals = {}
+
+    def claim(i):
+        originals[i] = finder.claim(i, f"img{i}.png")
+
+    threads = [threading.Thread(target=claim, args=(i,)) for i in range(n)]
+    for t in (reversed(threads) if reverse else threads):
+        t.start()
+    for t in threads:
+        t.join()
+    return originals
+
+
+def test_first_image_of_cluster_is_original(tmp_path, monkeypatch):
+    def slow_hash(source, thumb_path):
+        time.sleep(random.uniform(0, 0.02))     # hashes finish out of order
+        open(thumb_path, "wb").close()
+        return 0x0F0F0F0F0F0F0F0F
+
+    monkeypatch.setattr(app, "image_dhash", slow_hash)
+    monkeypatch.setattr(app, "get_ocr_pool", lambda: FakePool())
+    for _ in range(5):
+        finder = app.DuplicateFinder(str(tmp_path / "thumbs"))
+        originals = claim_all(finder, 8)
+        assert originals[0] is None
+        assert finder.duplicates == {i: (0, 0) for i in range(1, 8)}
+
+
+def test_compare_failure_keeps_image_as_original(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "image_dhash", lambda source, thumb_path: 1)
+    monkeypatch.setattr(app, "get_ocr_pool", lambda: FakePool(fail=True))
+    finder = app.DuplicateFinder(str(tmp_path / "thumbs"))
+    assert claim_all(finder, 3) == {0: None, 1: None, 2: None}
+    assert finder.duplicates == {}
+
+
+def test_no_duplicate_detection_in_queue_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "get_ocr_queue", lambda: object())
+    assert app.duplicate_finder(str(tmp_path / "thumbs")) is None
+
+
+def test_cached_images_are_not_hashed(tmp_path, monkeypatch):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"img{i}.png"
+        path.write_bytes(uuid.uuid4().bytes)
+        paths.append(str(path))
+    cache = app.get_ocr_cache()
+    cache.put(cache.key_for(paths[1]), "cached text")
+
+    hashed = []
+    monkeypatch.setattr(app, "image_dhash",
+                        lambda source, thumb_path: hashed.append(source))
+    monkeypatch.setattr(app, "ocr_image", lambda path, info=None: "fresh text")
+    monkeypatch.setattr(app, "get_ocr_pool", lambda: FakePool())
+    stats = {"hits": 0, "misses": 0}
+    texts = app.ocr_images_parallel(paths, stats=stats,
+                                    dedup=app.DuplicateFinder(str(tmp_path / "thumbs")))
+    assert texts == ["fresh text", "cached text", "fresh text"]
+    assert sorted(hashed) == [paths[0], paths[2]]
+    assert stats == {"hits": 1, "misses": 2}
@@ -0,0 +1,123 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import app
+
+
+def new_job(**fields):
+    job_id = uuid.uuid4().hex[:8]
+    app.job_store.create(job_id, **fields)
+    return job_id
+
+
+def test_reporter_batches_logs_in_order(monkeypatch):
+    job_id = new_job()
+    writes = []
+    real = app.job_store.append_logs
+    monkeypatch.setattr(app.job_store, "append_logs",
+                        lambda j, entries: (writes.append(len(entries)), real(j, entries)))
+    monkeypatch.setattr(app, "JOB_LOG_FLUSH_SECS", 3600)
+    log, update, flush = app.job_reporter(job_id)
+    for i in range(app.JOB_LOG_BATCH * 2 + 3):
+        log(f"row {i}")
+    flush()
+    assert writes == [app.JOB_LOG_BATCH, app.JOB_LOG_BATCH, 3]
+    logs = app.job_store.logs_since(job_id, 0)
+    assert [l["seq"] for l in logs] == list(range(1, len(logs) + 1))
+    assert logs[-1]["msg"] == f"row {app.JOB_LOG_BATCH * 2 + 2}"
+
+
+def test_progress_update_flushes_pending_logs(monkeypatch):
+    job_id = new_job()
+    monkeypatch.setattr(app, "JOB_LOG_FLUSH_SECS", 3600)
+    log, update, flush = app.job_reporter(job_id)
+    log("reading")
+    assert app.job_store.logs_since(job_id, 0) == []
+    update(10, "step")
+    assert [l["msg"] for l in app.job_store.logs_since(job_id, 0)] == ["reading"]
+
+
+def test_log_ring_buffer_keeps_last_lines(monkeypatch):
+    monkeypatch.setattr(app, "JOB_LOG_LIMIT", 5)
+    job_id = new_job()
+    app.job_store.append_logs(job_id, [(f"m{i}", "info") for i in range(8)])
+    logs = app.job_store.logs_since(job_id, 0)
+    assert [l["seq"] for l in logs] == [4, 5, 6, 7, 8]
+
+
+def dead_owner():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return f"{socket.gethostname()}:{proc.pid}"
+
+
+def test_dead_owner_job_is_requeued_once_then_failed(tmp_path):
+    store = app.SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+    zip_path = tmp_path / "bills.zip"
+    zip_path.write_bytes(b"PK")
+    store.enqueue("j1", {"zip_path": str(zip_path)}, limit=5)
+    assert store.claim_next(1, dead_owner())[0] == "j1"
+    assert store.claim_next(1, "other:1") is None
+
+    assert store.reap_orphans(timeout=3600) == {"j1": "queued"}
+    assert store.get("j1")["status"] == "queued"
+    job_id, inputs = store.claim_next(1, dead_owner())
+    assert inputs["requeued"]
+
+    assert store.reap_orphans(timeout=3600) == {"j1": "error"}
+    job = store.get("j1")
+    assert job["status"] == "error" and "stopped" in job["error"]
+    assert store.logs_since("j1", 0)[-1]["type"] == "err"
+
+
+def test_stale_heartbeat_releases_slot(tmp_path):
+    store = app.SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+    owner = f"elsewhere:{os.getpid()}"
+    store.enqueue("live", {}, limit=5)
+    store.enqueue("gone", {}, limit=5)
+    store.claim_next(2, owner)
+    store.claim_next(2, "other-host:1")
+    time.sleep(0.05)
+    store.heartbeat(owner)
+
+    assert store.reap_orphans(timeout=0.03) == {"gone": "error"}
+    assert store.get("live")["status"] == "processing"
+    assert store.active_count() == 1
+
+
+def test_ocr_share_follows_running_audits(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "get_ocr_queue", lambda: None)
+    monkeypatch.setattr(app, "get_ocr_pool", lambda: type("Pool", (), {"size": 4})())
+    sched = app.AuditScheduler(app.SQLiteJobStore(str(tmp_path / "jobs.sqlite3")),
+                               max_running=2)
+    a = app.OCRShare(sched.ocr_limit)
+    sched._set_share("a", a)
+    assert a.limit() == 4                # a lone audit gets the whole pool
+    sched._set_share("b", app.OCRShare(sched.ocr_limit))
+    assert a.limit() == 2
+    sched._set_share("b", None)
+    assert a.limit() == 4
+
+
+def test_ocr_share_admits_more_when_limit_grows():
+    limit = [1]
+    share = app.OCRShare(lambda: limit[0])
+    entered = threading.Event()
+
+    def second():
+        with share:
+            entered.set()
+
+    with share:
+        t = threading.Thread(target=second)
+        t.start()
+        assert not entered.wait(0.1)
+        limit[0] = 2
+        share.changed()
+        assert entered.wait(2)
+    t.join(2)
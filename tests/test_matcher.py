@@ -0,0 +1,127 @@
+"""
+BatchScorer scores each bill's rows only against its OCRIndex candidates
+and rescores against every text just the lines a non-candidate could still
+win. It must pick the same bill with the same score as the original
+brute-force loop, which ran score_match() on every (row, bill) pair and
+kept the first maximum.
+"""
+import csv, random
+
+import pytest
+
+import app
+
+VENDORS = ["Sharma Traders", "Gupta Stores", "Patel Provisions", "Mehta Dairy",
+           "Singh Poultry", "Rao Vegetables", "Iyer Spices", "Khan Meat Supply"]
+ITEMS = ["Rice 25kg", "Toor Dal 1kg", "Sunflower Oil 15L", "Sugar 50kg",
+         "Milk 10L", "Paneer 5kg", "Chicken 10kg", "Onion 20kg", "Tomato 15kg"]
+NOISE = ["tax invoice", "gstin 27abcde1234f1z5", "thank you visit again",
+         "cgst 2.5%", "sgst 2.5%", "total", "cash", "qty rate amount"]
+
+
+def garble(text, rnd, rate):
+    """OCR-style damage: dropped and swapped characters."""
+    out = []
+    for ch in text:
+        roll = rnd.random()
+        if roll < rate:
+            continue
+        out.append(rnd.choice("0oOl1I5S") if roll < rate * 2 else ch)
+    return "".join(out)
+
+
+def make_dataset(seed, n_bills=40, n_rows=300):
+    rnd = random.Random(seed)
+    bills = []
+    for k in range(n_bills):
+        day, month = rnd.randint(1, 28), rnd.randint(1, 12)
+        bill_no = rnd.choice([f"INV-{1000 + k}", f"{200 + k}", f"SB/{k:03d}/26",
+                              f"A{k}"])
+        items = [(item, rnd.randint(1, 9), float(rnd.randint(20, 900)))
+                 for item in rnd.sample(ITEMS, rnd.randint(1, 4))]
+        bills.append({"bill_no": bill_no, "vendor": rnd.choice(VENDORS),
+                      "date": f"2026-{month:02d}-{day:02d}", "items": items})
+
+    ocr_cache = []
+    for k, bill in enumerate(bills):
+        parts = rnd.sample(NOISE, 3)
+        if rnd.random() < 0.8:
+            parts.append(f"bill no {bill['bill_no']}")
+        if rnd.random() < 0.8:
+            parts.append(bill["vendor"])
+        for item, qty, rate in bill["items"]:
+            parts.append(f"{item} {qty} {rate:.2f} {qty * rate:.2f}")
+        rnd.shuffle(parts)
+        text = app.normalize(garble(" ".join(parts), rnd, rnd.choice([0, 0.02, 0.08])))
+        if rnd.random() < 0.6:
+            fname = f"{bill['date'][8:10]}_{bill['date'][5:7]}_{bill['date'][2:4]}_{k}.jpg"
+        else:
+            fname = f"scan_{k}.jpg"
+        ocr_cache.append((f"branch_{k % 3}/{fname}", fname,
+                          app.extract_date_from_filename(fname), text))
+    # Two bills with identical text: ties must go to the first
+    ocr_cache.append(("copies/copy.jpg", "copy.jpg", None, ocr_cache[0][3]))
+
+    rows = []
+    for i in range(n_rows):
+        if rnd.random() < 0.15:
+            rows.append([f"XX-{9000 + i}", rnd.choice(VENDORS), rnd.choice(ITEMS),
+                         "99.00", "2025-06-15", "Main", "1", "99.00"])
+            continue
+        bill = rnd.choice(bills)
+        item, qty, rate = rnd.choice(bill["items"])
+        rows.append([bill["bill_no"], bill["vendor"], item, f"{qty * rate:.2f}",
+                     bill["date"] if rnd.random() < 0.9 else "2026-01-01",
+                     "Main", str(qty), f"{rate:.2f}"])
+    return ocr_cache, rows
+
+
+def brute_force(ref_rows, ocr_cache):
+    out = []
+    for ref in ref_rows:
+        best_score, best_path = 0, ""
+        for img_path, fname, file_date, text in ocr_cache:
+            s = app.score_match(ref.bill_number, ref.vendor_norm, ref.item_norm,
+                                ref.total_norm, text, ref.date_key, file_date)
+            if s > best_score:
+                best_score, best_path = s, img_path
+        out.append((best_score, best_path))
+    return out
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3, 4])
+def test_matches_brute_force(tmp_path, seed):
+    ocr_cache, rows = make_dataset(seed)
+    path = tmp_path / "reference.csv"
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(app.REFERENCE_COLUMNS)
+        w.writerows(rows)
+    ref_rows = app.read_reference(str(path))
+    noop = lambda *a, **k: None
+
+    results = list(app.match_results(ref_rows, ocr_cache, noop, noop))
+
+    expected = brute_force(ref_rows, ocr_cache)
+    assert len(results) == len(expected)
+    for r, (score, img_path) in zip(results, expected):
+        assert r["confidence"] == score
+        got = f"{r['folder']}/{r['file_name']}" if r["file_name"] else ""
+        assert got == img_path
+        assert r["match_status"] == app.classify(score)[0]
+
+
+def test_fuzzy_ratios_restricted_to_candidates(monkeypatch):
+    ocr_cache, rows = make_dataset(5, n_bills=200, n_rows=400)
+    ref_rows = [app.RefRow(*row, app.normalize(row[1]), app.normalize(row[2]),
+                           app.normalize(row[3]), row[4][:10]) for row in rows]
+    widths = []
+    cdist = app.process.cdist
+    monkeypatch.setattr(app.process, "cdist",
+                        lambda q, texts, **kw: (widths.append(len(texts)),
+                                                cdist(q, texts, **kw))[1])
+    noop = lambda *a, **k: None
+    list(app.match_results(ref_rows, ocr_cache, noop, noop))
+    full = sum(w == len(ocr_cache) for w in widths)
+    assert full <= 3                     # one block of fallback lines
+    assert sum(widths) < len(widths) * len(ocr_cache) / 4
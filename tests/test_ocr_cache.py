@@ -0,0 +1,39 @@
+import app
+
+
+def stored_bytes(cache):
+    db = cache._conn()
+    total = db.execute("SELECT bytes FROM ocr_cache_total").fetchone()[0]
+    assert total == db.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+    return total
+
+
+def test_put_evicts_least_recently_used(tmp_path):
+    cache = app.OCRCache(str(tmp_path), max_mb=1)
+    cache.max_bytes = 300
+    for i in range(3):
+        cache.put(f"k{i}", "x" * 100)
+    assert cache.get("k0") == "x" * 100          # k1 is now the oldest
+    cache.put("k3", "y" * 100)
+    assert cache.get("k1") is None
+    assert {k: cache.get(k) is not None for k in ("k0", "k2", "k3")} == \
+           {"k0": True, "k2": True, "k3": True}
+    assert stored_bytes(cache) == 300
+
+
+def test_total_follows_replacements(tmp_path):
+    cache = app.OCRCache(str(tmp_path), max_mb=1)
+    cache.put("a", "x" * 50)
+    cache.put("a", "x" * 10)
+    assert cache.get("a") == "x" * 10
+    assert stored_bytes(cache) == 10
+
+
+def test_total_is_rebuilt_for_an_existing_cache(tmp_path):
+    cache = app.OCRCache(str(tmp_path), max_mb=1)
+    cache.put("a", "x" * 40)
+    db = cache._conn()
+    db.execute("DROP TABLE ocr_cache_total")
+    db.commit()
+    reopened = app.OCRCache(str(tmp_path), max_mb=1)
+    assert stored_bytes(reopened) == 40
@@ -0,0 +1,79 @@
+import os
+import time
+
+import pytest
+
+import app
+
+# Speaks the worker protocol; "op" picks what it does with a task
+FAKE_WORKER = r'''
+import json, os, sys, time
+for line in iter(sys.stdin.readline, ""):
+    task = json.loads(line)
+    if task["op"] == "hang":
+        time.sleep(60)
+    if task["op"] == "crash":
+        os._exit(1)
+    print(json.dumps({"pid": os.getpid()}), flush=True)
+'''
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    script = tmp_path / "fake_worker.py"
+    script.write_text(FAKE_WORKER)
+    monkeypatch.setattr(app, "WORKER_PATH", str(script))
+    monkeypatch.setattr(app, "ensure_worker_script", lambda: None)
+    pools = []
+
+    def make(**kwargs):
+        pools.append(app.OCRWorkerPool(size=1, **kwargs))
+        return pools[-1]
+
+    yield make
+    for p in pools:
+        p.close()
+
+
+def pid(pool):
+    return pool.run({"op": "pid"})["pid"]
+
+
+def gone(pid):
+    return not os.path.exists(f"/proc/{pid}")
+
+
+def test_worker_recycled_after_max_tasks(pool):
+    p = pool(max_tasks=2)
+    first = [pid(p), pid(p)]
+    assert first[0] == first[1]
+    assert pid(p) != first[0]
+    assert gone(first[0])
+
+
+def test_worker_recycled_over_rss_limit(pool):
+    p = pool(max_rss_mb=0)
+    pids = [pid(p) for _ in range(3)]
+    assert len(set(pids)) == 3
+    assert all(gone(x) for x in pids[:2])
+
+
+def test_hung_task_is_killed_and_pool_recovers(pool):
+    p = pool(timeout=0.5)
+    hung = pid(p)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        p.run({"op": "hang"})
+    assert time.monotonic() - start < 5
+    assert gone(hung)
+    assert pid(p) != hung
+
+
+def test_crashed_worker_is_replaced(pool):
+    p = pool()
+    crashed = pid(p)
+    with pytest.raises(EOFError):
+        p.run({"op": "crash"})
+    assert gone(crashed)
+    assert pid(p) != crashed
+    assert p._spawned == 1
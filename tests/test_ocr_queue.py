@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "OCR_QUEUE_POLL_SECS", 0.01)
+    image = tmp_path / "bill.png"
+    image.write_bytes(b"not really a png")
+    q = app.SQLiteOCRQueue(str(tmp_path / "queue"))
+    q.image = str(image)
+    return q
+
+
+def test_claim_complete_round_trip(queue):
+    task_id = queue.submit(queue.image)
+    claimed_id, token, path = queue.claim("w1")
+    assert claimed_id == task_id
+    with open(path, "rb") as f:
+        assert f.read() == b"not really a png"
+    assert queue.claim("w2") is None
+    assert not queue.complete(task_id, "stale-token", {"text": "x"})
+    assert queue.complete(task_id, token, {"text": "INV 42", "passes": []})
+    assert queue.wait(task_id, timeout=1) == {"text": "INV 42", "passes": []}
+
+
+def test_expired_lease_is_requeued_to_another_worker(queue, monkeypatch):
+    monkeypatch.setattr(app, "OCR_QUEUE_LEASE_SECS", 0)
+    task_id = queue.submit(queue.image)
+    _, first, _ = queue.claim("w1")
+    time.sleep(0.01)
+    claimed_id, second, _ = queue.claim("w2")
+    assert claimed_id == task_id and second != first
+    assert not queue.complete(task_id, first, {"text": "late"})
+    assert queue.complete(task_id, second, {"text": "ok"})
+    assert queue.wait(task_id, timeout=1)["text"] == "ok"
+
+
+def test_task_fails_after_max_attempts(queue, monkeypatch):
+    monkeypatch.setattr(app, "OCR_QUEUE_LEASE_SECS", 0)
+    monkeypatch.setattr(app, "OCR_QUEUE_MAX_ATTEMPTS", 2)
+    queue.beat("w1")
+    task_id = queue.submit(queue.image)
+    for _ in range(2):
+        assert queue.claim("w1")[0] == task_id
+        time.sleep(0.01)
+    assert queue.claim("w1") is None
+    assert queue.wait(task_id, timeout=1) is None
+
+
+def test_timeout_counts_from_claim_not_submit(queue, monkeypatch):
+    monkeypatch.setattr(app, "OCR_QUEUE_CLAIM_SECS", 5)
+    queue.beat("w1")
+    task_id = queue.submit(queue.image)
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(queue.wait(task_id, timeout=0.2)))
+    waiter.start()
+    time.sleep(0.4)            # queued for longer than the timeout
+    _, token, _ = queue.claim("w1")
+    queue.complete(task_id, token, {"text": "ok"})
+    waiter.join(2)
+    assert result == [{"text": "ok"}]
+
+
+def test_no_worker_fails_the_audit(queue, monkeypatch):
+    monkeypatch.setattr(app, "OCR_QUEUE_CLAIM_SECS", 0.05)
+    task_id = queue.submit(queue.image)
+    with pytest.raises(app.OCRQueueUnavailable, match="python app.py worker"):
+        queue.wait(task_id, timeout=60)
+    monkeypatch.setattr(app, "get_ocr_queue", lambda: queue)
+    with pytest.raises(app.OCRQueueUnavailable):
+        app.ocr_image(queue.image)
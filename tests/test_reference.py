@@ -0,0 +1,64 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+import app
+
+HEADER = ["Bill Number", "Vendor Name", "Item Name", "Item Total", "Bill Date",
+          "Branch Name", "Quantity"]                # no Rate column
+ROWS = [
+    ["INV-1", "Sharma Traders", "Rice 25kg", 1500, "2026-01-09", "Main", 1],
+    [12345, "Gupta Stores", "Dal", 200.25, "2026-01-10", "Main", 2],
+    ["INV-3", "Gupta Stores", "Sugar", 80, "2026-01-11", "Main", 3],
+    ["INV-4", "", "Salt", None, None, None, 4],     # blanks only in a later chunk
+    [None, "Sharma Traders", "Oil", 1200, "2026-01-12", "Annex", 5],
+]
+
+
+def old_rows(df):
+    """How the report rendered rows before read_reference(): iterrows + str()."""
+    df.columns = df.columns.str.strip()
+    return [[str(row.get(c, "")) for c in app.REFERENCE_COLUMNS] for _, row in df.iterrows()]
+
+
+def new_rows(path):
+    return [list(r[:len(app.REFERENCE_COLUMNS)]) for r in app.read_reference(path, chunksize=2)]
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "zoho.csv"
+    pd.DataFrame(ROWS, columns=HEADER).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def xlsx_path(tmp_path):
+    import openpyxl
+    wb = openpyxl.Workbook()
+    wb.active.append(HEADER)
+    for row in ROWS:
+        date = row[4] and datetime.datetime.strptime(row[4], "%Y-%m-%d")
+        wb.active.append(row[:4] + [date] + row[5:])
+    path = tmp_path / "zoho.xlsx"
+    wb.save(path)
+    return str(path)
+
+
+def test_csv_values_render_as_before(csv_path):
+    rows = new_rows(csv_path)
+    assert rows == old_rows(pd.read_csv(csv_path))
+    assert rows[0][3] == "1500.0" and rows[3][3] == "nan" and rows[4][0] == "nan"
+
+
+def test_xlsx_values_render_as_before(xlsx_path):
+    rows = new_rows(xlsx_path)
+    assert rows == old_rows(pd.read_excel(xlsx_path, engine="openpyxl"))
+    assert rows[0][4] == "2026-01-09 00:00:00" and rows[3][4] == "NaT"
+
+
+def test_normalised_fields_come_from_rendered_values(csv_path):
+    ref = app.read_reference(csv_path)[1]
+    assert (ref.bill_number, ref.total_norm, ref.date_key) == ("12345", "200 25",
+                                                              "2026-01-10")
@@ -0,0 +1,99 @@
+import csv
+import importlib.util
+import io
+import json
+import uuid
+
+import pytest
+
+import app
+
+STATUSES = ["Matched", "Not Found", "Mismatch / Duplicate", "Matched"]
+
+
+def sample_rows(n=11):
+    return [{"file_name": f"bill_{i}.jpg", "folder": "march", "bill_number": f"INV-{i}",
+             "bill_date": f"2026-03-{i + 1:02d}", "vendor_name": "Sharma Traders",
+             "customer_name": "", "item_description": "cement, 50 kg",
+             "quantity": i, "rate": 12.5, "total_amount": 12.5 * i + 0.25,
+             "confidence": "" if i == 7 else 10 * i,
+             "match_status": STATUSES[i % len(STATUSES)], "match_detail": f"row {i}"}
+            for i in range(n)]
+
+
+@pytest.fixture
+def job(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "RESULTS_GROUP_ROWS", 4)
+    job_id = uuid.uuid4().hex[:8]
+    app.job_store.create(job_id, status="done", report_path=str(tmp_path / "report.xlsx"))
+    app.store_results(job_id, sample_rows(), [("march/b.jpg", "march/a.jpg", 2)])
+    return job_id
+
+
+def test_put_results_get_results_round_trip():
+    job_id = uuid.uuid4().hex[:8]
+    app.job_store.put_results(job_id, "results", 0, {"a": b"\x00\x01", "b": b"zz"})
+    app.job_store.put_results(job_id, "results", 1, {"a": b"second"})
+    assert app.job_store.result_groups(job_id, "results") == [0, 1]
+    assert app.job_store.get_results(job_id, "results", 0, ["a", "b"]) == \
+        {"a": b"\x00\x01", "b": b"zz"}
+    assert app.job_store.get_results(job_id, "results", 1, ["a"]) == {"a": b"second"}
+    assert app.job_store.result_groups(job_id, "other") == []
+
+
+def test_result_columns_round_trip(job):
+    results = app.ResultColumns(app.job_store, job)
+    assert app.job_store.result_groups(job, "results") == [0, 1, 2]
+    assert list(results.rows()) == sample_rows()
+    duplicates = app.ResultColumns(app.job_store, job, "duplicates", app.DUPLICATE_FIELDS)
+    assert list(duplicates.rows()) == [{"rel_path": "march/b.jpg",
+                                        "original_rel_path": "march/a.jpg", "distance": 2}]
+
+
+def test_results_filter_and_pagination(job):
+    client = app.app.test_client()
+    expected = [r for r in sample_rows() if r["match_status"] == "Matched"]
+    page = client.get(f"/results/{job}?status=Matched&limit=2").get_json()
+    assert page["total"] == len(expected) and page["next_offset"] == 2
+    rows = page["rows"]
+    while page["next_offset"] is not None:
+        page = client.get(f"/results/{job}?status=Matched&limit=2"
+                          f"&offset={page['next_offset']}").get_json()
+        rows += page["rows"]
+    assert rows == expected
+
+    page = client.get(f"/results/{job}?min_confidence=30&max_confidence=80").get_json()
+    assert [r["confidence"] for r in page["rows"]] == [30, 40, 50, 60, 80]
+    assert client.get(f"/results/{job}?limit=x").status_code == 400
+    assert client.get("/results/missing").status_code == 404
+
+
+def xlsx_rows(client, job_id):
+    import openpyxl
+    data = client.get(f"/download/{job_id}").data
+    ws = openpyxl.load_workbook(io.BytesIO(data), read_only=True)["Audit Report"]
+    return [["" if v is None else v for v in row]
+            for row in ws.iter_rows(min_row=2, values_only=True)]
+
+
+def test_csv_and_jsonl_exports_match_xlsx(job):
+    client = app.app.test_client()
+    expected = xlsx_rows(client, job)
+    assert len(expected) == len(sample_rows())
+
+    body = client.get(f"/download/{job}?format=csv").data.decode()
+    header, *rows = csv.reader(io.StringIO(body))
+    assert header == app.REPORT_FIELDS
+    assert rows == [[str(v) for v in row] for row in expected]
+
+    lines = client.get(f"/download/{job}?format=jsonl").data.decode().splitlines()
+    assert [[json.loads(line)[f] for f in app.REPORT_FIELDS] for line in lines] == expected
+
+
+def test_parquet_without_pyarrow_is_501(job, monkeypatch):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(app.importlib.util, "find_spec",
+                        lambda name, *a: None if name == "pyarrow" else find_spec(name, *a))
+    resp = app.app.test_client().get(f"/download/{job}?format=parquet")
+    assert resp.status_code == 501
+    assert b"pyarrow" in resp.data
@@ -0,0 +1,143 @@
+import io
+import json
+import os
+import uuid
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """A job store of our own, with the scheduler kept from claiming jobs."""
+    s = app.SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(app, "job_store", s)
+    monkeypatch.setattr(app.scheduler, "max_running", 0)
+    monkeypatch.setattr(app, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    return s
+
+
+def sse_events(body):
+    """(id, event, data) of each event in a text/event-stream body."""
+    events = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines()
+                      if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            events.append((fields.get("id"), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_events_resume_from_last_event_id(store):
+    job_id = uuid.uuid4().hex[:8]
+    store.create(job_id, status="done", progress=100, step="Audit complete")
+    store.append_logs(job_id, [("first", "info"), ("second", "ok"), ("third", "err")])
+    client = app.app.test_client()
+
+    events = sse_events(client.get(f"/events/{job_id}").get_data(as_text=True))
+    assert [(i, e["msg"]) for i, kind, e in events if kind == "log"] == \
+        [("1", "first"), ("2", "second"), ("3", "third")]
+    assert events[-1][1:] == ("end", {"status": "done", "progress": 100,
+                                      "step": "Audit complete", "summary": {},
+                                      "error": None})
+
+    resumed = sse_events(client.get(f"/events/{job_id}",
+                                    headers={"Last-Event-ID": "2"}).get_data(as_text=True))
+    assert [(i, e["msg"]) for i, kind, e in resumed if kind == "log"] == [("3", "third")]
+    assert client.get("/events/missing").status_code == 404
+
+
+def test_start_queues_then_429_with_retry_after(store, monkeypatch):
+    monkeypatch.setattr(app, "JOB_QUEUE_SIZE", 1)          # room for 2 jobs
+    client = app.app.test_client()
+
+    def start():
+        return client.post("/start", data={"zip_file": (io.BytesIO(b"PK"), "bills.zip")})
+
+    first, second = start().get_json(), start().get_json()
+    assert (first["queue_position"], second["queue_position"]) == (1, 2)
+    assert client.get(f"/status/{second['job_id']}").get_json()["queue_position"] == 2
+
+    full = start()
+    assert full.status_code == 429
+    assert full.headers["Retry-After"] == str(app.QUEUE_RETRY_AFTER)
+    # Filled up between the check and enqueue: the upload is not kept
+    with monkeypatch.context() as m:
+        m.setattr(store, "active_count", lambda: 0)
+        assert start().status_code == 429
+    assert sorted(os.listdir(app.UPLOAD_FOLDER)) == sorted([first["job_id"],
+                                                            second["job_id"]])
+
+    store.claim_next(1, "test:1")                   # first job starts running
+    assert client.get(f"/status/{second['job_id']}").get_json()["queue_position"] == 1
+
+
+REFERENCE = (b"Bill Number,Vendor Name,Item Name,Item Total,Bill Date\n"
+             b"INV-12345,Sharma Traders,Rice 25kg,1500,2026-01-09\n"
+             b"INV-999,Gupta Stores,Sugar,80,2026-01-10\n")
+
+
+def test_reaudit_matches_stored_ocr_against_new_reference(store):
+    source = uuid.uuid4().hex[:8]
+    corpus = [("jan/09_01_26.jpg", "09_01_26.jpg", "2026-01-09",
+               "sharma traders invoice inv 12345 rice 25kg 1500 00")]
+    client = app.app.test_client()
+
+    def reaudit(job_id, files=True):
+        data = {"csv_file": (io.BytesIO(REFERENCE), "zoho.csv")} if files else {}
+        return client.post(f"/reaudit/{job_id}", data=data)
+
+    assert reaudit(source).status_code == 404              # no OCR corpus kept
+    store.put_corpus(source, app.pack_corpus(corpus, [("jan/b.jpg", "jan/09_01_26.jpg", 1)]))
+    assert reaudit(source, files=False).status_code == 400
+
+    reply = reaudit(source).get_json()
+    job_id = reply["job_id"]
+    assert reply["queue_position"] == 1
+    inputs = store.claim_next(1, "test:1")[1]
+    assert inputs["reaudit_of"] == source and "zip_path" not in inputs
+
+    app.run_reaudit(job_id, source, inputs["work_dir"], inputs["csv_path"])
+    job = store.get(job_id)
+    assert job["status"] == "done", job["error"]
+    assert (job["summary"]["total"], job["summary"]["duplicates"]) == (2, 1)
+    rows = client.get(f"/results/{job_id}").get_json()["rows"]
+    assert [(r["bill_number"], r["match_status"] == "Matched") for r in rows] == \
+        [("INV-12345", True), ("INV-999", False)]
+    assert not os.path.exists(inputs["work_dir"])
+    assert store.get_corpus(job_id) is not None            # can be re-audited again
+
+
+def registry():
+    m = app.Metrics()
+    m.counter("audit_jobs_total", "Finished audit jobs by outcome")
+    m.histogram("audit_stage_seconds", "Time spent per audit stage", [1, 10])
+    return m
+
+
+def test_metrics_exposition_merges_processes(store, monkeypatch):
+    here, other = registry(), registry()
+    monkeypatch.setattr(app, "metrics", here)
+    here.inc("audit_jobs_total", status="done")
+    here.observe("audit_stage_seconds", 0.5, stage="ocr")
+    other.inc("audit_jobs_total", 2, status="done")
+    other.inc("audit_jobs_total", status="error")
+    other.observe("audit_stage_seconds", 4, stage="ocr")
+    store.put_metrics("other-process", other.snapshot())
+
+    resp = app.app.test_client().get("/metrics")
+    assert resp.mimetype == "text/plain"
+    assert resp.get_data(as_text=True).splitlines() == [
+        "# HELP audit_jobs_total Finished audit jobs by outcome",
+        "# TYPE audit_jobs_total counter",
+        'audit_jobs_total{status="done"} 3',
+        'audit_jobs_total{status="error"} 1',
+        "# HELP audit_stage_seconds Time spent per audit stage",
+        "# TYPE audit_stage_seconds histogram",
+        'audit_stage_seconds_bucket{stage="ocr",le="1"} 1',
+        'audit_stage_seconds_bucket{stage="ocr",le="10"} 2',
+        'audit_stage_seconds_bucket{stage="ocr",le="+Inf"} 2',
+        'audit_stage_seconds_sum{stage="ocr"} 4.5',
+        'audit_stage_seconds_count{stage="ocr"} 2',
+    ]
@@ -0,0 +1,37 @@
+import fitz
+import pytest
+
+import app
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Invoice No INV-42 Sharma Traders total 1500.00")
+    doc.new_page()                                   # scanned: no text layer
+    doc.new_page().insert_text((72, 72), "Page 3")   # too little text
+    path = tmp_path / "bills.pdf"
+    doc.save(path)
+    return str(path)
+
+
+def test_text_page_skips_ocr_and_others_fall_back(pdf, monkeypatch):
+    ocr_calls = []
+    monkeypatch.setattr(app, "ocr_image",
+                        lambda source, info=None: ocr_calls.append(source) or "ocr text")
+    pages = list(app.iter_pdf_pages(pdf))
+    assert [type(p) for p in pages] == [app.TextLayer, app.RasterImage, app.RasterImage]
+    assert pages[0].text == "invoice no inv 42 sharma traders total 1500 00"
+
+    stats = {"hits": 0, "misses": 0}
+    texts = app.ocr_images_parallel(pages, stats=stats, workers=1)
+    assert texts == [pages[0].text, "ocr text", "ocr text"]
+    assert ocr_calls == pages[1:]
+    assert stats["text_layer"] == 1
+
+
+def test_glyph_soup_is_not_a_text_layer():
+    assert app.text_layer_ok("Invoice No INV-42 Sharma Traders total 1500.00")
+    assert not app.text_layer_ok("")
+    # Enough letters once normalised, but mostly undecodable glyphs
+    assert not app.text_layer_ok("Ÿ§1Æ2Ø3Þ4ß5Ā6Ă7Ą8Ć9 " * 6)
@@ -0,0 +1,131 @@
+import hashlib
+import io
+import threading
+
+import pytest
+
+import app
+
+CHUNK = 16
+DATA = bytes(range(256)) * 2 + b"tail"          # 516 bytes: 32 full chunks + 4
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "CHUNKED_UPLOAD_DIR", str(tmp_path / "chunked"))
+
+
+def new_upload():
+    return app.ChunkedUpload.create("bills.zip", len(DATA), chunk_size=CHUNK)
+
+
+def put(upload, index, data=DATA):
+    chunk = data[index * CHUNK:(index + 1) * CHUNK]
+    return upload.write_chunk(index * CHUNK, len(chunk), io.BytesIO(chunk),
+                              hashlib.sha256(chunk).hexdigest())
+
+
+def checksum(data=DATA):
+    digests = "".join(hashlib.sha256(data[i:i + CHUNK]).hexdigest()
+                      for i in range(0, len(data), CHUNK))
+    return hashlib.sha256(digests.encode()).hexdigest()
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_out_of_order_chunks_assemble_the_file():
+    upload = new_upload()
+    for index in reversed(range(upload.chunk_count)):
+        assert put(upload, index)
+    assert read(upload.finalize(checksum())) == DATA
+
+
+def test_duplicate_chunk_is_not_written_again():
+    upload = new_upload()
+    assert put(upload, 3)
+    assert not put(upload, 3, data=b"x" * len(DATA))
+    assert upload.digests()[3] == hashlib.sha256(DATA[48:64]).hexdigest()
+
+
+def test_resume_after_gap():
+    upload = new_upload()
+    for index in range(upload.chunk_count):
+        if index not in (5, 6):
+            put(upload, index)
+    with pytest.raises(ValueError, match="2 chunks missing, first is 5"):
+        upload.finalize()
+
+    resumed = app.ChunkedUpload.open(upload.id)
+    missing = set(range(resumed.chunk_count)) - set(resumed.state()["received"])
+    for index in sorted(missing):
+        put(resumed, index)
+    assert read(resumed.finalize(checksum())) == DATA
+
+
+def test_checksum_mismatch_on_finalize():
+    upload = new_upload()
+    for index in range(upload.chunk_count):
+        put(upload, index)
+    with pytest.raises(ValueError, match="checksum mismatch"):
+        upload.finalize(checksum(DATA[::-1]))
+    assert not app.ChunkedUpload.open(upload.id).meta["finalized"]
+
+
+class SlowStream(io.BytesIO):
+    """Hands out its first byte, then blocks until released."""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.started, self.release = threading.Event(), threading.Event()
+
+    def read(self, n=-1):
+        if self.tell():
+            self.release.wait(5)
+            return super().read(n)
+        self.started.set()
+        return super().read(1)
+
+
+def test_finalize_waits_for_chunk_in_flight(monkeypatch):
+    monkeypatch.setattr(app, "UPLOAD_COPY_BYTES", 4)
+    upload = new_upload()
+    for index in range(1, upload.chunk_count):
+        put(upload, index)
+    stream = SlowStream(DATA[:CHUNK])
+    writer = threading.Thread(target=upload.write_chunk, args=(0, CHUNK, stream))
+    writer.start()
+    assert stream.started.wait(5)
+
+    result = []
+    finisher = threading.Thread(
+        target=lambda: result.append(app.ChunkedUpload.open(upload.id).finalize()))
+    finisher.start()
+    finisher.join(0.2)
+    assert finisher.is_alive()          # blocked behind the writer
+    stream.release.set()
+    writer.join(5)
+    finisher.join(5)
+    assert read(result[0]) == DATA
+
+    with pytest.raises(ValueError, match="already finalized"):
+        put(upload, 0)
+    assert upload.meta["finalized"]
+
+
+def test_chunk_for_taken_upload_is_a_conflict(tmp_path, monkeypatch):
+    upload = new_upload()
+    for index in range(upload.chunk_count):
+        put(upload, index)
+    late = app.ChunkedUpload.open(upload.id)      # opened before finalize
+    upload.finalize()
+    upload.take(str(tmp_path / "bills.zip"))
+
+    client = app.app.test_client()
+    assert client.put(f"/uploads/{upload.id}/chunk?offset=0",
+                      data=DATA[:CHUNK]).status_code == 404
+    monkeypatch.setattr(app.ChunkedUpload, "open", staticmethod(lambda upload_id: late))
+    assert client.put(f"/uploads/{upload.id}/chunk?offset=0",
+                      data=DATA[:CHUNK]).status_code == 409
@@ -0,0 +1,57 @@
+import os
+import zipfile
+
+import fitz
+import pytest
+
+import app
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "MAX_ZIP_ENTRY_MB", 1)
+    pdf = fitz.open()
+    for _ in range(2):
+        pdf.new_page().insert_text((72, 72), "INVOICE 42 " * 20)
+    path = tmp_path / "bills.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("march/a.jpg", b"a")
+        z.writestr("../escape.jpg", b"x")
+        z.writestr("/etc/absolute.jpg", b"x")
+        z.writestr("C:/windows.jpg", b"x")
+        z.writestr("march/huge.jpg", b"\0" * (2 * 2**20))
+        z.writestr("march/notes.txt", b"x")
+        z.writestr("march/b.pdf", pdf.tobytes())
+    stage = tmp_path / "staged"
+    stage.mkdir()
+    return str(path), str(stage)
+
+
+def test_unsafe_and_oversize_entries_are_skipped(archive):
+    zip_path, stage = archive
+    logged = []
+    rels = [rel for _, rel in app.iter_zip_bills(zip_path, stage,
+                                                 lambda msg, kind: logged.append(msg))]
+    assert rels == ["march/a.jpg", "march/b.pdf", "march/b.pdf"]
+    assert logged == ["Skipped unsafe path: ../escape.jpg",
+                      "Skipped unsafe path: /etc/absolute.jpg",
+                      "Skipped unsafe path: C:/windows.jpg",
+                      "Skipped march/huge.jpg: larger than 1 MB"]
+    assert app.zip_bill_count(zip_path) == 2
+
+
+def test_staged_files_are_deleted_after_processing(archive, monkeypatch):
+    zip_path, stage = archive
+    monkeypatch.setattr(app, "ocr_image", lambda path, info=None: "text")
+    sources = []
+
+    def staged():
+        for source, _ in app.iter_zip_bills(zip_path, stage, lambda *a: None):
+            sources.append(source)
+            yield source
+
+    texts = app.ocr_images_parallel(staged(), cleanup=True, workers=2)
+    assert len(texts) == 3
+    assert isinstance(sources[0], str)
+    assert [type(s) for s in sources[1:]] == [app.TextLayer, app.TextLayer]
+    assert os.listdir(stage) == []